@@ -0,0 +1,325 @@
+#Copyright (C) 2023 megiddon
+#This program is licensed under the GNU GPL 3.0 or later.
+#This is contained in full in the file LICENSE.txt
+
+'''Microbenchmarks for the hot paths of the game engine.
+
+Each benchmark is timed across a range of board and fleet sizes and compared against
+the baseline stored in baseline.json. Times are stored as multiples of the time taken by
+a fixed calibration loop run in the same process, so that a baseline recorded on one
+machine can be checked on another. The run fails if any benchmark has become slower
+than the baseline by more than the threshold, or if the monte carlo AI samples fewer
+layouts per second than the monte_carlo_samples_per_second setting in config.json.
+The baseline should be refreshed with --update in any commit that changes a benchmarked path.
+Run from the /src directory with:
+
+python -m benchmarks.bench_engine [--update] [--threshold 1.5] [--sizes 10 50]
+'''
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from components import initialise_board, place_battleships, get_default_ships, AttackedSquares
+from components import get_json_data
+from game_engine import attack, wintest
+from mp_game_engine import choose_square, choose_advanced_square, generate_advanced_attack
+from mp_game_engine import create_density_map, create_shot_pool, SCORE_CACHE
+from targeting import MonteCarloTargeter, load_settings, sample_layouts
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+SIZES = [10, 50, 100, 500]
+#the default fleet, and a fleet with four copies of each ship.
+FLEETS = {'default': 1, 'large': 4}
+#how long each benchmark is repeated for, in seconds.
+MIN_TIME = 0.05
+#how many iterations the calibration loop runs for, and how long it is repeated for in seconds.
+CALIBRATION_ITERATIONS = 10000
+CALIBRATION_TIME = 0.25
+
+def make_fleet(copies:int) -> dict[str,int]:
+
+    '''Builds a fleet with a number of copies of each of the default ships.
+
+    :param copies: the number of copies of each ship.
+    :type copies: int
+    :return: the fleet.
+    :rtype: dict
+
+    '''
+    return {f'{name}_{i}': length for i in range(copies)
+            for name, length in get_default_ships().items()}
+
+def time_call(setup, run, min_time:float=None) -> float:
+
+    '''Times a function, repeating it until MIN_TIME has passed.
+
+    :param setup: called before every repeat, and its result is passed to run.
+    :type setup: function
+    :param run: the function being timed. It returns how many operations it performed.
+    :type run: function
+    :param min_time: how long to repeat the function for, in seconds. Defaults to MIN_TIME.
+    :type min_time: float
+    :return: the fastest time per operation, in seconds.
+    :rtype: float
+
+    '''
+    best = float('inf')
+    repeats = 0
+    finish = time.perf_counter() + (MIN_TIME if min_time is None else min_time)
+    while time.perf_counter() < finish or repeats < 3:
+        state = setup()
+        start = time.perf_counter()
+        operations = run(state)
+        best = min(best, (time.perf_counter() - start) / operations)
+        repeats += 1
+    return best
+
+def calibration_loop(iterations:int=CALIBRATION_ITERATIONS) -> int:
+
+    '''A fixed mix of integer arithmetic, indexing and dictionary lookups,
+    used as the unit that benchmark times are stored in.'''
+
+    values = list(range(64))
+    counts = {}
+    total = 0
+    for i in range(iterations):
+        total += values[i & 63] * 3 ^ i
+        counts[i & 15] = counts.get(i & 15, 0) + 1
+    return total
+
+def calibrate() -> float:
+
+    '''Times the calibration loop.
+
+    :return: the fastest time taken by the calibration loop, in seconds.
+    :rtype: float
+
+    '''
+    return time_call(lambda: None, repeated(lambda _: calibration_loop(), 1), CALIBRATION_TIME)
+
+def relative(results:dict[str,float], calibration:float) -> dict[str,float]:
+
+    '''Converts times in seconds into multiples of the calibration loop's time.
+
+    :param results: the time of each benchmark, in seconds.
+    :type results: dict
+    :param calibration: the time taken by the calibration loop, in seconds.
+    :type calibration: float
+    :return: the time of each benchmark, in calibration loops.
+    :rtype: dict
+
+    '''
+    return {name: seconds / calibration for name, seconds in results.items()}
+
+def repeated(function, number:int):
+
+    '''Wraps a function of the benchmark state so that it is run a number of times.'''
+
+    def run(state):
+        for _ in range(number):
+            function(state)
+        return number
+    return run
+
+def placed_board(size:int, ships:dict[str,int]):
+    return place_battleships(initialise_board(size, bitboard=True), dict(ships), 'random')
+
+def checked_squares(size:int, fraction:float) -> AttackedSquares:
+
+    '''Returns a random set of attacked squares covering a fraction of the board.'''
+
+    squares = [(i, j) for i in range(size) for j in range(size)]
+    return AttackedSquares(size, random.sample(squares, int(fraction * size * size)))
+
+def benchmarks(size:int, ships:dict[str,int]) -> dict[str,float]:
+
+    '''Times every hot path for one board size and fleet.
+
+    :param size: the size of the board.
+    :type size: int
+    :param ships: the fleet.
+    :type ships: dict
+    :return: the time per operation of each benchmark, in seconds.
+    :rtype: dict
+
+    '''
+    results = {}
+    results['initialise_board'] = time_call(lambda: None,
+                                            repeated(lambda _: initialise_board(size), 10))
+    results['initialise_board[bitboard]'] = time_call(
+        lambda: None, repeated(lambda _: initialise_board(size, True), 100))
+
+    for algorithm in ['simple', 'random', 'packed']:
+        #the simple algorithm needs one row per ship.
+        if algorithm == 'simple' and len(ships) > size:
+            continue
+        results[f'place_battleships[{algorithm}]'] = time_call(
+            lambda: initialise_board(size),
+            repeated(lambda board, algorithm=algorithm: place_battleships(board, dict(ships),
+                                                                          algorithm), 1))
+
+    squares = [(i, j) for i in range(size) for j in range(size)]
+    sample = random.sample(squares, min(len(squares), 1000))
+    def attack_all(state):
+        board, fleet = state
+        for square in sample:
+            attack(square, board, fleet)
+        return len(sample)
+    results['attack'] = time_call(lambda: (placed_board(size, ships), dict(ships)), attack_all)
+
+    results['wintest'] = time_call(lambda: dict(ships), repeated(wintest, 1000))
+    results['wintest[bitboard]'] = time_call(lambda: placed_board(size, ships),
+                                             repeated(wintest, 1000))
+
+    ai_checked = checked_squares(size, 0.25)
+    results['choose_square'] = time_call(
+        lambda: ai_checked, repeated(lambda checked: choose_square(checked, 2, size), 100))
+    def uncached():
+        #every repeat scores the same board, so the cache is emptied to time the scoring itself.
+        SCORE_CACHE.clear()
+        return ai_checked
+    results['choose_advanced_square'] = time_call(
+        uncached, repeated(lambda checked: choose_advanced_square(checked, ships, 2, size), 1))
+    results['choose_advanced_square[cached]'] = time_call(
+        lambda: ai_checked,
+        repeated(lambda checked: choose_advanced_square(checked, ships, 2, size), 10))
+
+    moves = min(50, size * size // 4)
+    def play_moves(state):
+        checked, density_map, shot_pool = state
+        for _ in range(moves):
+            generate_advanced_attack(checked, 'extreme', [], ships, size, density_map, shot_pool)
+        return moves
+    results['generate_advanced_attack'] = time_call(
+        lambda: (checked_squares(size, 0.25), create_density_map('extreme', ships, size),
+                 create_shot_pool('extreme', size)),
+        play_moves)
+    return results
+
+def sampling_rate(samples:int=20000) -> float:
+
+    '''Measures how fast the monte carlo AI samples layouts on an empty 10x10 board
+    with the default fleet.
+
+    :param samples: the number of layouts to sample.
+    :type samples: int
+    :return: the layouts sampled per second.
+    :rtype: float
+
+    '''
+    ships = get_default_ships()
+    placements = MonteCarloTargeter(10, ships).placements(ships)
+    start = time.perf_counter()
+    _, sampled = sample_layouts(placements, samples, float('inf'), 1400)
+    return sampled / (time.perf_counter() - start)
+
+def run_all(sizes:list[int]) -> dict[str,float]:
+
+    '''Runs every benchmark for every board size and fleet.
+
+    :param sizes: the board sizes to run.
+    :type sizes: list
+    :return: the time per operation of each benchmark, in seconds, keyed by name.
+    :rtype: dict
+
+    '''
+    random.seed(1400)
+    results = {}
+    for size in sizes:
+        for fleet, copies in FLEETS.items():
+            ships = make_fleet(copies)
+            if sum(ships.values()) > size * size // 2:
+                continue
+            for name, seconds in benchmarks(size, ships).items():
+                results[f'{name}/size={size}/fleet={fleet}'] = seconds
+    return results
+
+def compare(results:dict[str,float], baseline:dict[str,float],
+            threshold:float) -> list[tuple[str,float]]:
+
+    '''Finds the benchmarks that are slower than the baseline by more than the threshold.
+
+    :param results: the times from this run, in calibration loops.
+    :type results: dict
+    :param baseline: the stored times, in calibration loops.
+    :type baseline: dict
+    :param threshold: the largest allowed ratio of new time to baseline time.
+    :type threshold: float
+    :return: the name and ratio of each regressed benchmark.
+    :rtype: list
+
+    '''
+    regressions = []
+    for name, seconds in results.items():
+        if baseline.get(name):
+            ratio = seconds / baseline[name]
+            if ratio > threshold:
+                regressions.append((name, ratio))
+    return regressions
+
+def load_baseline(filename:str=BASELINE_FILE) -> dict:
+    try:
+        with open(filename) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+def save_baseline(baseline:dict, filename:str=BASELINE_FILE) -> None:
+    with open(filename, 'w') as file:
+        json.dump(baseline, file, indent=2, sort_keys=True)
+        file.write('\n')
+
+def main(arguments:list[str]=None) -> int:
+
+    '''Runs the benchmarks from the command line.
+
+    :return: the exit code, which is 1 if any benchmark regressed.
+    :rtype: int
+
+    '''
+    parser = argparse.ArgumentParser(description='Benchmarks the game engine hot paths.')
+    parser.add_argument('--update', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='the allowed slowdown relative to the baseline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    args = parser.parse_args(arguments)
+
+    baseline = load_baseline()
+    calibration = calibrate()
+    seconds = run_all(args.sizes)
+    #the calibration is timed again, as the speed of the machine can drift while the benchmarks run.
+    calibration = (calibration + calibrate()) / 2
+    results = relative(seconds, calibration)
+    stored = baseline.get('engine', {})
+
+    print(f'{"calibration loop":<70} {calibration * 1e6:>12.2f} us')
+    for name, loops in results.items():
+        ratio = f'{loops / stored[name]:.2f}x' if stored.get(name) else 'new'
+        print(f'{name:<70} {seconds[name] * 1e6:>12.2f} us {ratio:>8}')
+
+    if args.update:
+        stored.update(results)
+        baseline['engine'] = stored
+        save_baseline(baseline)
+        print(f'baseline written to {BASELINE_FILE}')
+        return 0
+
+    target = load_settings(get_json_data('config.json') or {})['samples_per_second']
+    rate = sampling_rate()
+    print(f'{"monte carlo samples per second":<70} {rate:>12.0f}    target {target}')
+
+    regressions = compare(results, stored, args.threshold)
+    for name, ratio in regressions:
+        print(f'REGRESSION {name}: {ratio:.2f}x slower than the baseline')
+    if rate < target:
+        print(f'REGRESSION monte carlo sampling: {rate:.0f} samples per second, '
+              f'below the target of {target}')
+    return 1 if regressions or rate < target else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#Copyright (C) 2023 megiddon
+#This program is licensed under the GNU GPL 3.0 or later.
+#This is contained in full in the file LICENSE.txt
+
+'''Startup benchmarks for the command line entry points.
+
+Each module is imported in a fresh interpreter with python -X importtime, and the time
+taken to import it is compared against the baseline stored in baseline.json.
+Like the engine benchmarks, times are stored as multiples of the calibration loop.
+The run also fails if a module pulls in a dependency that it should only import when used.
+Run from the /src directory with:
+
+python -m benchmarks.bench_startup [--update] [--threshold 1.5] [--repeats 5]
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+
+from benchmarks.bench_engine import compare, load_baseline, save_baseline, BASELINE_FILE
+from benchmarks.bench_engine import calibrate, relative
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+#the modules that are started directly or imported by short-lived processes.
+MODULES = ['components', 'game_engine', 'mp_game_engine', 'simulation']
+#slow imports that should be left until they are needed.
+UNWANTED = ['numpy', 'flask', 'jinja2', 'json', 'concurrent.futures', 'logging.handlers']
+
+def import_times(module:str) -> dict[str,int]:
+
+    '''Imports a module in a fresh interpreter.
+
+    :param module: the name of the module.
+    :type module: str
+    :return: the cumulative import time of every module that was imported, in microseconds.
+    :rtype: dict
+
+    '''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=SRC_DIR, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        #lines look like "import time:   self |   cumulative | name".
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+def startup(modules:list[str], repeats:int) -> tuple[dict[str,float],dict[str,list[str]]]:
+
+    '''Measures the import time of each module.
+
+    :param modules: the modules to import.
+    :type modules: list
+    :param repeats: how many times each module is imported. The fastest time is kept.
+    :type repeats: int
+    :return: the import time of each module in seconds,
+        and the unwanted dependencies each module imported.
+    :rtype: tuple
+
+    '''
+    results = {}
+    unwanted = {}
+    for module in modules:
+        best = float('inf')
+        for _ in range(repeats):
+            times = import_times(module)
+            best = min(best, times[module] / 1e6)
+        results[f'import/{module}'] = best
+        unwanted[module] = [name for name in UNWANTED if name in times]
+    return results, unwanted
+
+def main(arguments:list[str]=None) -> int:
+
+    '''Runs the startup benchmarks from the command line.
+
+    :return: the exit code, which is 1 if any module regressed or imported an unwanted dependency.
+    :rtype: int
+
+    '''
+    parser = argparse.ArgumentParser(description='Benchmarks the import time of the game.')
+    parser.add_argument('--update', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='the allowed slowdown relative to the baseline')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    args = parser.parse_args(arguments)
+
+    baseline = load_baseline()
+    calibration = calibrate()
+    seconds, unwanted = startup(args.modules, args.repeats)
+    calibration = (calibration + calibrate()) / 2
+    results = relative(seconds, calibration)
+    stored = baseline.get('startup', {})
+
+    for name, loops in results.items():
+        ratio = f'{loops / stored[name]:.2f}x' if stored.get(name) else 'new'
+        print(f'{name:<40} {seconds[name] * 1e3:>10.2f} ms {ratio:>8}')
+
+    failed = False
+    for module, names in unwanted.items():
+        if names:
+            print(f'UNWANTED IMPORT {module} imports {", ".join(names)}')
+            failed = True
+
+    if args.update:
+        stored.update(results)
+        baseline['startup'] = stored
+        save_baseline(baseline)
+        print(f'baseline written to {BASELINE_FILE}')
+        return 1 if failed else 0
+
+    for name, ratio in compare(results, stored, args.threshold):
+        print(f'REGRESSION {name}: {ratio:.2f}x slower than the baseline')
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,22 +7,22 @@
     '''
 
 
+import os
 import sys
-from random import shuffle, randint
-import json
+import threading
+from array import array
+from copy import deepcopy
+import random
 import logging
 import re
-from copy import deepcopy
-
+import time
 
+#How long the 'packed' placement algorithm searches for before giving up, in seconds.
+PACKING_TIME_BUDGET = 5.0
 
-#we set up a logger here.
-#this will be imported into all modules that have this as a dependency
-logging.basicConfig(encoding='utf-8',
-                    level=logging.INFO,
-                    handlers=[logging.FileHandler('gamelog.log'),logging.StreamHandler()],
-                    format='%(asctime)s %(levelname)-1s %(message)s',
-                    datefmt='%Y-%m-%d %H:%M:%S')
+#Parsed files, keyed by loader and path, with the stat of the file when it was read.
+_file_cache:dict[tuple[str,str],tuple[tuple[int,int,int],object]] = {}
+_file_cache_lock = threading.Lock()
 
 def get_default_ships() -> dict[str,int]:
 
@@ -61,7 +61,7 @@ def print_board(board:list[list[str]]) -> None:
 
     '''Prints out the board to the console. Not used in the web-based game.
 
-    :param board: a list of lists representing a board.
+    :param board: a list of lists or a BitBoard representing a board.
     :type board: list
 
     :return None
@@ -80,6 +80,49 @@ def print_board(board:list[list[str]]) -> None:
         outputstring += '\n'
     print(outputstring)
 
+def load_cached(filename:str, parser) -> object:
+
+    '''Parses a file, reusing the result of an earlier parse if the file has not changed.
+    A file is read again when its modification time, size or inode changes,
+    so edits to config files are still picked up while the game is running.
+
+    :param filename: The name of the file to be accessed.
+    :type filename: str
+    :param parser: The function that reads and parses the open file.
+    :type parser: function
+
+    :raises FileNotFoundError: if the file does not exist.
+
+    :return: A copy of the parsed data, which the caller is free to change.
+    :rtype: object
+
+    '''
+    stat = os.stat(filename)
+    #a replaced file usually has a new inode even if its time and size match the old one.
+    version = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    key = (parser.__name__, os.path.abspath(filename))
+    with _file_cache_lock:
+        cached = _file_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return deepcopy(cached[1])
+
+    with open(filename, 'r') as file:
+        data = parser(file)
+    with _file_cache_lock:
+        _file_cache[key] = (version, data)
+    return deepcopy(data)
+
+def clear_file_cache() -> None:
+
+    '''Forgets every parsed file, so they are all read again on next use.'''
+
+    with _file_cache_lock:
+        _file_cache.clear()
+
+def _parse_json(file) -> dict:
+    import json
+    return json.load(file)
+
 def get_json_data(filename:str) -> dict:
 
     '''Reads a JSON file and returns the data for later use.
@@ -91,36 +134,329 @@ def get_json_data(filename:str) -> dict:
     :type data: dict
 
     '''
-    #Opens file and parses JSON data with the stdlib JSON module.
+    #Parses JSON data with the stdlib JSON module, unless the file is unchanged since last time.
     try:
-        file = open(filename)
-        data = file.read()
-        data = json.loads(data)
-        return data
+        return load_cached(filename, _parse_json)
 
     #Error handling if the file does not exist or contains bad JSON data.
     except FileNotFoundError:
         logging.error('%s does not exist!', filename)
-    except json.decoder.JSONDecodeError:
+    #JSONDecodeError is a ValueError, so json does not need importing here.
+    except ValueError:
         logging.error('%s contains invalid JSON data!', filename)
 
 
-def initialise_board(size:int=10) -> list[list[str]]:
+class BitBoard:
+
+    '''A board stored as integer bitmasks rather than a list of lists.
+
+    Each ship is held as a bitmask of the squares it covers, alongside a combined
+    occupancy mask. Square (row, col) maps to bit row * size + col.
+    The ship on each square and the squares that have been shot at are also kept in
+    flat arrays indexed the same way, with a count of each ship's unhit squares,
+    so that a shot only touches its own square however large the board is.
+    Indexing with board[row][col] behaves like the list-of-lists board,
+    so existing functions can be given either type.
+
+    :param size: The size of the board.
+    :type size: int (should be > 0)
+
+    '''
+
+    __slots__ = ('size', 'ships', 'occupied', 'squares', 'shots', 'afloat')
+
+    def __init__(self, size:int=10) -> None:
+        self.size:int = size
+        self.ships:dict[str,int] = {}
+        self.occupied:int = 0
+        self.squares:list[str] = [None] * (size * size)
+        self.shots:bytearray = bytearray(size * size)
+        self.afloat:dict[str,int] = {}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, row:int) -> '_BitBoardRow':
+        return _BitBoardRow(self, _normalise_index(row, self.size))
+
+    def __iter__(self):
+        for row in range(self.size):
+            yield _BitBoardRow(self, row)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (BitBoard, list)):
+            return self.to_list() == list(map(list, other))
+        return NotImplemented
+
+    def bit(self, square:tuple[int,int]) -> int:
+
+        '''Returns the bitmask of a single square.
+
+        :param square: the square as (row, col).
+        :type square: tuple
+        :return: the bitmask with only that square set.
+        :rtype: int
+
+        '''
+        return 1 << (square[0] * self.size + square[1])
+
+    def get(self, square:tuple[int,int]) -> str:
+
+        '''Returns the name of the ship on an unshot square, or None.
+
+        :param square: the square as (row, col).
+        :type square: tuple
+        :return: the name of the ship, or None if the square is empty or has been hit.
+        :rtype: str
+
+        '''
+        index = square[0] * self.size + square[1]
+        if self.shots[index]:
+            return None
+        return self.squares[index]
+
+    def set(self, square:tuple[int,int], name:str) -> None:
+
+        '''Writes a ship to a square, or clears it when name is None.
+
+        Clearing a square marks it as shot, mirroring the way attack
+        removes a hit ship from a list-of-lists board.
+
+        :param square: the square as (row, col).
+        :type square: tuple
+        :param name: the name of the ship, or None.
+        :type name: str
+
+        '''
+        if name is None:
+            self.fire(square)
+            return
+        index = square[0] * self.size + square[1]
+        bit = 1 << index
+        old = self.squares[index]
+        if old is not None:
+            self.ships[old] &= ~bit
+            if not self.shots[index]:
+                self.afloat[old] -= 1
+        self.squares[index] = name
+        self.ships[name] = self.ships.get(name, 0) | bit
+        self.occupied |= bit
+        self.shots[index] = 0
+        self.afloat[name] = self.afloat.get(name, 0) + 1
+
+    def fire(self, square:tuple[int,int]) -> str:
+
+        '''Records a shot on a square.
+
+        :param square: the square as (row, col).
+        :type square: tuple
+        :return: the name of the ship hit, or None on a miss or repeated shot.
+        :rtype: str
+
+        '''
+        index = square[0] * self.size + square[1]
+        if self.shots[index]:
+            return None
+        self.shots[index] = 1
+        name = self.squares[index]
+        if name is not None:
+            self.afloat[name] -= 1
+        return name
+
+    def is_sunk(self, name:str) -> bool:
+
+        '''Checks if every square of a ship has been hit.
+
+        :param name: the name of the ship.
+        :type name: str
+        :rtype: bool
+
+        '''
+        return not self.afloat.get(name, 0)
+
+    def all_sunk(self) -> bool:
+
+        '''Checks if every ship on the board has been sunk.
+
+        :rtype: bool
+
+        '''
+        return not any(self.afloat.values())
+
+    def copy(self) -> 'BitBoard':
+
+        '''Returns an independent copy of the board.
+
+        :rtype: BitBoard
+
+        '''
+        board = BitBoard(self.size)
+        board.ships = dict(self.ships)
+        board.occupied = self.occupied
+        board.squares = list(self.squares)
+        board.shots = bytearray(self.shots)
+        board.afloat = dict(self.afloat)
+        return board
+
+    def to_list(self) -> list[list[str]]:
+
+        '''Converts the board into the list-of-lists format.
+
+        :return: the board as a list of n lists of size n.
+        :rtype: list
+
+        '''
+        return [list(row) for row in self]
+
+class _BitBoardRow:
+
+    '''A view of a single row of a BitBoard, allowing board[row][col] access.'''
+
+    __slots__ = ('board', 'row')
+
+    def __init__(self, board:BitBoard, row:int) -> None:
+        self.board = board
+        self.row = row
+
+    def __len__(self) -> int:
+        return self.board.size
+
+    def __getitem__(self, col:int) -> str:
+        return self.board.get((self.row, _normalise_index(col, self.board.size)))
+
+    def __setitem__(self, col:int, name:str) -> None:
+        self.board.set((self.row, _normalise_index(col, self.board.size)), name)
+
+    def __iter__(self):
+        for col in range(self.board.size):
+            yield self.board.get((self.row, col))
+
+def _normalise_index(index:int, size:int) -> int:
+
+    '''Resolves an index the same way a list of the given size would.'''
+
+    if index < 0:
+        index += size
+    if not 0 <= index < size:
+        raise IndexError('board index out of range')
+    return index
+
+class AttackedSquares:
+
+    '''The squares that have been attacked, in the order they were attacked.
+
+    Behaves like a list of squares, but membership is tested against a bitset
+    indexed by row * size + col, so checking a square takes O(1) time.
+    Only the order of the squares is pickled; the bitset is rebuilt on load.
+
+    :param size: The size of the board.
+    :type size: int (should be > 0)
+    :param squares: Squares that have already been attacked.
+    :type squares: list
+
+    '''
+
+    __slots__ = ('size', 'order', 'bits')
+
+    def __init__(self, size:int=10, squares:list[tuple[int,int]]=()) -> None:
+        self.size:int = size
+        self.order = array('I')
+        self.bits = bytearray((size * size + 7) // 8)
+        for square in squares:
+            self.append(square)
+
+    def cell(self, square:tuple[int,int]) -> int:
+
+        '''Returns the linear id of a square.
+
+        :param square: the square as (row, col).
+        :type square: tuple
+        :return: row * size + col
+        :rtype: int
+
+        '''
+        return square[0] * self.size + square[1]
+
+    def append(self, square:tuple[int,int]) -> None:
+
+        '''Records a square as attacked.
+
+        :param square: the square as (row, col).
+        :type square: tuple
+
+        '''
+        cell = self.cell(square)
+        self.order.append(cell)
+        self.bits[cell >> 3] |= 1 << (cell & 7)
+
+    def __contains__(self, square:tuple[int,int]) -> bool:
+        if not validate_square(square, self.size):
+            return False
+        cell = self.cell(square)
+        return bool(self.bits[cell >> 3] >> (cell & 7) & 1)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __iter__(self):
+        for cell in self.order:
+            yield divmod(cell, self.size)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [divmod(cell, self.size) for cell in self.order[index]]
+        return divmod(self.order[index], self.size)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (AttackedSquares, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __getstate__(self) -> tuple[int,bytes]:
+        return (self.size, self.order.tobytes())
+
+    def __setstate__(self, state:tuple[int,bytes]) -> None:
+        size, order = state
+        self.__init__(size)
+        cells = array('I')
+        cells.frombytes(order)
+        for cell in cells:
+            self.append(divmod(cell, size))
+
+def initialise_board(size:int=10, bitboard:bool=False) -> list[list[str]]:
 
     '''Generates the board given a board size.
 
     :param size: The size of the board.
     :type size: int (should be > 0)
+    :param bitboard: Whether to return a BitBoard instead of a list of lists.
+    :type bitboard: bool
 
-    :return: The board as a list of n lists of size n.
+    :return: The board as a list of n lists of size n, or a BitBoard.
     :rtype: list
 
     '''
+    if bitboard:
+        return BitBoard(size)
     board = []
     for i in range(size):
         board.append([None] * size)
     return board
 
+def _parse_battleships(file) -> dict[str,int]:
+    ships = {}
+    for line in file:
+        #Checks validity of data in each line
+        if not re.match(r'[\w]+:[0-9]+', line):
+            logging.error('%s contains bad data! default values for ships will be used.',
+                          file.name)
+            ships = get_default_ships()
+        #Parses data in file
+        else:
+            splitline = line.rstrip().split(':')
+            ships[splitline[0]] = int(splitline[1])
+    return ships
+
 def create_battleships(filename:str='battleships.txt') -> dict[str,int]:
 
     '''Reads a file and copies the data into an array.
@@ -132,28 +468,15 @@ def create_battleships(filename:str='battleships.txt') -> dict[str,int]:
     :rtype: dict
 
     '''
-    ships = {}
-    #Opens file
+    #Opens file, unless it is unchanged since it was last read.
     try:
-        with open(filename, 'r') as file:
-            for line in file:
-                #Checks validity of data in each line
-                if not re.match(r'[\w]+:[0-9]+', line):
-                    logging.error('%s contains bad data! default values for ships will be used.',
-                                  filename)
-                    ships = get_default_ships()
-                #Parses data in file
-                else:
-                    splitline = line.rstrip().split(':')
-                    ships[splitline[0]] = int(splitline[1])
-
-        return ships
+        return load_cached(filename, _parse_battleships)
 
     except FileNotFoundError:
         logging.error('%s not present in root! Default values for ships will be used',
                       filename)
 
-        return get_default_ships
+        return get_default_ships()
 
 def check_square(board:list[list[int]], square:tuple[int,int], size:[int]) -> bool:
     '''Checks if a square is within the board.
@@ -168,19 +491,357 @@ def check_square(board:list[list[int]], square:tuple[int,int], size:[int]) -> bo
 
 
 
+def _bit_count(mask:int) -> int:
+    return bin(mask).count('1')
+
+def _legal_starts(occupied:int, length:int, size:int) -> int:
+
+    '''Finds every square a ship can start on in a single row or column.
+
+    :param occupied: bitmask of the occupied squares in the row or column.
+    :type occupied: int
+    :param length: the length of the ship.
+    :type length: int
+    :param size: the size of the board.
+    :type size: int
+
+    :return: bitmask with bit i set if the ship fits in squares i to i + length - 1.
+    :rtype: int
+
+    '''
+    blocked = occupied
+    for k in range(1, length):
+        blocked |= occupied >> k
+    return ~blocked & ((1 << (size - length + 1)) - 1)
+
+def _occupancy(board:list[list[str]]) -> tuple[list[int],list[int]]:
+
+    '''Returns bitmasks of the occupied squares in each row and each column of a board.'''
+
+    size = len(board)
+    rows = [0] * size
+    cols = [0] * size
+    #a BitBoard only needs its occupied squares visited.
+    if isinstance(board, BitBoard):
+        occupied = board.occupied
+        while occupied:
+            index = (occupied & -occupied).bit_length() - 1
+            occupied &= occupied - 1
+            if board.shots[index]:
+                continue
+            i, j = divmod(index, size)
+            rows[i] |= 1 << j
+            cols[j] |= 1 << i
+        return rows, cols
+    for i in range(size):
+        for j in range(size):
+            if board[i][j]:
+                rows[i] |= 1 << j
+                cols[j] |= 1 << i
+    return rows, cols
+
+def _sample_placement(rows:list[int], cols:list[int], length:int,
+                      size:int, rng:random.Random=None) -> tuple[int,int,bool]:
+
+    '''Picks one legal placement of a ship uniformly at random.
+
+    :param rows: bitmasks of the occupied squares in each row.
+    :type rows: list
+    :param cols: bitmasks of the occupied squares in each column.
+    :type cols: list
+    :param length: the length of the ship.
+    :type length: int
+    :param size: the size of the board.
+    :type size: int
+    :param rng: the random number generator of the game. Defaults to the random module.
+    :type rng: random.Random
+
+    :return: the start row, start column and whether the ship is horizontal,
+        or None if the ship cannot be placed.
+    :rtype: tuple
+
+    '''
+    #horizontal placements are counted along each row, vertical ones along each column.
+    lines = [(i, True, _legal_starts(rows[i], length, size)) for i in range(size)]
+    if length > 1:
+        lines += [(j, False, _legal_starts(cols[j], length, size)) for j in range(size)]
+    counts = [_bit_count(starts) for _, _, starts in lines]
+    total = sum(counts)
+    if not total:
+        return None
+
+    index = (rng or random).randint(0, total - 1)
+    for (line, horizontal, starts), count in zip(lines, counts):
+        if index < count:
+            #finds the index-th set bit.
+            for _ in range(index):
+                starts &= starts - 1
+            start = (starts & -starts).bit_length() - 1
+            return (line, start, True) if horizontal else (start, line, False)
+        index -= count
+    return None
+
+def place_randomly(board:list[list[str]], ships:dict[str,int],
+                   attempts:int=100, rng:random.Random=None) -> list[list[str]]:
+
+    '''Places each ship uniformly at random among the positions where it still fits.
+
+    Every legal position of a ship is found from bitmasks of the occupied squares,
+    so each ship is placed in one step. Placing a ship can leave no room for a later one,
+    in which case the fleet is placed again from the start.
+
+    :param board: the board as a list of lists or a BitBoard.
+    :type board: list
+    :param ships: the ships to be placed.
+    :type ships: dict
+    :param attempts: how many times to try placing the whole fleet.
+    :type attempts: int
+    :param rng: the random number generator of the game. Defaults to the random module.
+    :type rng: random.Random
+
+    :raises ValueError: if the fleet could not be placed.
+
+    :return: the updated board with ships placed.
+    :rtype: list
+
+    '''
+    size = len(board)
+    start_rows, start_cols = _occupancy(board)
+    for _ in range(attempts):
+        rows, cols = list(start_rows), list(start_cols)
+        placements = []
+        for name, length in ships.items():
+            placement = _sample_placement(rows, cols, length, size, rng)
+            if not placement:
+                break
+            row, col, horizontal = placement
+            for k in range(length):
+                square = (row, col + k) if horizontal else (row + k, col)
+                rows[square[0]] |= 1 << square[1]
+                cols[square[1]] |= 1 << square[0]
+                placements.append((square, name))
+        else:
+            for (row, col), name in placements:
+                board[row][col] = name
+            return board
+
+    logging.error('Could not fit ships %s on a %sx%s board after %s attempts',
+                  ships, size, size, attempts)
+    raise ValueError(f'ships do not fit on a {size}x{size} board')
+
+def line_placements(rows:list[int], cols:list[int], length:int,
+                    size:int) -> list[tuple[int,int,bool]]:
+
+    '''Lists every legal placement of a ship, rows first and then columns.
+
+    :param rows: bitmask of the occupied squares in each row, with bit j for column j.
+    :type rows: list
+    :param cols: bitmask of the occupied squares in each column, with bit i for row i.
+    :type cols: list
+    :param length: the length of the ship.
+    :type length: int
+    :param size: the size of the board.
+    :type size: int
+
+    :return: the first square and direction of each placement, as (row, col, horizontal).
+    :rtype: list
+
+    '''
+
+    placements = []
+    for i in range(size):
+        starts = _legal_starts(rows[i], length, size)
+        while starts:
+            start = (starts & -starts).bit_length() - 1
+            placements.append((i, start, True))
+            starts &= starts - 1
+    if length > 1:
+        for j in range(size):
+            starts = _legal_starts(cols[j], length, size)
+            while starts:
+                start = (starts & -starts).bit_length() - 1
+                placements.append((start, j, False))
+                starts &= starts - 1
+    return placements
+
+def _uncoverable(rows:list[int], cols:list[int], length:int, size:int) -> int:
+
+    '''Counts the free squares that no ship of the given length can cover.'''
+
+    def coverage(lines):
+        covered = []
+        for line in lines:
+            starts = _legal_starts(line, length, size)
+            mask = 0
+            for k in range(length):
+                mask |= starts << k
+            covered.append(mask)
+        return covered
+
+    row_cover = coverage(rows)
+    col_cover = coverage(cols) if length > 1 else [0] * size
+    full = (1 << size) - 1
+    count = 0
+    for i in range(size):
+        uncovered = ~rows[i] & full & ~row_cover[i]
+        while uncovered:
+            j = (uncovered & -uncovered).bit_length() - 1
+            if not col_cover[j] >> i & 1:
+                count += 1
+            uncovered &= uncovered - 1
+    return count
+
+def place_packed(board:list[list[str]], ships:dict[str,int],
+                 time_budget:float=None, rng:random.Random=None) -> list[list[str]]:
+
+    '''Places ships by backtracking search, for boards that are close to full.
+
+    At each step the search branches on whatever is most constrained: the ship with
+    the fewest legal placements, or the first free square, which must either be covered
+    by a ship starting on it or left empty. A branch is abandoned as soon as a remaining
+    ship has nowhere to go, or more free squares are impossible to cover than can be
+    left empty. Positions already shown to be dead ends are remembered, so ships of the
+    same length are not tried in every order. The search is exhaustive, so a layout is
+    always found if one exists and the time budget allows.
+
+    :param board: the board as a list of lists or a BitBoard.
+    :type board: list
+    :param ships: the ships to be placed.
+    :type ships: dict
+    :param time_budget: how long to search for, in seconds. Defaults to PACKING_TIME_BUDGET.
+    :type time_budget: float
+    :param rng: the random number generator of the game. Defaults to the random module.
+    :type rng: random.Random
+
+    :raises ValueError: if no layout exists or none was found within the time budget.
+
+    :return: the updated board with ships placed.
+    :rtype: list
+
+    '''
+    size = len(board)
+    full = (1 << size) - 1
+    deadline = time.perf_counter() + (PACKING_TIME_BUDGET if time_budget is None else time_budget)
+    rows, cols = _occupancy(board)
+    free = size * size - sum(_bit_count(row) for row in rows)
+    placed:dict[str,tuple[int,int,bool]] = {}
+    dead_ends = set()
+
+    def toggle(placement, length):
+        row, col, horizontal = placement
+        for k in range(length):
+            square = (row, col + k) if horizontal else (row + k, col)
+            rows[square[0]] ^= 1 << square[1]
+            cols[square[1]] ^= 1 << square[0]
+
+    def search(remaining, free):
+        if not remaining:
+            return True
+        if time.perf_counter() > deadline:
+            raise TimeoutError
+        slack = free - sum(ships[name] for name in remaining)
+        if slack < 0:
+            return False
+        state = (tuple(rows), tuple(sorted(ships[name] for name in remaining)))
+        if state in dead_ends:
+            return False
+        if _uncoverable(rows, cols, min(ships[name] for name in remaining), size) > slack:
+            dead_ends.add(state)
+            return False
+
+        #one ship of each length is enough, since ships of the same length are interchangeable.
+        by_length = {}
+        for name in remaining:
+            by_length.setdefault(ships[name], name)
+
+        #finds the most constrained ship, checking that every ship still fits.
+        best_ship = None
+        for length, name in by_length.items():
+            count = sum(_bit_count(_legal_starts(row, length, size)) for row in rows)
+            if length > 1:
+                count += sum(_bit_count(_legal_starts(col, length, size)) for col in cols)
+            if not count:
+                dead_ends.add(state)
+                return False
+            if best_ship is None or count < best_ship[0]:
+                best_ship = (count, name)
+
+        #the options for the first free square: a ship starting on it, or leaving it empty.
+        i = next(k for k in range(size) if rows[k] != full)
+        j = (~rows[i] & full & -(~rows[i] & full)).bit_length() - 1
+        square_options = []
+        for length, name in by_length.items():
+            if _legal_starts(rows[i], length, size) >> j & 1:
+                square_options.append((name, (i, j, True)))
+            if length > 1 and _legal_starts(cols[j], length, size) >> i & 1:
+                square_options.append((name, (i, j, False)))
+        if slack:
+            square_options.append((None, (i, j, True)))
+
+        if len(square_options) <= best_ship[0]:
+            options = square_options
+        else:
+            name = best_ship[1]
+            options = [(name, placement)
+                       for placement in line_placements(rows, cols, ships[name], size)]
+        (rng or random).shuffle(options)
+
+        for name, placement in options:
+            #an empty square is blocked off like a ship of length 1.
+            length = ships[name] if name else 1
+            toggle(placement, length)
+            if name:
+                placed[name] = placement
+                found = search([other for other in remaining if other != name], free - length)
+            else:
+                found = search(remaining, free - 1)
+            if found:
+                return True
+            toggle(placement, length)
+            if name:
+                del placed[name]
+        dead_ends.add(state)
+        return False
+
+    try:
+        found = search(list(ships), free)
+    except TimeoutError:
+        logging.error('Could not place ships %s on a %sx%s board within the time budget',
+                      ships, size, size)
+        raise ValueError(f'ships could not be placed on a {size}x{size} board in time') from None
+
+    if not found:
+        logging.error('Ships %s cannot fit on a %sx%s board', ships, size, size)
+        raise ValueError(f'ships do not fit on a {size}x{size} board')
+
+    for name, (row, col, horizontal) in placed.items():
+        for k in range(ships[name]):
+            if horizontal:
+                board[row][col + k] = name
+            else:
+                board[row + k][col] = name
+    return board
+
 def place_battleships(board:list[list[str]], ships:dict[str,int],
-                      algorithm='simple') -> list[list[str]]:
+                      algorithm='simple', rng:random.Random=None) -> list[list[str]]:
 
     '''Populates a board with battleships
 
-    :param board: the board as a list of lists.
+    :param board: the board as a list of lists or a BitBoard.
     :type board: list
 
     :param ships: the ships to be placed.
     :type ships: dict
 
     :param algorithm: the method of placement to be used.
-    :type algorithm: str ("simple", "random", "custom" currently implemented.)
+    :type algorithm: str ("simple", "random", "packed", "custom" currently implemented.)
+
+    :param rng: the random number generator of the game, used by the "random" and "packed"
+        algorithms and when invalid "custom" data falls back to random placement.
+        Defaults to the random module.
+    :type rng: random.Random
+
+    :raises ValueError: if the "random" or "packed" algorithms cannot fit the ships on the board.
 
     :return: the updated board with ships placed.
     :rtype: list
@@ -207,77 +868,71 @@ def place_battleships(board:list[list[str]], ships:dict[str,int],
         return board
 
     if algorithm == 'random':
-        directions = [(0,1), (0,-1), (1,0), (-1,0)]
+        try:
+            return place_randomly(board, ships, rng=rng)
+        except ValueError:
+            logging.info('Falling back to packed placement')
+            return place_packed(board, ships, rng=rng)
 
+    if algorithm == 'packed':
+        return place_packed(board, ships, rng=rng)
 
-        for name, length in ships.items():
-            valid_flag = False
-            while not valid_flag:
-                #generates random square
-                start_square = (randint(0,len(board)), randint(0,len(board)))
-                sequence = [0,1,2,3]
-                shuffle(sequence)
-                for i in sequence:
-                    if valid_flag:
-                        break
-                    #checks if run of squares is valid
-                    new_square = start_square
-                    valid_flag = True
-                    for j in range(0,length):
-                        new_square = (start_square[0] + directions[i][0] * j,
-                                      start_square[1] +directions[i][1] * j)
-                        if not check_square(board, new_square, len(board)):
-                            valid_flag = False
-
-                    #Writes to the board if the placement is valid.
-                    if valid_flag:
-                        for k in range(0,length):
-                            new_square = (start_square[0] + directions[i][0] * k,
-                                            start_square[1] + directions[i][1] * k)
-                            board[new_square[0]][new_square[1]] = name
+    else:
+        #Gets placement data from file.
+        data = get_json_data('placement.json')
+        return place_custom_battleships(board, ships, data, rng)
 
+def place_custom_battleships(board:list[list[str]], ships:dict[str,int],
+                             data:dict[str,list], rng:random.Random=None) -> list[list[str]]:
 
-        return board
+    '''Populates a board with battleships at the positions given in placement data.
+    This is the "custom" algorithm of place_battleships, with the data passed in
+    directly instead of being read from placement.json.
 
+    :param board: the board as a list of lists or a BitBoard.
+    :type board: list
 
+    :param ships: the ships to be placed.
+    :type ships: dict
 
-    else:
-        #Gets placement data from file.
-        data = get_json_data('placement.json')
+    :param data: the start column, start row and direction ("h" or "v") of each ship.
+    :type data: dict
 
-        #Uses preset ships if placement.json has invalid data or can't be read.
-        if not data:
-            place_battleships(board, ships, 'random')
-            return board
+    :param rng: the random number generator used if the ships are placed randomly.
+        Defaults to the random module.
+    :type rng: random.Random
 
-        #Iterates over ships
-        for j,k in data.items():
-            try:
-                board2 = deepcopy(board)
-                #Attempts to resolve mismatches between names in battleships.txt and placement.json
-                name = j if j in ships.keys() else ships.keys()[list(data.keys()).index(j)]
-                #Parses values from 'data' dictionary.
-                direction = (1,0) if k[2] == 'h' else (0,1)
-                start_square = (int(k[0]), int(k[1]))
-                #Writes to 'board'
-                for i in range(0,ships[j]):
-                    new_square = (start_square[0] + direction[0] * i,
-                    start_square[1] + direction[1] * i)
-                    board[new_square[1]][new_square[0]] = j
-
-            #Error handling
-            except IndexError:
-                logging.error('Invalid ship placement - ship goes outside of board')
-                return place_battleships(initialise_board(len(board)),ships,'random')
-            except TypeError:
-                logging.error('Invalid data in placement.json')
-                return place_battleships(initialise_board(len(board)),ships,'random')
-            except ValueError:
-                logging.error('Invalid data in placement.json')
-                return place_battleships(initialise_board(len(board)),ships,'random')
+    :return: the updated board with ships placed.
+        The ships are placed randomly if the data is empty or invalid.
+    :rtype: list
 
+    '''
 
+    #Uses preset ships if the data is invalid or couldn't be read.
+    if not data:
+        place_battleships(board, ships, 'random', rng)
         return board
 
-if __name__ == 'main':
-    logging.basicConfig(filename='gamelog.log', encoding='utf-8', level=logging.DEBUG)
+    #Iterates over ships
+    for j,k in data.items():
+        try:
+            #Parses values from 'data' dictionary.
+            direction = (1,0) if k[2] == 'h' else (0,1)
+            start_square = (int(k[0]), int(k[1]))
+            #Writes to 'board'
+            for i in range(0,ships[j]):
+                new_square = (start_square[0] + direction[0] * i,
+                start_square[1] + direction[1] * i)
+                board[new_square[1]][new_square[0]] = j
+
+        #Error handling
+        except IndexError:
+            logging.error('Invalid ship placement - ship goes outside of board')
+            return place_battleships(initialise_board(len(board), isinstance(board, BitBoard)),
+                                     ships,'random',rng)
+        except (TypeError, ValueError, KeyError):
+            logging.error('Invalid placement data')
+            return place_battleships(initialise_board(len(board), isinstance(board, BitBoard)),
+                                     ships,'random',rng)
+
+    return board
@@ -0,0 +1,210 @@
+#Copyright (C) 2023 megiddon
+#This program is licensed under the GNU GPL 3.0 or later.
+#This is contained in full in the file LICENSE.txt
+
+'''Events emitted by the game engines, and the sinks that receive them.
+
+The engines do not print anything themselves. Instead, attack and advanced_ai_attack
+emit an event for every shot, hit, miss and sunk ship to the sink they are given,
+and the game loops emit an event when the game is over. The command line games
+print them with a PrintSink, while simulations and the web-based game pass no sink
+or a quiet one, so they do no console I/O at all.
+
+A sink is any object with a handle method that takes an Event.
+An EventBus passes each event on to every sink subscribed to it.
+'''
+
+import logging
+import sys
+from collections import deque
+
+SHOT = 'shot'
+HIT = 'hit'
+MISS = 'miss'
+SUNK = 'sunk'
+GAME_OVER = 'game over'
+
+#the player name used for the AI in events.
+AI = 'ai'
+
+class Event:
+
+    '''Something that happened in a game.
+
+    :param kind: the kind of event: SHOT, HIT, MISS, SUNK or GAME_OVER.
+    :type kind: str
+    :param player: the player who took the shot, or who won for GAME_OVER.
+        AI for the AI.
+    :type player: str
+    :param square: the square that was attacked, as (row, column).
+    :type square: tuple
+    :param ship: the ship that was hit or sunk.
+    :type ship: str
+    '''
+
+    __slots__ = ('kind', 'player', 'square', 'ship')
+
+    def __init__(self, kind:str, player:str, square:tuple[int,int]=None, ship:str=None) -> None:
+        self.kind:str = kind
+        self.player:str = player
+        self.square:tuple[int,int] = square
+        self.ship:str = ship
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Event):
+            return NotImplemented
+        return ((self.kind, self.player, self.square, self.ship)
+                == (other.kind, other.player, other.square, other.ship))
+
+    def __repr__(self) -> str:
+        return f'Event({self.kind!r}, {self.player!r}, {self.square!r}, {self.ship!r})'
+
+def emit(sink, kind:str, player:str, square:tuple[int,int]=None, ship:str=None) -> None:
+
+    '''Sends an event to a sink. Nothing is done if there is no sink,
+    so the engines pay nothing for events when no one is listening.
+
+    :param sink: the sink, or None.
+    :type sink: EventBus
+    :param kind: the kind of event.
+    :type kind: str
+    :param player: the player who took the shot, or who won.
+    :type player: str
+    :param square: the square that was attacked.
+    :type square: tuple
+    :param ship: the ship that was hit or sunk.
+    :type ship: str
+    '''
+
+    if sink is not None:
+        sink.handle(Event(kind, player, square, ship))
+
+class NullSink:
+
+    '''Ignores every event, for headless games.'''
+
+    def handle(self, event:Event) -> None:
+        pass
+
+class PrintSink:
+
+    '''Prints events to the console, for the command line games.
+
+    :param stream: the stream to print to. Defaults to whatever sys.stdout is at the time.
+    :type stream: file
+    :param ai_name: the name the AI is given when it wins.
+    :type ai_name: str
+    '''
+
+    def __init__(self, stream=None, ai_name:str='AI Potemkin') -> None:
+        self.stream = stream
+        self.ai_name:str = ai_name
+
+    def handle(self, event:Event) -> None:
+
+        '''Prints an event. Shots are not printed, as their hit or miss is.
+
+        :param event: the event.
+        :type event: Event
+        '''
+
+        row, col = event.square or (None, None)
+        if event.kind == HIT:
+            message = (f'AI hit battleship at ({col},{row})!' if event.player == AI
+                       else f'Hit battleship at ({col},{row})!')
+        elif event.kind == MISS:
+            message = (f'AI missed at ({col},{row})!' if event.player == AI
+                       else f'Miss at ({col},{row})!')
+        elif event.kind == SUNK:
+            message = f'{event.ship} sunk!'
+        elif event.kind == GAME_OVER:
+            message = f'{self.ai_name if event.player == AI else event.player} wins!'
+        else:
+            return
+        print(message, file=self.stream or sys.stdout)
+
+class LogSink:
+
+    '''Writes events to the log.
+
+    :param level: the level events are logged at. Debug by default,
+        so events are only logged when debug messages are turned on.
+    :type level: int
+    :param logger: the logger to write to. Defaults to the root logger.
+    :type logger: logging.Logger
+    '''
+
+    def __init__(self, level:int=logging.DEBUG, logger:logging.Logger=None) -> None:
+        self.level:int = level
+        self.logger:logging.Logger = logger or logging.getLogger()
+
+    def handle(self, event:Event) -> None:
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, 'event %s by %s at %s ship %s',
+                            event.kind, event.player, event.square, event.ship)
+
+class BufferedSink:
+
+    '''Keeps events until they are collected.
+
+    :param maxlen: the most events kept, with the oldest dropped first. None keeps them all.
+    :type maxlen: int
+    '''
+
+    def __init__(self, maxlen:int=None) -> None:
+        self.events:deque[Event] = deque(maxlen=maxlen)
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def handle(self, event:Event) -> None:
+        self.events.append(event)
+
+    def drain(self) -> list[Event]:
+
+        '''Removes and returns every event kept so far.
+
+        :return: the events, oldest first.
+        :rtype: list
+        '''
+
+        events = list(self.events)
+        self.events.clear()
+        return events
+
+class EventBus:
+
+    '''Passes each event on to every subscribed sink.
+
+    :param sinks: the sinks to subscribe to start with.
+    :type sinks: NullSink, PrintSink, LogSink or BufferedSink
+    '''
+
+    def __init__(self, *sinks) -> None:
+        self.sinks:list = list(sinks)
+
+    def subscribe(self, sink) -> None:
+
+        '''Sends every later event to a sink.
+
+        :param sink: the sink.
+        :type sink: NullSink, PrintSink, LogSink or BufferedSink
+        '''
+
+        if sink not in self.sinks:
+            self.sinks.append(sink)
+
+    def unsubscribe(self, sink) -> None:
+
+        '''Stops sending events to a sink.
+
+        :param sink: the sink.
+        :type sink: NullSink, PrintSink, LogSink or BufferedSink
+        '''
+
+        if sink in self.sinks:
+            self.sinks.remove(sink)
+
+    def handle(self, event:Event) -> None:
+        for sink in self.sinks:
+            sink.handle(event)
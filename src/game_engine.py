@@ -8,34 +8,49 @@ only the simple 1 player game is supported.
 import re
 
 from components import initialise_board, create_battleships, place_battleships, print_board
+from components import BitBoard
+from events import emit, PrintSink, SHOT, HIT, MISS, SUNK, GAME_OVER
+from logging_setup import setup_logging
 
-def attack(coordinates:tuple[int,int],board:list[list[str]],ships:dict[str,int]) -> bool:
+def attack(coordinates:tuple[int,int],board:list[list[str]],ships:dict[str,int],
+           events=None, player:str='player') -> bool:
 
     '''Carries out an attack on a specific square.
 
     :param coordinates: The square being attacked.
     :type coordinates: tuple
-    :param board: The board of the player being attacked.
+    :param board: The board of the player being attacked, as a list of lists or a BitBoard.
     :type board: list
     :param ships: The ships of the player being attacked.
     :type ships: dict
+    :param events: the sink that the shot, hit, miss and sunk events are sent to.
+        Nothing is sent if it is None.
+    :type events: events.EventBus
+    :param player: the player taking the shot, as given in the events.
+    :type player: str
 
     :return bool:
 
     '''
 
     row, col = coordinates[0], coordinates[1]
-    name:str = board[row][col]
+    emit(events, SHOT, player, (row, col))
+    #BitBoards record hits and misses in a single step, however large the board is.
+    if isinstance(board, BitBoard):
+        name:str = board.fire((row, col))
+    else:
+        name:str = board[row][col]
     #If the square contains a ship
     if name:
         ships[name] -= 1
         #Removes ship from square
-        board[row][col] = None
-        print(f'Hit battleship at ({col},{row})!')
+        if not isinstance(board, BitBoard):
+            board[row][col] = None
+        emit(events, HIT, player, (row, col), name)
         if ships[name] == 0:
-            print(f'{name} sunk!')
+            emit(events, SUNK, player, (row, col), name)
         return True
-    print(f'Miss at ({col},{row})!')
+    emit(events, MISS, player, (row, col))
     return False
 
 def validate_coords_input(coords:str) -> bool:
@@ -71,12 +86,14 @@ def cli_coordinates_input() -> tuple[int,int]:
 def wintest(ships:dict[str,int]) -> bool:
     '''Checks if all of a player's ships have been sunk.
 
-    :param ships: The player's ships.
+    :param ships: The player's ships, or the player's BitBoard.
     :type ships: dict
     :return: Whether the player has no ships remaining or not.
     :rtype: bool
 
     '''
+    if isinstance(ships, BitBoard):
+        return ships.all_sunk()
     for i in ships.values():
         if i:
             return False
@@ -89,6 +106,7 @@ def simple_game_loop() -> None:
 
     '''
     print('Welcome to Battleship!')
+    events = PrintSink()
     board = initialise_board()
     ships = create_battleships()
     board = place_battleships(board,ships,'simple')
@@ -96,8 +114,9 @@ def simple_game_loop() -> None:
     while not wintest(ships):
         print_board(board)
         coords = cli_coordinates_input()
-        attack(coords,board,ships)
-    print('Player 1 wins!')
+        attack(coords,board,ships,events,'Player 1')
+    emit(events, GAME_OVER, 'Player 1')
 
 if __name__ == '__main__':
+    setup_logging()
     simple_game_loop()
@@ -0,0 +1,88 @@
+#Copyright (C) 2023 megiddon
+#This program is licensed under the GNU GPL 3.0 or later.
+#This is contained in full in the file LICENSE.txt
+
+'''Sets up logging for the game.
+Log records are put on a queue and written to gamelog.log and the console by a
+background thread, so logging does not block the game or the web server.
+'''
+
+import atexit
+import logging
+import os
+
+LOG_FILE = 'gamelog.log'
+#gamelog.log is rotated once it reaches this size, keeping this many old logs.
+MAX_LOG_BYTES = 1024 * 1024
+BACKUP_COUNT = 3
+#Setting this environment variable to 1 turns on debug logging.
+DEBUG_ENV = 'BATTLESHIPS_DEBUG'
+
+LOG_FORMAT = '%(asctime)s %(levelname)-1s %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+#the running listener thread and the handler that feeds it.
+_listener = None
+_queue_handler = None
+
+def setup_logging(filename:str=LOG_FILE, debug:bool=None, console:bool=True,
+                  max_bytes:int=MAX_LOG_BYTES, backup_count:int=BACKUP_COUNT) -> None:
+
+    '''Sends all log records through a queue to a rotating log file and the console.
+    Only the first call has any effect, so every entry point can call it.
+
+    :param filename: the file to log to.
+    :type filename: str
+    :param debug: whether to log debug messages.
+        Defaults to whether the BATTLESHIPS_DEBUG environment variable is set to 1.
+    :type debug: bool
+    :param console: whether to also log to the console.
+    :type console: bool
+    :param max_bytes: the size at which the log file is rotated.
+    :type max_bytes: int
+    :param backup_count: how many rotated log files are kept.
+    :type backup_count: int
+
+    '''
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+    #imported here so that modules which only import this file do not pay for them.
+    import queue
+    from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+    if debug is None:
+        debug = os.environ.get(DEBUG_ENV, '').lower() in ('1', 'true', 'yes')
+
+    formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
+    handlers = [RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                    encoding='utf-8')]
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = QueueHandler(log_queue)
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(logging.DEBUG if debug else logging.INFO)
+
+    _listener = QueueListener(log_queue, *handlers)
+    _listener.start()
+    #writes out anything still on the queue when the program exits.
+    atexit.register(stop_logging)
+
+def stop_logging() -> None:
+
+    '''Writes out any queued log records and closes the log file.'''
+
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger().removeHandler(_queue_handler)
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _queue_handler = None
@@ -8,38 +8,131 @@
 
 '''
 
-import json
-import os
 import logging
 import sys
+import time
 from math import floor
 from uuid import uuid1
 
 try:
     import jinja2
-    from flask import Flask, request, session, render_template, jsonify
-    from flask_session import Session
+    from flask import Flask, Response, g, request, session, render_template, jsonify
+    from session_store import GameStore, MemorySessionInterface
 except ModuleNotFoundError:
     print('Modules not present! Refer to README.md for instructions on installing.')
     input('Press Enter to quit.')
     sys.exit()
 
-from mp_game_engine import generate_attack, generate_advanced_attack, advanced_ai_attack, validate_config_data
+from mp_game_engine import generate_advanced_attack, advanced_ai_attack, validate_config_data
+from mp_game_engine import create_density_map, create_shot_pool, validate_time_budget, Frontier
+from mp_game_engine import create_rng
 from game_engine import attack, wintest
 from components import get_json_data, create_battleships, place_battleships, initialise_board, await_exit
-
-logging.basicConfig(encoding='utf-8',
-                    level=logging.INFO,
-                    handlers=[logging.FileHandler('gamelog.log'),logging.StreamHandler()],
-                    format='%(asctime)s %(levelname)-1s %(message)s',
-                    datefmt='%Y-%m-%d %H:%M:%S')
+from components import AttackedSquares, place_custom_battleships
+from logging_setup import setup_logging
+from opening_book import create_opening
+from events import EventBus, LogSink, emit, AI, GAME_OVER
+from targeting import create_targeter, load_settings
+import mp_game_engine
+import metrics
+import profiling
 
 #Disables logging of server messages
 log = logging.getLogger('werkzeug')
 log.disabled = True
 
 
+#How many games are kept in memory at once, and how long an idle game is kept for in seconds.
+MAX_GAMES = 1000
+GAME_TTL = 30 * 60
+
 app = Flask(__name__)
+
+class TimedSessionInterface(MemorySessionInterface):
+
+    '''Keeps sessions in a GameStore, timing how long they take to load and save
+    for the /metrics url. Loading includes waiting for another request for the same game.
+    '''
+
+    open_session = metrics.timed('session_load')(MemorySessionInterface.open_session)
+    save_session = metrics.timed('session_save')(MemorySessionInterface.save_session)
+
+#Each client's game is kept in memory, keyed by a session id stored in a cookie.
+#Flask sessions are unique to a particular client,
+#so if two browsers access the service at the same time,
+#The two aren't going to interfere with each other.
+#Idle and finished games are removed after GAME_TTL seconds.
+game_store = GameStore(MAX_GAMES, GAME_TTL)
+app.session_interface = TimedSessionInterface(game_store)
+
+#Logging is set up on import, like the store, so that the game also logs when run by a
+#WSGI server. Only the first call has any effect.
+setup_logging()
+
+#Times the engine calls made by the web-based game for the /metrics url.
+#Only the names in this module are wrapped, so the engines themselves are left untimed.
+#generate_advanced_attack includes choosing the square, whatever the difficulty.
+attack = metrics.timed('attack')(attack)
+generate_advanced_attack = metrics.timed('generate_advanced_attack')(generate_advanced_attack)
+advanced_ai_attack = metrics.timed('advanced_ai_attack')(advanced_ai_attack)
+
+def game_in_progress(data:dict) -> bool:
+
+    '''Returns whether a stored session holds a game whose ships are placed and which is not over.'''
+
+    return 'player_board' in data and not data.get('end_flag', True)
+
+metrics.REGISTRY.gauge('battleships_active_games', lambda: game_store.count(game_in_progress),
+                       'Games with placed ships that are not over yet.')
+metrics.REGISTRY.gauge('battleships_stored_sessions', lambda: len(game_store),
+                       'Sessions kept in memory, including finished games, until they expire.')
+metrics.REGISTRY.gauge('battleships_score_cache_hits', lambda: mp_game_engine.SCORE_CACHE.hits,
+                       'Boards whose scores were found in the score cache.')
+metrics.REGISTRY.gauge('battleships_score_cache_misses',
+                       lambda: mp_game_engine.SCORE_CACHE.misses,
+                       'Boards whose scores were not found in the score cache.')
+metrics.REGISTRY.gauge('battleships_score_cache_entries', lambda: len(mp_game_engine.SCORE_CACHE),
+                       'Boards stored in the score cache.')
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.teardown_request
+def unlock_session(_error=None):
+
+    '''Unlocks the session if it was not saved, so that later requests for it do not wait forever.'''
+
+    release = getattr(session, 'release', None)
+    if release is not None:
+        release()
+
+@app.teardown_request
+def record_request_time(_error=None):
+
+    '''Records how long a request took, including saving the session,
+    broken down by url and difficulty.
+    '''
+
+    if 'request_start' not in g or request.url_rule is None:
+        return
+    if request.url_rule.rule == '/metrics':
+        return
+    metrics.REGISTRY.histogram('battleships_request_seconds',
+                               'Time taken to handle a request.',
+                               endpoint=request.url_rule.rule,
+                               difficulty=session.get('difficulty', 'none')
+                               ).observe(time.perf_counter() - g.request_start)
+
+@app.route('/metrics')
+def metrics_interface():
+
+    '''Represents the /metrics url.
+    Returns request latencies, engine timings and game counts in the Prometheus text format.
+    '''
+
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 #Route for /placement url.
 @app.route('/placement', methods=['GET', 'POST'])
 def placement_interface():
@@ -62,34 +155,36 @@ def placement_interface():
                                    board_size=session['size'])
 
 
-        #The spec says the place_battleships method can only take 3 params so we have to do this.
-
-        #Copies data in placement.json into memory.
-        placement_data = get_json_data('placement.json')
-
-        #Deletes placement.json from filesystem.
-        os.remove('placement.json')
-
-        #Rewrites placement.json with data from user.
-        with open('placement.json', 'w') as file_1:
-            json.dump(data, file_1)
+        #Bitboards keep the boards small when they are stored in the session.
+        player_board = initialise_board(session['size'], bitboard=True)
+        session['player_board'] = place_custom_battleships(player_board,
+                                                           session['player_ships'],
+                                                           data,
+                                                           session['rng'])
 
-        player_board = initialise_board(session['size'])
-        session['player_board'] = place_battleships(player_board,
-                                                    session['player_ships'],
-                                                    'custom')
-
-        ai_board = initialise_board(session['size'])
+        ai_board = initialise_board(session['size'], bitboard=True)
         session['ai_board'] = place_battleships(ai_board,
                                                 session['aiships'],
-                                                'random')
+                                                'random',
+                                                session['rng'])
 
-        #Restores contents of placement.json file.
-        os.remove('placement.json')
-        with open('placement.json', 'w') as file_2:
-            json.dump(placement_data, file_2)
-
-        session['ai_checked'] = []
+        session['ai_checked'] = AttackedSquares(session['size'])
+        session['density_map'] = create_density_map(session['difficulty'],
+                                                    session['player_ships'],
+                                                    session['size'],
+                                                    session['time_budget'],
+                                                    session['rng'])
+        session['shot_pool'] = create_shot_pool(session['difficulty'], session['size'],
+                                                session['rng'])
+        session['opening'] = create_opening(session['difficulty'],
+                                            session['player_ships'],
+                                            session['size'],
+                                            rng=session['rng'])
+        session['targeter'] = create_targeter(session['difficulty'],
+                                              session['player_ships'],
+                                              session['size'],
+                                              session['targeting_settings'],
+                                              session['rng'])
         logging.info('id %s: ship data successfully sent', session["ident"])
         #Message is arbitrary here.
         return jsonify({'message': 'just according to keikaku'}),1000
@@ -104,12 +199,20 @@ def placement_interface():
 
         session['difficulty'], session['size'] = validate_config_data(
             session['difficulty'], session['size'])
+        session['time_budget'] = validate_time_budget(config_data.get('move_time_budget_ms'))
+        session['targeting_settings'] = load_settings(config_data)
 
         #Generates a unique ID for a session for identification in the log.
         #Not cryptographically secure but it doesn't
         #Need to be for this particular application.
         session['ident'] = uuid1()
-        session['hunt'] : dict = []
+        #every random choice of the game is drawn from the session's own generator,
+        #so a game can be replayed from the seed in the log.
+        session['rng'], session['seed'] = create_rng(config_data.get('seed'))
+        logging.info('id %s: game seed %d', session['ident'], session['seed'])
+        session['hunt'] : Frontier = Frontier(session['size'], session['rng'])
+        #the game's events are only logged, and only when debug messages are on.
+        session['events'] : EventBus = EventBus(LogSink())
         session['player_ships'] : dict[str,int] = create_battleships()
         session['player_hit'] : dict[tuple[int,int],bool] = {}
 
@@ -146,7 +249,7 @@ def root():
         try:
             logging.info('id %s: attempting to load main game', session["ident"])
             return render_template('main.html',
-                                   player_board=session['player_board'])
+                                   player_board=session['player_board'].to_list())
 
         except jinja2.exceptions.TemplateNotFound:
             logging.critical('main.html does not exist!')
@@ -173,14 +276,14 @@ def process_attack():
             return jsonify({'hit' : session['player_hit'][(x_coord,y_coord)],
                             'AI_Turn': session['ai_checked'][-1][::-1]})
 
-        hit = attack((x_coord,y_coord), session['ai_board'], session['aiships'])
+        hit = attack((x_coord,y_coord), session['ai_board'], session['aiships'],
+                     session['events'])
+        metrics.REGISTRY.increment('battleships_moves_total', help_text='Moves played.',
+                                   difficulty=session['difficulty'])
         session['player_hit'][(x_coord,y_coord)] = hit
 
         if session['difficulty'] == 'easy':
-            while True:
-                ai_coords = generate_attack(session['size'])
-                if ai_coords not in session['ai_checked']:
-                    break
+            ai_coords = session['shot_pool'].draw(session['ai_checked'])
             session['ai_checked'].append(ai_coords)
 
         else:
@@ -188,11 +291,21 @@ def process_attack():
                                                                        session['difficulty'],
                                                                        session['hunt'],
                                                                        session['player_ships'],
-                                                                       session['size'])
+                                                                       session['size'],
+                                                                       session['density_map'],
+                                                                       session['shot_pool'],
+                                                                       session['time_budget'],
+                                                                       session['opening'],
+                                                                       session['targeter'],
+                                                                       session['rng'])
         #If player wins.
         if wintest(session['aiships']):
             logging.info('game over - Player wins')
+            emit(session['events'], GAME_OVER, 'player')
             session['end_flag'] = True
+            metrics.REGISTRY.increment('battleships_games_finished_total',
+                                       help_text='Games played to the end.',
+                                       difficulty=session['difficulty'], winner='player')
 
             return jsonify({'hit': True,
                             'AI_Turn': ai_coords[::-1],
@@ -203,19 +316,29 @@ def process_attack():
             if session['difficulty'] == 'easy':
                 attack(ai_coords,
                             session['player_board'],
-                            session['player_ships'])
+                            session['player_ships'],
+                            session['events'],
+                            AI)
 
             else:
                 session['hunt'] = advanced_ai_attack(ai_coords,
                                                             session['player_board'],
                                                             session['player_ships'],
                                                             session['hunt'],
-                                                            session['difficulty'])
+                                                            session['difficulty'],
+                                                            session['density_map'],
+                                                            session['targeter'],
+                                                            session['events'],
+                                                            session['rng'])
 
         #If comp wins.
         if wintest(session['player_ships']):
             session['end_flag'] = True
             logging.info('id %s: game over - AI Wins', session["ident"])
+            emit(session['events'], GAME_OVER, AI)
+            metrics.REGISTRY.increment('battleships_games_finished_total',
+                                       help_text='Games played to the end.',
+                                       difficulty=session['difficulty'], winner='ai')
             return jsonify({'hit': hit,
                             'AI_Turn': ai_coords[::-1],
                             'finished': 'you lose!'})
@@ -224,19 +347,25 @@ def process_attack():
                         'AI_Turn': ai_coords[::-1]})
 
 
+def describe_game(_args:tuple, _kwargs:dict) -> str:
+
+    '''Summarises the game in the current session, for slow request logging.'''
+
+    return (f"size={session.get('size')}, difficulty={session.get('difficulty')!r}, "
+            f"seed={session.get('seed')}, "
+            f"ai_checked={len(session.get('ai_checked', ()))}, "
+            f"hunt={len(session.get('hunt', ()))}")
+
+#Profiles the AI and request handlers if BATTLESHIPS_PROFILE_DIR or BATTLESHIPS_SLOW_MS is set.
+profiler = profiling.from_environment()
+if profiler:
+    profiler.instrument(mp_game_engine, 'generate_advanced_attack')
+    profiler.instrument(mp_game_engine, 'choose_advanced_square')
+    for endpoint in ['process_attack', 'placement_interface']:
+        app.view_functions[endpoint] = profiler.wrap(app.view_functions[endpoint], endpoint,
+                                                     describe_game)
+
 if __name__ == '__main__':
-    SESSION_TYPE = 'filesystem'
-
-    #We're using the flask_session module here to act as a pseudo-global variable.
-    #It's basically just a dictionary stored as a cookie on the host's filesystem.
-    #Flask sessions are unique to a particular client,
-    #so if two browsers access the service at the same time,
-    #The two aren't going to interfere with each other.
-    #Dealing with global variables with a structure like this is painful.
-    #Luckily we have a nice solution that fixes all that.
-
-    app.config.from_object(__name__)
-    Session(app)
     app.template_folder = 'templates'
     logging.info('app run')
     app.run()
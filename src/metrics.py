@@ -0,0 +1,206 @@
+#Copyright (C) 2023 megiddon
+#This program is licensed under the GNU GPL 3.0 or later.
+#This is contained in full in the file LICENSE.txt
+
+'''Latency histograms and counters for the web-based game.
+The values are kept in memory and exported in the Prometheus text format by the /metrics url.
+'''
+
+import functools
+import threading
+import time
+
+#upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+class Histogram:
+
+    '''Counts observed values in a set of cumulative buckets, like a Prometheus histogram.
+
+    :param buckets: the upper bound of each bucket, in increasing order.
+    :type buckets: tuple
+    '''
+
+    def __init__(self, buckets:tuple[float,...]=LATENCY_BUCKETS) -> None:
+        self.buckets:tuple[float,...] = buckets
+        #the last count is for values above every bucket.
+        self.counts:list[int] = [0] * (len(buckets) + 1)
+        self.sum:float = 0.0
+        self.count:int = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value:float) -> None:
+
+        '''Records a value.
+
+        :param value: the value to record, such as a latency in seconds.
+        :type value: float
+        '''
+
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def cumulative(self) -> list[tuple[str,int]]:
+
+        '''Returns the number of values at or below each bucket bound.
+
+        :return: the bound and count of each bucket, ending with "+Inf".
+        :rtype: list
+        '''
+
+        with self._lock:
+            counts = list(self.counts)
+        bounds = [repr(bound) for bound in self.buckets] + ['+Inf']
+        total = 0
+        result = []
+        for bound, count in zip(bounds, counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+class Registry:
+
+    '''Holds every metric of the app, keyed by name and labels.'''
+
+    def __init__(self) -> None:
+        self.histograms:dict[str,dict[tuple,Histogram]] = {}
+        self.counters:dict[str,dict[tuple,float]] = {}
+        self.gauges:dict[str,object] = {}
+        self.help:dict[str,str] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name:str, help_text:str='', **labels) -> Histogram:
+
+        '''Returns the histogram with a name and set of labels, creating it if needed.
+
+        :param name: the name of the metric.
+        :type name: str
+        :param help_text: a description of the metric.
+        :type help_text: str
+        :return: the histogram.
+        :rtype: Histogram
+        '''
+
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self.histograms.setdefault(name, {})
+            if key not in family:
+                family[key] = Histogram()
+                self.help.setdefault(name, help_text)
+            return family[key]
+
+    def increment(self, name:str, amount:float=1, help_text:str='', **labels) -> None:
+
+        '''Adds to a counter.
+
+        :param name: the name of the metric.
+        :type name: str
+        :param amount: how much to add.
+        :type amount: float
+        :param help_text: a description of the metric.
+        :type help_text: str
+        '''
+
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self.counters.setdefault(name, {})
+            family[key] = family.get(key, 0) + amount
+            self.help.setdefault(name, help_text)
+
+    def gauge(self, name:str, function, help_text:str='') -> None:
+
+        '''Registers a gauge whose value is read from a function whenever metrics are exported.
+
+        :param name: the name of the metric.
+        :type name: str
+        :param function: returns the current value.
+        :type function: function
+        :param help_text: a description of the metric.
+        :type help_text: str
+        '''
+
+        with self._lock:
+            self.gauges[name] = function
+            self.help[name] = help_text
+
+    def clear(self) -> None:
+
+        '''Removes every recorded value.'''
+
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render(self) -> str:
+
+        '''Exports every metric in the Prometheus text format.
+
+        :return: the metrics, one sample per line.
+        :rtype: str
+        '''
+
+        lines = []
+        with self._lock:
+            histograms = {name: dict(family) for name, family in self.histograms.items()}
+            counters = {name: dict(family) for name, family in self.counters.items()}
+            gauges = dict(self.gauges)
+
+        for name, function in sorted(gauges.items()):
+            self._header(lines, name, 'gauge')
+            lines.append(f'{name} {function()}')
+        for name, family in sorted(counters.items()):
+            self._header(lines, name, 'counter')
+            for key, value in sorted(family.items()):
+                lines.append(f'{name}{_labels(key)} {value}')
+        for name, family in sorted(histograms.items()):
+            self._header(lines, name, 'histogram')
+            for key, histogram in sorted(family.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{name}_bucket{_labels(key + (("le", bound),))} {count}')
+                lines.append(f'{name}_sum{_labels(key)} {histogram.sum}')
+                lines.append(f'{name}_count{_labels(key)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, lines:list[str], name:str, kind:str) -> None:
+        if self.help.get(name):
+            lines.append(f'# HELP {name} {self.help[name]}')
+        lines.append(f'# TYPE {name} {kind}')
+
+def _labels(key:tuple) -> str:
+    if not key:
+        return ''
+    pairs = ','.join(f'{label}="{value}"' for label, value in key)
+    return '{' + pairs + '}'
+
+REGISTRY = Registry()
+
+def timed(name:str, registry:Registry=REGISTRY):
+
+    '''Decorator that records how long each call of a function takes.
+
+    :param name: the value of the function label in battleships_function_seconds.
+    :type name: str
+    :param registry: the registry the times are recorded in.
+    :type registry: Registry
+    '''
+
+    def decorator(function):
+        histogram = registry.histogram('battleships_function_seconds',
+                                       'Time spent in game engine and session functions.',
+                                       function=name)
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        wrapper.metrics_timed = True
+        return wrapper
+    return decorator
@@ -8,19 +8,78 @@
     '''
 
 import random
+import threading
+import time
+from collections import OrderedDict, deque
+from array import array
+from weakref import WeakKeyDictionary
+from itertools import chain
 from math import floor
 import logging
 
 from game_engine import cli_coordinates_input, attack, wintest
 from components import get_json_data, initialise_board, create_battleships
-from components import place_battleships, validate_square, print_board
+from components import place_battleships, validate_square, print_board, BitBoard
+from components import AttackedSquares
+from events import emit, PrintSink, AI, SHOT, HIT, MISS, SUNK, GAME_OVER
+from logging_setup import setup_logging
 
-logging.basicConfig(encoding='utf-8',
-                    level=logging.INFO,
-                    handlers=[logging.FileHandler('gamelog.log'),logging.StreamHandler()],
-                    format='%(asctime)s %(levelname)-1s %(message)s',
-                    datefmt='%Y-%m-%d %H:%M:%S')
 
+#numpy is optional; the density scoring falls back to pure python without it.
+#It is slow to import, so it is only imported the first time a board is scored.
+_numpy_module = None
+
+def _numpy():
+
+    '''Imports numpy on first use.
+
+    :return: the numpy module, or None if it is not installed.
+    :rtype: module
+    '''
+
+    global _numpy_module
+    if _numpy_module is None:
+        try:
+            import numpy
+            _numpy_module = numpy
+        except ModuleNotFoundError:
+            _numpy_module = False
+    return _numpy_module or None
+
+#the numpy generator of each game, keyed by the game's random number generator.
+_generators = WeakKeyDictionary()
+_generators_lock = threading.Lock()
+
+def _numpy_generator(rng:random.Random):
+
+    '''Returns the numpy random number generator of a game,
+    seeded from the game's generator the first time it is needed,
+    so that seeded games still play out the same way.
+
+    :param rng: the random number generator of the game.
+    :type rng: random.Random
+    :return: the numpy generator.
+    :rtype: numpy.random.Generator
+    '''
+
+    with _generators_lock:
+        generator = _generators.get(rng)
+        if generator is None:
+            generator = _numpy().random.default_rng(rng.getrandbits(64))
+            _generators[rng] = generator
+        return generator
+
+#How many squares the AI scores at a time when it has a time budget for its move.
+#The deadline is checked between chunks, so smaller chunks overrun it by less.
+CHUNK_SQUARES = 4096
+PYTHON_CHUNK_SQUARES = 512
+
+def _chunk_height(size:int) -> int:
+
+    '''Returns how many rows of the board are scored at a time.'''
+
+    squares = CHUNK_SQUARES if _numpy() is not None else PYTHON_CHUNK_SQUARES
+    return max(1, squares // size)
 
 def validate_config_data(difficulty,size) -> (str, int):
 
@@ -49,198 +108,1102 @@ def validate_config_data(difficulty,size) -> (str, int):
                         A larger board will be used.")
 
     #Checks that the difficulty is valid.
-    if difficulty.lower() not in ['easy','medium','hard','very hard','extreme']:
+    if difficulty.lower() not in ['easy','medium','hard','very hard','extreme','monte carlo']:
         logging.error('difficulty variable in config.json invalid!')
         difficulty = 'easy'
 
     return difficulty,size
 
+def validate_time_budget(time_budget_ms) -> float:
+
+    '''Validates the move_time_budget_ms variable in config.json.
+
+    :param time_budget_ms: the time allowed for each AI move in milliseconds, or None for no limit.
+    :type time_budget_ms: float
+    :return: the time allowed for each AI move in seconds, or None for no limit.
+    :rtype: float
+    '''
+
+    if time_budget_ms is None:
+        return None
+    try:
+        if time_budget_ms >= 0:
+            return time_budget_ms / 1000
+    except TypeError:
+        pass
+    logging.error('move_time_budget_ms variable in config.json invalid! moves will not be timed.')
+    return None
+
+def create_rng(seed=None) -> tuple[random.Random,int]:
+
+    '''Creates the random number generator for a game, from the seed variable in config.json.
+
+    Every random choice in a game is drawn from this generator, so a game played with
+    the same seed and the same moves by the player is played the same way by the AI.
+
+    :param seed: the seed, or None to choose one at random.
+    :type seed: int
+    :return: the generator and the seed it was created with.
+    :rtype: tuple
+    '''
+
+    if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+        logging.error('seed variable in config.json invalid! a random seed will be used.')
+        seed = None
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(32)
+    return random.Random(seed), seed
+
+def _run_cap(ships:dict[str,int], size:int) -> int:
+
+    '''Returns how many free squares are counted in each direction from a square.
+
+    :param ships: the player's ships
+    :type ships: dict
+    :param size: the size of the board
+    :type size: int
+    :return: the maximum run length counted in one direction
+    :rtype: int
+    '''
+
+    max_length = max(ships.values())
+    #with every ship sunk there is nothing to cap the run at.
+    return max_length - 1 if max_length >= 1 else size
+
+def _score_square(square:tuple[int,int],
+                  checked:set[tuple[int,int]],
+                  cap:int,
+                  size:int) -> int:
+
+    '''Scores a single square from the number of free squares on each side of it.
+
+    :param square: the square being scored
+    :type square: tuple
+    :param checked: the squares the ai has already attacked
+    :type checked: set or AttackedSquares
+    :param cap: the maximum run length counted in one direction
+    :type cap: int
+    :param size: the size of the board
+    :type size: int
+    :return: the score of the square
+    :rtype: int
+    '''
+
+    DIRECTIONS = [(1,0), (-1,0), (0,1), (0,-1)]
+
+    #number of squares to each side of ship
+    squares = [0,0,0,0]
+    #iterates over each direction
+    for k in range(4):
+        new_square = square
+        endflag = False
+        #checks how many squares are free in each direction
+        while not endflag:
+            new_square = (new_square[0] + DIRECTIONS[k][0],
+                          new_square[1] + DIRECTIONS[k][1])
+            if (new_square in checked or not validate_square(new_square,size)
+            or squares[k] == cap):
+                endflag = True
+            #if the square is free
+            else:
+                squares[k] += 1
+
+    #calculates score based on the number of free squares in each direction
+    horizontal_squares:int = squares[0] + squares[1] + 1
+    vertical_squares:int = squares[2] + squares[3] + 1
+    h_score:int = floor(horizontal_squares ** 2/ 4)
+    v_score:int = floor(vertical_squares ** 2 / 4)
+    return h_score + v_score
+
+def score_squares(ai_checked:list[tuple[int,int]],
+                  ships:dict[str,int],
+                  polarity:int,
+                  size:int,
+                  rows:tuple[int,int]=None) -> list[list[int]]:
+
+    '''Scores each square by how many ways the longest remaining ship could cover it.
+    The random component added by choose_advanced_square is not included.
+
+    :param ai_checked: list of squares the ai has already attacked
+    :type ai_checked: list or AttackedSquares
+    :param ships: the player's ships
+    :type ships: dict
+    :param polarity: the distance between squares that the ai can check
+    :type polarity: int
+    :param size: the size of the board
+    :type size: int
+    :param rows: the first row and the row after the last to score, or None for every row
+    :type rows: tuple
+
+    :return: the score of each square in the rows, 0 for squares of the wrong polarity
+    :rtype: list
+    '''
+
+    cap = _run_cap(ships, size)
+    checked = ai_checked if isinstance(ai_checked, AttackedSquares) else set(ai_checked)
+    start, stop = rows or (0, size)
+
+    scores:list[list[int]]= []
+    #iterates over each square
+    for i in range(start, stop):
+        scores.append([0] * size)
+        for j in range(size):
+            #checks polarity of square
+            if (i + j) % polarity == 1:
+                scores[-1][j] = _score_square((i,j), checked, cap, size)
+    return scores
+
+def score_squares_vectorised(ai_checked:list[tuple[int,int]],
+                             ships:dict[str,int],
+                             polarity:int,
+                             size:int,
+                             rows:tuple[int,int]=None):
+
+    '''numpy implementation of score_squares.
+    Free runs are counted for the whole board at once by shifting a mask of free squares,
+    so the cost is O(size^2 * ship length) array operations rather than python loops.
+
+    :param ai_checked: list of squares the ai has already attacked
+    :type ai_checked: list or AttackedSquares
+    :param ships: the player's ships
+    :type ships: dict
+    :param polarity: the distance between squares that the ai can check
+    :type polarity: int
+    :param size: the size of the board
+    :type size: int
+    :param rows: the first row and the row after the last to score, or None for every row
+    :type rows: tuple
+
+    :return: the score of each square in the rows, 0 for squares of the wrong polarity
+    :rtype: numpy.ndarray
+    '''
+
+    cap = min(_run_cap(ships, size), size)
+    start, stop = rows or (0, size)
+    return _score_rows(_free_mask(ai_checked, size, cap), cap, polarity, size, start, stop)
+
+def _free_mask(ai_checked:list[tuple[int,int]], size:int, cap:int):
+
+    '''Returns a mask of the unchecked squares, padded with cap checked squares on each side
+    so that shifts stay in bounds.'''
+
+    np = _numpy()
+    padded = np.zeros((size + 2 * cap, size + 2 * cap), dtype=bool)
+    free = padded[cap:cap + size, cap:cap + size]
+    checked = np.zeros(size * size, dtype=bool)
+    if isinstance(ai_checked, AttackedSquares):
+        checked[np.frombuffer(ai_checked.order, dtype=np.uint32)] = True
+    elif len(ai_checked):
+        rows, cols = np.array(list(ai_checked), dtype=np.intp).reshape(-1, 2).T
+        checked[rows * size + cols] = True
+    free[...] = ~checked.reshape(size, size)
+    return padded
+
+def _score_rows(padded, cap:int, polarity:int, size:int, start:int, stop:int):
+
+    '''Scores rows start to stop - 1 of the board from its padded free mask.'''
+
+    np = _numpy()
+    height = stop - start
+    runs = []
+    for row_step, col_step in [(1,0), (-1,0), (0,1), (0,-1)]:
+        #a run continues for as long as every square before it is free.
+        alive = np.ones((height, size), dtype=bool)
+        run = np.zeros((height, size), dtype=np.int64)
+        for k in range(1, cap + 1):
+            alive &= padded[cap + start + row_step * k:cap + stop + row_step * k,
+                            cap + col_step * k:cap + col_step * k + size]
+            run += alive
+        runs.append(run)
+
+    horizontal_squares = runs[0] + runs[1] + 1
+    vertical_squares = runs[2] + runs[3] + 1
+    scores = horizontal_squares ** 2 // 4 + vertical_squares ** 2 // 4
+
+    #with no polarity every square is scored.
+    if polarity is not None:
+        row_index, col_index = np.indices((height, size))
+        scores[(row_index + start + col_index) % polarity != 1] = 0
+    return scores
+
+class ScoreCache:
+
+    '''A bounded cache of board scores, shared by every game in the process.
+
+    The base score of a square only depends on which squares have been attacked and on
+    the longest ship left, so games with the same misses, hits and longest ship share
+    an entry. Each board is stored once for all 8 of its rotations and reflections,
+    as the scores of a rotated or reflected board are the scores of the original board,
+    rotated or reflected the same way. Boards are first looked up as they are, and the
+    rotations and reflections are only worked out for boards that have not been seen
+    in that orientation before. The least recently used boards are removed
+    once the scores and orientations stored take up more than max_bytes.
+    Only used when numpy is installed.
+
+    :param max_bytes: the most memory used by the stored scores.
+    :type max_bytes: int
+    '''
+
+    def __init__(self, max_bytes:int=32 * 1024 * 1024) -> None:
+        self.max_bytes:int = max_bytes
+        self.hits:int = 0
+        self.misses:int = 0
+        self._bytes:int = 0
+        self._entries:OrderedDict = OrderedDict()
+        #the key and symmetry of the stored board that each orientation seen so far maps to.
+        self._orientations:OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def scores(self, ai_checked:list[tuple[int,int]], ships:dict[str,int],
+               polarity:int, size:int):
+
+        '''Returns the same scores as score_squares_vectorised, reusing them where possible.
+
+        :param ai_checked: list of squares the ai has already attacked
+        :type ai_checked: list or AttackedSquares
+        :param ships: the player's ships
+        :type ships: dict
+        :param polarity: the distance between squares that the ai can check
+        :type polarity: int
+        :param size: the size of the board
+        :type size: int
+        :return: the score of each square, 0 for squares of the wrong polarity
+        :rtype: numpy.ndarray
+        '''
+
+        np = _numpy()
+        cap = min(_run_cap(ships, size), size)
+        padded = _free_mask(ai_checked, size, cap)
+        free = padded[cap:cap + size, cap:cap + size]
+
+        orientation = (size, cap, np.packbits(free).tobytes())
+        canonical = None
+        with self._lock:
+            found = self._orientations.get(orientation)
+            if found is not None:
+                key, symmetry = found
+                canonical = self._entries.get(key)
+                if canonical is not None:
+                    self._orientations.move_to_end(orientation)
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+
+        if canonical is None:
+            #the key of the board is the smallest of the keys of its 8 symmetries.
+            symmetries = np.empty((8, size, size), dtype=bool)
+            for index in range(4):
+                symmetries[index] = _symmetry(free, index, np)
+            symmetries[4:] = symmetries[:4].transpose(0, 2, 1)
+            keys = [row.tobytes() for row in np.packbits(symmetries.reshape(8, -1), axis=1)]
+            symmetry = min(range(8), key=keys.__getitem__)
+            key = (size, cap, keys[symmetry])
+            with self._lock:
+                canonical = self._entries.get(key)
+                if canonical is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                self._remember(orientation, key, symmetry)
+
+        if canonical is None:
+            canonical = _symmetry(_score_rows(padded, cap, None, size, 0, size), symmetry, np)
+            canonical = np.ascontiguousarray(canonical, dtype=np.int32)
+            #the cached scores are shared, so they must not be changed by a caller.
+            canonical.setflags(write=False)
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = canonical
+                    self._bytes += canonical.nbytes
+                    while self._bytes > self.max_bytes and len(self._entries) > 1:
+                        _, evicted = self._entries.popitem(last=False)
+                        self._bytes -= evicted.nbytes
+                    self._trim_orientations()
+
+        scores = _symmetry(canonical, symmetry, np, inverse=True)
+        row_index, col_index = np.indices((size, size))
+        return np.where((row_index + col_index) % polarity == 1, scores, 0)
+
+    def _remember(self, orientation:tuple, key:tuple, symmetry:int) -> None:
+
+        '''Records which stored board an orientation maps to. The lock must be held.'''
+
+        if orientation not in self._orientations:
+            self._bytes += len(orientation[2])
+        self._orientations[orientation] = (key, symmetry)
+        self._orientations.move_to_end(orientation)
+        self._trim_orientations()
+
+    def _trim_orientations(self) -> None:
+
+        '''Removes the least recently used orientations once there are more than
+        8 for each stored board, or the cache is over max_bytes. The lock must be held.'''
+
+        while self._orientations and (len(self._orientations) > 8 * len(self._entries) + 8
+                                      or self._bytes > self.max_bytes):
+            orientation, _ = self._orientations.popitem(last=False)
+            self._bytes -= len(orientation[2])
+
+    def stats(self) -> dict[str,int]:
+
+        '''Returns the number of hits, misses and stored boards.'''
+
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries),
+                    'orientations': len(self._orientations), 'bytes': self._bytes}
+
+    def clear(self) -> None:
+
+        '''Removes every stored board and resets the counters.'''
+
+        with self._lock:
+            self._entries.clear()
+            self._orientations.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+def _symmetry(board, index:int, np, inverse:bool=False):
+
+    '''Applies one of the 8 rotations and reflections of a square board.
+    Bit 0 of the index flips the board upside down, bit 1 flips it left to right,
+    and symmetries 4 to 7 then transpose it. Only views of the board are made.'''
+
+    transpose = index >= 4
+    if inverse and transpose:
+        board = board.T
+    if index & 1:
+        board = board[::-1]
+    if index & 2:
+        board = board[:, ::-1]
+    if transpose and not inverse:
+        board = board.T
+    return board
+
+SCORE_CACHE = ScoreCache()
+
+class WeightedSampler:
+
+    '''Chooses items at random in proportion to their weights.
+
+    The weights are kept in a Fenwick tree, so changing a weight and choosing an item
+    both take O(log n) time, and building the tree takes O(n) time.
+
+    :param weights: the weight of each item. Weights must be non-negative integers.
+    :type weights: iterable
+    '''
+
+    def __init__(self, weights=()) -> None:
+        self.weights:list[int] = list(weights)
+        self.total:int = sum(self.weights)
+        #tree[i] holds the sum of the weights of items i - (i & -i) to i - 1.
+        self.tree:list[int] = [0] + self.weights
+        n = len(self.weights)
+        for i in range(1, n + 1):
+            parent = i + (i & -i)
+            if parent <= n:
+                self.tree[parent] += self.tree[i]
+        self._top:int = 1 << (n.bit_length() - 1) if n else 0
+
+    def __len__(self) -> int:
+        return len(self.weights)
+
+    def set(self, index:int, weight:int) -> None:
+
+        '''Changes the weight of an item.
+
+        :param index: the index of the item
+        :type index: int
+        :param weight: the new weight
+        :type weight: int
+        '''
+
+        delta = weight - self.weights[index]
+        if not delta:
+            return
+        self.weights[index] = weight
+        self.total += delta
+        i = index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, target:int) -> int:
+
+        '''Finds the item that a running total of the weights passes target in.
+
+        :param target: a number from 0 to total - 1
+        :type target: int
+        :return: the index of the first item whose cumulative weight is greater than target
+        :rtype: int
+        '''
+
+        position = 0
+        step = self._top
+        while step:
+            following = position + step
+            if following < len(self.tree) and self.tree[following] <= target:
+                position = following
+                target -= self.tree[following]
+            step >>= 1
+        return position
+
+    def sample(self, rng:random.Random=None) -> int:
+
+        '''Chooses an item at random, weighted by its weight.
+
+        :param rng: the random number generator to use. Defaults to the random module.
+        :type rng: random.Random
+        :return: the index of the item, or None if every weight is 0
+        :rtype: int
+        '''
+
+        if self.total <= 0:
+            return None
+        return self.find((rng or random).randint(0, self.total - 1))
+
 def choose_advanced_square(ai_checked:list[tuple[int,int]],
                            ships:dict[str,int],
                            polarity:int,
-                           size:int) -> tuple[int,int]:
+                           size:int,
+                           deadline:float=None,
+                           rng:random.Random=None) -> tuple[int,int]:
 
     '''chooses a square based on the probability of the square being able to contain each ship.
+    Uses numpy to score the board when it is installed.
 
     :param ai_checked: list of squares the ai has already attacked
-    :type ai_checked: list
+    :type ai_checked: list or AttackedSquares
     :param ships: the player's ships
     :type ships: dict
     :param polarity: the distance between squares that the ai can check
     :type polarity: int
     :param size: the size of the board
     :type size: int
+    :param deadline: the time.perf_counter() time by which a square must be chosen.
+        If given, the board is scored a chunk of rows at a time until the deadline passes.
+    :type deadline: float
+    :param rng: the random number generator of the game. Defaults to the random module.
+    :type rng: random.Random
 
-    :return: the square that the ai chooses
+    :return: the square that the ai chooses, or None if no rows could be scored in time
     :rtype: tuple
     '''
 
-    DIRECTIONS = [(1,0), (-1,0), (0,1), (0,-1)]
+    rng = rng or random
+    if deadline is not None:
+        return _choose_before_deadline(ai_checked, ships, polarity, size, deadline, rng)
 
-    #it's the leaning tower of indentation
-    scores:list[list[int]]= []
-    #populates array
-    for i in range(size):
-        scores.append([0] * size)
+    np = _numpy()
+    if np is not None:
+        scores = SCORE_CACHE.scores(ai_checked, ships, polarity, size)
+        #adds the same random component as the python version to every square of the right polarity.
+        noise = _numpy_generator(rng).integers(5, 8, size=(size, size))
+        row_index, col_index = np.indices((size, size))
+        scores = np.where((row_index + col_index) % polarity == 1, scores + noise, 0)
 
-    #iterates over each square
+        cumulative = np.cumsum(scores, axis=None)
+        index:int = rng.randint(0,int(cumulative[-1])-1)
+        square = int(np.searchsorted(cumulative, index, side='right'))
+        return (square // size, square % size)
+
+    scores = score_squares(ai_checked, ships, polarity, size)
     for i in range(size):
         for j in range(size):
-            #checks polarity of square
             if (i + j) % polarity == 1:
-                #number of squares to each side of ship
-                squares = [0,0,0,0]
-                #iterates over each direction
-                for k in range(4):
-                    new_square = (i,j)
-                    endflag = False
-                    #checks how many squares are free in each direction
-                    while not endflag:
-                        new_square = (new_square[0] + DIRECTIONS[k][0],
-                                      new_square[1] + DIRECTIONS[k][1])
-                        if (new_square in ai_checked or not validate_square(new_square,size)
-                        or squares[k] == max(ships.values()) - 1):
-                            endflag = True
-                        #if the square is free
-                        else:
-                            squares[k] += 1
-
-                #calculates score based on the number of free squares in each direction
-                horizontal_squares:int = squares[0] + squares[1] + 1
-                vertical_squares:int = squares[2] + squares[3] + 1
-                h_score:int = floor(horizontal_squares ** 2/ 4)
-                v_score:int = floor(vertical_squares ** 2 / 4)
-                scores[i][j] = h_score + v_score + random.randint(5,7)
+                scores[i][j] += rng.randint(5,7)
 
     #chooses square, but now factoring in the score for each square.
+    square = WeightedSampler(chain.from_iterable(scores)).sample(rng)
+    return divmod(square, size)
 
-    total:int = sum(sum(scores, []))
-    index:int = random.randint(0,total-1)
-    cumulative = 0
-    for i in range(size):
-        for j in range(size):
-            cumulative += scores[i][j]
-            if cumulative > index:
-                return (i,j)
+def _choose_before_deadline(ai_checked:list[tuple[int,int]],
+                            ships:dict[str,int],
+                            polarity:int,
+                            size:int,
+                            deadline:float,
+                            rng:random.Random=random) -> tuple[int,int]:
+
+    '''Anytime version of choose_advanced_square.
 
+    Chunks of rows are scored in a random order until the deadline passes.
+    After each chunk the chosen square is replaced by a square from that chunk with
+    probability equal to the chunk's share of the weight scored so far, so the square
+    is always a weighted choice from every row scored. Checked squares are never chosen.
 
+    :return: the square that the ai chooses, or None if the deadline passed before any
+        unchecked square of the right polarity was scored
+    :rtype: tuple
+    '''
+
+    np = _numpy()
+    cap = min(_run_cap(ships, size), size)
+    if np is not None:
+        padded = _free_mask(ai_checked, size, cap)
+        generator = _numpy_generator(rng)
+    checked = ai_checked if isinstance(ai_checked, AttackedSquares) else set(ai_checked)
+
+    height = _chunk_height(size)
+    starts = list(range(0, size, height))
+    rng.shuffle(starts)
+
+    choice = None
+    total = 0
+    for start in starts:
+        if time.perf_counter() >= deadline:
+            break
+        stop = min(start + height, size)
+
+        if np is not None:
+            scores = _score_rows(padded, cap, polarity, size, start, stop)
+            noise = generator.integers(5, 8, size=scores.shape)
+            row_index, col_index = np.indices(scores.shape)
+            eligible = (((row_index + start + col_index) % polarity == 1)
+                        & padded[cap + start:cap + stop, cap:cap + size])
+            cumulative = np.cumsum(np.where(eligible, scores + noise, 0), axis=None)
+            chunk_total = int(cumulative[-1])
+            if chunk_total:
+                index = rng.randint(0, chunk_total - 1)
+                square = int(np.searchsorted(cumulative, index, side='right'))
+                candidate = (start + square // size, square % size)
+        else:
+            weights = score_squares(checked, ships, polarity, size, (start, stop))
+            chunk_total = 0
+            for i in range(start, stop):
+                for j in range(size):
+                    if (i + j) % polarity == 1 and (i,j) not in checked:
+                        weights[i - start][j] += rng.randint(5,7)
+                        chunk_total += weights[i - start][j]
+                    else:
+                        weights[i - start][j] = 0
+            if chunk_total:
+                index = rng.randint(0, chunk_total - 1)
+                for i in range(start, stop):
+                    for j in range(size):
+                        index -= weights[i - start][j]
+                        if index < 0:
+                            candidate = (i,j)
+                            break
+                    if index < 0:
+                        break
+
+        if chunk_total:
+            total += chunk_total
+            if rng.randint(1, total) <= chunk_total:
+                choice = candidate
+    return choice
+
+def advanced_polarity(difficulty:str, ships:dict[str,int]) -> int:
+
+    '''Returns the polarity used by the density-based difficulties.
+
+    :param difficulty: the difficulty of the game
+    :type difficulty: str
+    :param ships: the ships of the player being attacked
+    :type ships: dict
+    :return: the polarity
+    :rtype: int
+    '''
+
+    if difficulty == 'extreme':
+        return max(min(ships.values()), 2)
+    return 2
+
+def create_density_map(difficulty:str, ships:dict[str,int], size:int,
+                       time_budget:float=None, rng:random.Random=None) -> 'DensityMap':
+
+    '''Creates a density map for the difficulties that use one.
+
+    :param difficulty: the difficulty of the game
+    :type difficulty: str
+    :param ships: the ships of the player being attacked
+    :type ships: dict
+    :param size: the size of the board
+    :type size: int
+    :param time_budget: the time allowed for each move in seconds, or None for no limit.
+        With a limit, the map is rescored a chunk of rows at a time after a ship is sunk.
+    :type time_budget: float
+    :param rng: the random number generator of the game. Defaults to the random module.
+    :type rng: random.Random
+    :return: the density map, or None for difficulties that do not use one
+    :rtype: DensityMap
+    '''
+
+    if difficulty in ['very hard', 'extreme']:
+        return DensityMap(size, ships, advanced_polarity(difficulty, ships),
+                          lazy=time_budget is not None, rng=rng)
+    return None
+
+class DensityMap:
+
+    '''Keeps the weights used by choose_advanced_square up to date between moves.
+
+    A shot only changes the free runs of the squares within one ship length of it
+    along its row and column, so only those squares are rescored.
+    Checked squares have a weight of 0, and the random component is drawn again
+    whenever a square is rescored rather than on every move.
+    The weights are kept in a WeightedSampler, so that a square is rescored
+    and chosen in O(log size) time.
+
+    A lazy map does not rescore the board as soon as a ship is sunk.
+    Instead, choose rescores chunks of rows until its deadline passes,
+    and the rows that are not yet rescored keep their old weights until a later move.
+
+    :param size: the size of the board
+    :type size: int
+    :param ships: the ships of the player being attacked
+    :type ships: dict
+    :param polarity: the distance between squares that the ai can check
+    :type polarity: int
+    :param lazy: whether to rescore the board over several moves after a ship is sunk
+    :type lazy: bool
+    :param rng: the random number generator of the game. Defaults to the random module.
+    :type rng: random.Random
+    '''
+
+    def __init__(self, size:int, ships:dict[str,int], polarity:int=2,
+                 lazy:bool=False, rng:random.Random=None) -> None:
+        self.size:int = size
+        self.rng:random.Random = rng
+        self.polarity:int = polarity
+        self.lazy:bool = lazy
+        self.ships:dict[str,int] = dict(ships)
+        self.cap:int = _run_cap(ships, size)
+        self.checked:AttackedSquares = AttackedSquares(size)
+        #the weight of each square, indexed by row * size + col.
+        self.sampler:WeightedSampler = WeightedSampler([0] * (size * size))
+        #the first row of each chunk of rows still to be rescored.
+        self.stale:list[int] = []
+        self.rebuild()
+
+    def rebuild(self, rows:tuple[int,int]=None) -> None:
+
+        '''Rescores the board. Only needed when the cap or polarity changes.
+
+        :param rows: the first row and the row after the last to rescore, or None for every row
+        :type rows: tuple
+        '''
+
+        start, stop = rows or (0, self.size)
+        if _numpy() is not None and rows is None:
+            scores = SCORE_CACHE.scores(self.checked, self.ships, self.polarity, self.size).tolist()
+        elif _numpy() is not None:
+            scores = score_squares_vectorised(self.checked, self.ships,
+                                              self.polarity, self.size, (start, stop)).tolist()
+        else:
+            scores = score_squares(self.checked, self.ships, self.polarity, self.size,
+                                   (start, stop))
+        for i in range(start, stop):
+            row = scores[i - start]
+            for j in range(self.size):
+                if self._eligible((i,j)):
+                    row[j] += (self.rng or random).randint(5,7)
+                else:
+                    row[j] = 0
+
+        if rows is None:
+            self.sampler = WeightedSampler(chain.from_iterable(scores))
+        else:
+            for i in range(start, stop):
+                for j, weight in enumerate(scores[i - start]):
+                    self.sampler.set(i * self.size + j, weight)
+
+    def refresh(self, deadline:float=None) -> None:
+
+        '''Rescores stale chunks of rows until the deadline passes.
+
+        :param deadline: the time.perf_counter() time to stop at, or None to rescore every chunk
+        :type deadline: float
+        '''
+
+        height = _chunk_height(self.size)
+        while self.stale and (deadline is None or time.perf_counter() < deadline):
+            start = self.stale.pop()
+            self.rebuild((start, min(start + height, self.size)))
+
+    def _eligible(self, square:tuple[int,int]) -> bool:
+        return (square[0] + square[1]) % self.polarity == 1 and square not in self.checked
+
+    def weight(self, square:tuple[int,int]) -> int:
+
+        '''Returns the weight of a square.'''
+
+        return self.sampler.weights[square[0] * self.size + square[1]]
+
+    def _rescore(self, square:tuple[int,int]) -> None:
+        weight = 0
+        if self._eligible(square):
+            weight = (_score_square(square, self.checked, self.cap, self.size)
+                      + (self.rng or random).randint(5,7))
+        self.sampler.set(square[0] * self.size + square[1], weight)
+
+    def mark(self, square:tuple[int,int]) -> None:
+
+        '''Records a shot and rescores the squares whose free runs it shortens.
+
+        :param square: the square attacked
+        :type square: tuple
+        '''
+
+        if square in self.checked:
+            return
+        self.checked.append(square)
+        row, col = square
+        self._rescore(square)
+        for offset in range(1, self.cap + 1):
+            for neighbour in [(row - offset, col), (row + offset, col),
+                              (row, col - offset), (row, col + offset)]:
+                if validate_square(neighbour, self.size):
+                    self._rescore(neighbour)
+
+    def update(self, ships:dict[str,int], polarity:int=None) -> None:
+
+        '''Rescores the board if a sunk ship changed the longest ship or the polarity.
+
+        :param ships: the ships of the player being attacked
+        :type ships: dict
+        :param polarity: the new polarity, or None to keep the current one
+        :type polarity: int
+        '''
+
+        cap = _run_cap(ships, self.size)
+        polarity = polarity or self.polarity
+        if cap != self.cap or polarity != self.polarity:
+            self.ships = dict(ships)
+            self.cap = cap
+            self.polarity = polarity
+            if self.lazy:
+                self.stale = list(range(0, self.size, _chunk_height(self.size)))
+                (self.rng or random).shuffle(self.stale)
+            else:
+                self.rebuild()
+
+    def choose(self, deadline:float=None) -> tuple[int,int]:
+
+        '''Chooses a square at random, weighted by its score.
+        Stale rows are rescored first, for as long as the deadline allows.
+
+        :param deadline: the time.perf_counter() time by which a square must be chosen
+        :type deadline: float
+        :return: the square chosen, or None if no square of the right polarity is left
+        :rtype: tuple
+        '''
+
+        self.refresh(deadline)
+        square = self.sampler.sample(self.rng)
+        if square is None:
+            return None
+        return divmod(square, self.size)
+
+class Frontier:
+
+    '''The squares the AI attacks next to sink the ships it has hit.
+
+    For each ship that has been hit but not sunk, in the order they were first hit,
+    the squares next to its hits that it could still cover are kept in a deque,
+    ordered by how many of the ship's possible placements cover them.
+    Squares are pruned as shots land, so the next square is always at the front of
+    the first deque and is found in O(1) time.
+
+    Squares are stored by their id, row * size + col, and the frontier pickles to
+    the ids of each ship's hits and candidates and of every square attacked.
+
+    :param size: the size of the board
+    :type size: int
+    :param rng: the random number generator of the game. Defaults to the random module.
+    :type rng: random.Random
+    '''
+
+    def __init__(self, size:int, rng:random.Random=None) -> None:
+        self.size:int = size
+        self.rng:random.Random = rng
+        self.attacked:AttackedSquares = AttackedSquares(size)
+        #the squares each ship afloat has been hit on, and the squares to try next.
+        self.hits:dict[str,array] = {}
+        self.candidates:dict[str,deque] = {}
+
+    def __len__(self) -> int:
+        return len(self.candidates)
 
+    def next(self) -> tuple[int,int]:
 
+        '''Returns the square to attack next.
 
+        :return: the square, or None if no ship is being sunk.
+        :rtype: tuple
+        '''
+
+        for candidates in self.candidates.values():
+            return divmod(candidates[0], self.size)
+        return None
+
+    def record(self, square:tuple[int,int], name:str, ships:dict[str,int]) -> None:
+
+        '''Records one of the AI's shots.
+
+        :param square: the square attacked
+        :type square: tuple
+        :param name: the name of the ship hit, or None for a miss
+        :type name: str
+        :param ships: the ships of the player being attacked, after the shot
+        :type ships: dict
+        '''
+
+        self.discard(square)
+        if not name:
+            return
+        if ships[name] == 0:
+            self.hits.pop(name, None)
+            self.candidates.pop(name, None)
+            return
+        self.hits.setdefault(name, array('I')).append(self.attacked.cell(square))
+        self.candidates[name] = self._candidates(self.hits[name], ships[name] + len(self.hits[name]))
+        if not self.candidates[name]:
+            del self.candidates[name]
+
+    def discard(self, square:tuple[int,int]) -> None:
+
+        '''Marks a square as attacked, removing it from every ship's candidates.
+
+        :param square: the square attacked
+        :type square: tuple
+        '''
+
+        if not validate_square(square, self.size) or square in self.attacked:
+            return
+        self.attacked.append(square)
+        cell = self.attacked.cell(square)
+        for name in list(self.candidates):
+            candidates = self.candidates[name]
+            if cell in candidates:
+                candidates.remove(cell)
+                #every square the ship could still be on has been attacked.
+                if not candidates:
+                    del self.candidates[name]
+
+    def _candidates(self, hits:array, length:int) -> deque:
+
+        '''Orders the unattacked squares next to a ship's hits by how likely they are to be hit.'''
+
+        size = self.size
+        hit_set = set(hits)
+        row, col = divmod(hits[0], size)
+        counts = {}
+        for step, position in [(1, col), (size, row)]:
+            for start in range(position - length + 1, position + 1):
+                if start < 0 or start + length > size:
+                    continue
+                first = hits[0] + (start - position) * step
+                cells = [first + k * step for k in range(length)]
+                if not hit_set.issubset(cells):
+                    continue
+                if any(cell not in hit_set and divmod(cell, size) in self.attacked
+                       for cell in cells):
+                    continue
+                for cell in cells:
+                    if cell not in hit_set:
+                        counts[cell] = counts.get(cell, 0) + 1
+
+        neighbours = {hit + offset for hit in hits for offset in (-size, size)}
+        neighbours.update(hit + offset for hit in hits for offset in (-1, 1)
+                          if (hit + offset) // size == hit // size)
+        candidates = [cell for cell in counts if cell in neighbours]
+        #shuffled first, so that squares that are equally likely are tried in a random order.
+        (self.rng or random).shuffle(candidates)
+        candidates.sort(key=counts.get, reverse=True)
+        return deque(candidates)
+
+    def __getstate__(self) -> tuple:
+        return (self.size, self.rng, self.attacked,
+                [(name, hits.tobytes(), array('I', self.candidates.get(name, ())).tobytes())
+                 for name, hits in self.hits.items()])
+
+    def __setstate__(self, state:tuple) -> None:
+        self.size, self.rng, self.attacked, ships = state
+        self.hits = {}
+        self.candidates = {}
+        for name, hits, candidates in ships:
+            self.hits[name] = array('I')
+            self.hits[name].frombytes(hits)
+            if candidates:
+                cells = array('I')
+                cells.frombytes(candidates)
+                self.candidates[name] = deque(cells)
 
 def advanced_ai_attack(coords:tuple[int,int],
                        board:list[list[str]],
                        ships:dict[str,int],
-                       hunt:list[dict[str,tuple[int,int],tuple[int,int],tuple[int,int]]],
-                       difficulty:[str]) -> list[dict[str,tuple[int,int],
-                                                      tuple[int,int],tuple[int,int]]]:
+                       hunt:Frontier,
+                       difficulty:[str],
+                       density_map:DensityMap=None,
+                       targeter=None,
+                       events=None,
+                       rng:random.Random=None) -> Frontier:
 
     '''Replaces the 'attack' function for the more advanced AI.
 
     :param coords: the square being attacked.
     :type coords: tuple
-    :param board: the board being attacked.
+    :param board: the board being attacked, as a list of lists or a BitBoard.
     :type board: list
     :param ships: the ships of the player being attacked.
     :type ships: dict
-    :param hunt: the list of ships that have been found by the AI
-    :type hunt: list
-
-    :return: the list of ships which have been found but not sunk
-    :rtype: list
+    :param hunt: the ships that have been found by the AI.
+        An empty list is replaced with a new Frontier, which is returned.
+    :type hunt: Frontier
+    :param density_map: the AI's density map, updated when a ship is sunk
+    :type density_map: DensityMap
+    :param targeter: the AI's targeter, which is told the result of the shot
+    :type targeter: targeting.ShotTracker
+    :param events: the sink that the shot, hit, miss and sunk events are sent to.
+        Nothing is sent if it is None.
+    :type events: events.EventBus
+    :param rng: the random number generator of the game, used by a new Frontier.
+        Defaults to the random module.
+    :type rng: random.Random
+
+    :return: the ships which have been found but not sunk
+    :rtype: Frontier
 
     '''
 
     row,col = coords[0], coords[1]
-    name:str = board[row][col]
+    #older callers start the game with an empty hunt list.
+    if isinstance(hunt, list) and not hunt:
+        hunt = Frontier(len(board), rng)
+    emit(events, SHOT, AI, (row, col))
+    if isinstance(board, BitBoard):
+        name:str = board.fire((row, col))
+    else:
+        name:str = board[row][col]
+    if targeter:
+        targeter.record((row, col), name)
 
+    if name:
+        ships[name] -= 1
+        if not isinstance(board, BitBoard):
+            board[row][col] = None
     if difficulty != 'easy':
-        #if there has been a hit
-        if name:
-            #if there is a ship being looked for
-            if hunt:
+        hunt.record((row, col), name, ships)
 
-                #if the ship is the one being looked for
-                if hunt[0]['name'] == name:
+    if name:
+        emit(events, HIT, AI, (row, col), name)
+        if ships[name] == 0:
+            if density_map:
+                density_map.update(ships, advanced_polarity(difficulty, ships))
+            emit(events, SUNK, AI, (row, col), name)
+        return hunt
+    emit(events, MISS, AI, (row, col))
+    return hunt
 
-                    #if the orientation has not been found
-                    if hunt[0]['orientation'] == (0,0):
-                        if abs(coords[0] - hunt[0]['lsquare'][0]) == 1:
-                            hunt[0]['orientation'] = (1,0)
-                        else:
-                            hunt[0]['orientation'] = (0,1)
 
-                    if sum(coords) - sum(hunt[0]['lsquare']) > 0:
-                        hunt[0]['rsquare'] = coords
-                    else:
-                        hunt[0]['lsquare'] = coords
+class ShotPool:
 
+    '''Shuffled pools of unattacked squares, one for each parity class.
 
+    Squares are drawn by popping from the end of a pool, so a draw takes O(1) time
+    however full the board is. Squares attacked by other means (such as while sinking
+    a ship) are skipped when they are popped.
+    When the pool for the requested parity is empty, the other pools are used instead.
 
-                else:
+    :param size: the size of the board
+    :type size: int
+    :param classes: the number of parity classes, where square (i, j) is in class (i + j) % classes
+    :type classes: int
+    :param rng: the random number generator of the game. Defaults to the random module.
+    :type rng: random.Random
+    '''
 
-                    #checks if the ship is a new ship
-                    index = None
-                    for i in range(1,len(hunt)):
-                        if hunt[i]['name'] == name:
-                            index = i
-
-                    #if the ship is not a new ship
-                    if index:
-
-                        #if the ship's orientation has been found
-                        if hunt[index]['orientation'] != (0,0):
-                            if hunt[index]['lsquare'] - hunt[index]['orientation'][0] == coords:
-                                hunt[index]['lsquare'] = coords
-                            elif hunt[index]['rsquare'] + hunt[index]['orientation'][1] == coords:
-                                hunt[index]['rsquare'] = coords
-                        else:
-                            hunt[index]['lsquare'] = coords
-
-                    #if the ship is a new ship
-                    else:
-                        hunt.append({'name':name, 'lsquare':coords,
-                                     'rsquare':coords, 'orientation':(0,0)})
+    def __init__(self, size:int, classes:int=2, rng:random.Random=None) -> None:
+        self.size:int = size
+        self.rng:random.Random = rng
+        self.pools:list[array] = [array('I') for _ in range(classes)]
+        for cell in range(size * size):
+            self.pools[sum(divmod(cell, size)) % classes].append(cell)
+        for pool in self.pools:
+            (rng or random).shuffle(pool)
+
+    def draw(self, ai_checked:list[tuple[int,int]], parity:int=None) -> tuple[int,int]:
+
+        '''Draws an unattacked square.
+
+        :param ai_checked: the squares that the ai has already attacked.
+        :type ai_checked: list or AttackedSquares
+        :param parity: the preferred parity class, or None for any square.
+        :type parity: int
+        :return: the square drawn, or None if every square has been attacked.
+        :rtype: tuple
+        '''
+
+        if parity is None:
+            #picks a pool in proportion to its size so that every square is equally likely.
+            weights = [len(pool) for pool in self.pools]
+            if not sum(weights):
+                return None
+            order = (self.rng or random).choices(range(len(self.pools)), weights)
+        else:
+            order = [parity % len(self.pools)]
+        order += [k for k in range(len(self.pools)) if k not in order]
 
-            else:
-                hunt.append({'name':name, 'lsquare':coords,
-                             'rsquare':coords, 'orientation':(0,0)})
+        for k in order:
+            pool = self.pools[k]
+            while pool:
+                square = divmod(pool.pop(), self.size)
+                if square not in ai_checked:
+                    return square
+        return None
 
-    if name:
-        ships[name] -= 1
-        board[row][col] = None
-        print(f'AI hit battleship at ({col},{row})!')
-        if ships[name] == 0:
-            for i in hunt:
-                if ships[i['name']] == 0:
-                    hunt.remove(i)
-            print(f'{name} sunk!')
-        return hunt
-    print(f'AI missed at ({col},{row})!')
-    return hunt
+def create_shot_pool(difficulty:str, size:int, rng:random.Random=None) -> ShotPool:
 
+    '''Creates the shot pool used by the AI for a game.
+
+    :param difficulty: the difficulty of the game
+    :type difficulty: str
+    :param size: the size of the board
+    :type size: int
+    :param rng: the random number generator of the game. Defaults to the random module.
+    :type rng: random.Random
+    :return: the shot pool
+    :rtype: ShotPool
+    '''
+
+    #the easy AI has no parity, so every square goes in a single pool.
+    return ShotPool(size, 1 if difficulty == 'easy' else 2, rng)
 
 def choose_square(ai_checked:list[tuple[int,int]],
                   polarity:int,
-                  size:int) -> tuple[int,int]:
+                  size:int,
+                  shot_pool:ShotPool=None,
+                  rng:random.Random=None) -> tuple[int,int]:
 
     '''Chooses square randomly. separate implementation for the more advanced ai
     since the parameters for the generate_attack function are specified
     in the specification.
 
     :param ai_checked: the squares that the ai has already attacked.
-    :type ai_checked: list
+    :type ai_checked: list or AttackedSquares
     :param polarity: the polarity that the ai attacks with.
     :type polarity: int
     :param size: the size of the board.
     :type size: int
+    :param shot_pool: the AI's shot pool. If given, the square is drawn from it.
+    :type shot_pool: ShotPool
+    :param rng: the random number generator of the game. Defaults to the random module.
+    :type rng: random.Random
     :return: the square chosen.
     :rtype: tuple
 
     '''
+    if shot_pool:
+        return shot_pool.draw(ai_checked, 1 if polarity else None)
+
+    rng = rng or random
     while True:
         #Generates random coordinates.
-        (x_coord,y_coord) = (random.randint(0,size-1), random.randint(0,size-1))
+        (x_coord,y_coord) = (rng.randint(0,size-1), rng.randint(0,size-1))
         #Validates random coordinates.
         if (x_coord,y_coord) not in ai_checked:
             if polarity:
@@ -249,83 +1212,120 @@ def choose_square(ai_checked:list[tuple[int,int]],
             else:
                 return (x_coord,y_coord)
 
-def generate_attack(size:int=10) -> tuple[int,int]:
+def generate_attack(size:int=10, rng:random.Random=None) -> tuple[int,int]:
 
     '''Chooses square randomly.
 
     :param size: the size of the board.
     :type size: int
+    :param rng: the random number generator of the game. Defaults to the random module.
+    :type rng: random.Random
     :return: the generated square.
     :rtype: tuple
     '''
 
-    new_square = (random.randint(0,size-1), random.randint(0,size-1))
+    rng = rng or random
+    new_square = (rng.randint(0,size-1), rng.randint(0,size-1))
     return new_square
 
 def generate_advanced_attack(ai_checked:list[tuple[int,int]],
                              difficulty:str,
-                             hunt:list[dict[str,tuple[int,int],tuple[int,int],tuple[int,int]]],
+                             hunt:Frontier,
                              ships:dict[str,int],
-                             size:int):
+                             size:int,
+                             density_map:DensityMap=None,
+                             shot_pool:ShotPool=None,
+                             time_budget:float=None,
+                             opening=None,
+                             targeter=None,
+                             rng:random.Random=None):
 
     '''Replaces the 'generate_attack' function for the more advanced AI
 
     :param ai_checked: the list of squares that the AI has checked
-    :type ai_checked: list
+    :type ai_checked: list or AttackedSquares
     :param difficulty: the difficulty of the game
     :type difficulty: string
-    :param hunt: the list of ships that the AI has found
-    :type hunt: list
+    :param hunt: the ships that the AI has found
+    :type hunt: Frontier
     :param ships: the ships of the player being attacked
     :type ships: dict
     :param size: the size of the board.
     :type size: int
+    :param density_map: the AI's density map, used instead of rescoring the board each move
+    :type density_map: DensityMap
+    :param shot_pool: the AI's shot pool, used by the medium and hard difficulties
+    :type shot_pool: ShotPool
+    :param time_budget: the time allowed to choose a square in seconds, or None for no limit.
+        The very hard and extreme AIs use the best square found in time,
+        or a random square of the right parity if they found none.
+    :type time_budget: float
+    :param opening: the opening book line being followed, whose squares are used until the AI's first hit
+    :type opening: opening_book.OpeningLine
+    :param targeter: the AI's targeter, which chooses the square whenever it can,
+        such as when the endgame can be solved exactly
+    :type targeter: targeting.ShotTracker
+    :param rng: the random number generator of the game. Defaults to the random module.
+    :type rng: random.Random
     :return: the square generated by the AI, the list of squares that the AI has checked
     :rtype: tuple, list
 
     '''
 
-    DIRECTIONS = [(1,0), (-1,0), (0,1), (0,-1)]
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    #the targeter accounts for every hit and miss, so its square is used over the frontier.
+    new_square = targeter.choose(ai_checked, ships, deadline) if targeter else None
+    from_book = False
 
     #Loops until a good square is found.
     while True:
 
+        #the square was chosen by the targeter.
+        if new_square:
+            pass
         #if there is not a ship on the queue.
-        if not hunt:
-            if difficulty == 'medium':
-                new_square = choose_square(ai_checked,1,size)
+        elif not hunt:
+            new_square = opening.next(ai_checked, ships) if opening else None
+            #the square was played in advance by the opening book.
+            if new_square:
+                from_book = True
+            elif difficulty == 'medium':
+                new_square = choose_square(ai_checked,1,size,shot_pool,rng)
             elif difficulty == 'hard':
-                new_square = choose_square(ai_checked,2,size)
-            elif difficulty == 'very hard':
-                new_square = choose_advanced_square(ai_checked, ships, 2, size)
-            elif difficulty == 'extreme':
+                new_square = choose_square(ai_checked,2,size,shot_pool,rng)
+            elif density_map:
+                new_square = density_map.choose(deadline)
+                #every square of the right polarity has been checked.
+                if not new_square:
+                    new_square = choose_square(ai_checked,0,size,shot_pool,rng)
+            elif difficulty in ['very hard', 'extreme', 'monte carlo']:
                 new_square = choose_advanced_square(ai_checked, ships,
-                                                    max(min(ships.values()), 2),size)
+                                                    advanced_polarity(difficulty, ships), size,
+                                                    deadline, rng)
+                #no square was scored in time, so the cheap parity pick is used instead.
+                if not new_square:
+                    new_square = choose_square(ai_checked,2 if shot_pool else 0,size,shot_pool,rng)
         #If there is a ship on the queue.
         else:
-            direction_choice = random.choice([0,1])
-
-
-            #If the direction of the ship is known.
-            if hunt[0]['orientation'] != (0,0):
-                if direction_choice:
-                    new_square = (hunt[0]['lsquare'][0] - hunt[0]['orientation'][0],
-                                  hunt[0]['lsquare'][1] - hunt[0]['orientation'][1])
-                else:
-                    new_square = (hunt[0]['rsquare'][0] + hunt[0]['orientation'][0],
-                                  hunt[0]['rsquare'][1] + hunt[0]['orientation'][1])
-            else:
-                direction = random.choice(DIRECTIONS)
-                new_square = (hunt[0]['lsquare'][0] + direction[0],
-                              hunt[0]['lsquare'][1] + direction[1])
+            new_square = hunt.next()
 
         #If the square has already been checked.
         if new_square in ai_checked or not validate_square(new_square,size):
-            pass
+            #the frontier missed the shot somehow, so it is told now.
+            if hunt:
+                hunt.discard(new_square)
+            #the book no longer matches the game, so it is not used again.
+            if from_book:
+                opening.book = None
+                opening = None
+            new_square = None
+            from_book = False
 
         #If the square has not been checked.
         else:
             ai_checked.append(new_square)
+            if density_map:
+                density_map.mark(new_square)
             return new_square, ai_checked
 
 def ai_opponent_game_loop() -> None:
@@ -333,59 +1333,69 @@ def ai_opponent_game_loop() -> None:
     '''Ai game loop. takes nothing and returns nothing.
 
     '''
-    ai_checked = []
+    ai_checked = AttackedSquares(BOARD_SIZE)
     if DIFFICULTY != 'easy':
-        hunt = []
+        hunt = Frontier(BOARD_SIZE, RNG)
     print('Welcome to Battleships!')
     print(f'Opponent set to {DIFFICULTY} AI.')
     player_name = input('Please enter your username. ')
+    events = PrintSink()
 
     players[player_name] = {'board': initialise_board(BOARD_SIZE), 'ships': create_battleships()}
     players['ai'] = {'board': initialise_board(BOARD_SIZE), 'ships': create_battleships()}
     players[player_name]['board'] = place_battleships(players[player_name]['board'],
-                                                    players[player_name]['ships'], 'custom')
+                                                    players[player_name]['ships'], 'custom', RNG)
 
     players['ai']['board'] = place_battleships(players['ai']['board'],
-                                             players['ai']['ships'], 'random')
+                                             players['ai']['ships'], 'random', RNG)
+    density_map = create_density_map(DIFFICULTY, players[player_name]['ships'], BOARD_SIZE,
+                                     TIME_BUDGET, RNG)
+    shot_pool = create_shot_pool(DIFFICULTY, BOARD_SIZE, RNG)
+    opening = create_opening(DIFFICULTY, players[player_name]['ships'], BOARD_SIZE, rng=RNG)
+    targeter = create_targeter(DIFFICULTY, players[player_name]['ships'], BOARD_SIZE,
+                               TARGETING_SETTINGS, RNG)
 
 
     while True:
         coords = cli_coordinates_input()
         if validate_square(coords, BOARD_SIZE):
-            attack(coords,players['ai']['board'], players['ai']['ships'])
+            attack(coords,players['ai']['board'], players['ai']['ships'], events, player_name)
 
             #Checks if the player has won.
             if wintest(players['ai']['ships']):
-                print(f' {player_name} wins!')
+                emit(events, GAME_OVER, player_name)
                 break
 
             #Generates AI attack
             if DIFFICULTY == 'easy':
-                while True:
-                    aicoords = generate_attack(BOARD_SIZE)
-                    if aicoords not in ai_checked:
-                        break
+                aicoords = shot_pool.draw(ai_checked)
             else:
                 aicoords, ai_checked = generate_advanced_attack(ai_checked,DIFFICULTY,
                                                                 hunt,players[player_name]['ships'],
-                                                                BOARD_SIZE)
+                                                                BOARD_SIZE, density_map, shot_pool,
+                                                                TIME_BUDGET, opening, targeter,
+                                                                RNG)
             #Executes AI attack.
             if DIFFICULTY == 'easy':
                 attack(aicoords,players[player_name]["board"],
-                       players[player_name]["ships"])
+                       players[player_name]["ships"], events, AI)
                 ai_checked.append(aicoords)
             else:
                 hunt = advanced_ai_attack(aicoords,players[player_name]['board'],
-                                          players[player_name]['ships'],hunt,DIFFICULTY)
+                                          players[player_name]['ships'],hunt,DIFFICULTY,
+                                          density_map, targeter, events, RNG)
 
             #Checks if the opponent has won.
             if wintest(players[player_name]["ships"]):
-                print('AI Potemkin wins! ')
+                emit(events, GAME_OVER, AI)
                 break
             print_board(players[player_name]['board'])
 
 #Initialises game
 if __name__ == '__main__':
+    from opening_book import create_opening
+    from targeting import create_targeter, load_settings
+    setup_logging()
 
     players = {}
 
@@ -397,6 +1407,10 @@ if __name__ == '__main__':
     BOARD_SIZE = config_data['size']
     DIFFICULTY = config_data['difficulty']
     DIFFICULTY, BOARD_SIZE = validate_config_data(DIFFICULTY,BOARD_SIZE)
+    TIME_BUDGET = validate_time_budget(config_data.get('move_time_budget_ms'))
+    TARGETING_SETTINGS = load_settings(config_data)
+    RNG, SEED = create_rng(config_data.get('seed'))
+    logging.info('game seed %d', SEED)
 
 
 
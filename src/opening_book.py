@@ -0,0 +1,256 @@
+#Copyright (C) 2023 megiddon
+#This program is licensed under the GNU GPL 3.0 or later.
+#This is contained in full in the file LICENSE.txt
+
+'''Precomputed opening moves for the very hard and extreme AIs.
+
+Until the AI hits a ship, its moves only depend on the board size, the fleet and the
+polarity, so they can be played in advance. A book holds a number of variations, each
+being the first few squares the AI would attack if every shot missed. A game follows one
+variation, chosen at random, until its first hit.
+
+Books are stored in /src/opening_books, one file per board size, fleet and polarity,
+and are memory-mapped so that every process shares a single copy.
+Generate the book for the current config.json and battleships.txt with:
+
+python opening_book.py [--moves 10] [--variations 256]
+'''
+
+import logging
+import mmap
+import os
+import random
+import struct
+import threading
+
+from mp_game_engine import DensityMap, advanced_polarity
+
+BOOK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opening_books')
+MOVES = 10
+VARIATIONS = 256
+
+#magic, version, size, polarity, moves, variations, followed by
+#variations * moves little-endian uint32 square ids (row * size + col).
+_HEADER = struct.Struct('<4sIIIII')
+_MAGIC = b'BSOB'
+_VERSION = 1
+
+#books that have already been opened, keyed by filename.
+_books:dict[str,'OpeningBook'] = {}
+_books_lock = threading.Lock()
+
+def book_filename(size:int, ships:dict[str,int], polarity:int, directory:str=BOOK_DIR) -> str:
+
+    '''Returns the file a book is stored in.
+
+    :param size: the size of the board.
+    :type size: int
+    :param ships: the fleet. Only the ship lengths matter.
+    :type ships: dict
+    :param polarity: the polarity the AI attacks with.
+    :type polarity: int
+    :param directory: the directory books are stored in.
+    :type directory: str
+    :return: the path of the book.
+    :rtype: str
+    '''
+
+    lengths = '-'.join(str(length) for length in sorted(ships.values()))
+    return os.path.join(directory, f'{size}_{polarity}_{lengths}.book')
+
+class OpeningBook:
+
+    '''A memory-mapped opening book.
+
+    :param filename: the file the book is stored in.
+    :type filename: str
+    :raises ValueError: if the file is not a valid book.
+    '''
+
+    def __init__(self, filename:str) -> None:
+        with open(filename, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size:
+            raise ValueError(f'{filename} is not an opening book')
+        magic, version, self.size, self.polarity, self.moves, self.variations = \
+            _HEADER.unpack_from(self._map)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f'{filename} is not an opening book')
+        if len(self._map) != _HEADER.size + 4 * self.moves * self.variations:
+            raise ValueError(f'{filename} is truncated')
+
+    def square(self, variation:int, move:int) -> tuple[int,int]:
+
+        '''Returns a square of a variation.
+
+        :param variation: the index of the variation.
+        :type variation: int
+        :param move: the index of the move within the variation.
+        :type move: int
+        :return: the square.
+        :rtype: tuple
+        '''
+
+        offset = _HEADER.size + 4 * (variation * self.moves + move)
+        square = struct.unpack_from('<I', self._map, offset)[0]
+        return (square // self.size, square % self.size)
+
+class OpeningLine:
+
+    '''The variation of an opening book being followed by one game.
+
+    The line is followed for as long as the AI has attacked exactly the squares of the
+    variation and the player's fleet is untouched, so it ends at the AI's first hit.
+
+    :param book: the book.
+    :type book: OpeningBook
+    :param variation: the index of the variation being followed.
+    :type variation: int
+    :param ships: the player's ships at the start of the game.
+    :type ships: dict
+    '''
+
+    def __init__(self, book:OpeningBook, variation:int, ships:dict[str,int]) -> None:
+        self.book:OpeningBook = book
+        self.variation:int = variation
+        self.remaining:int = sum(ships.values())
+        #the number of the AI's shots already checked against the variation.
+        self.followed:int = 0
+
+    def next(self, ai_checked:list[tuple[int,int]], ships:dict[str,int]) -> tuple[int,int]:
+
+        '''Returns the next square of the variation.
+
+        :param ai_checked: the squares the AI has attacked.
+        :type ai_checked: list or AttackedSquares
+        :param ships: the player's ships.
+        :type ships: dict
+        :return: the next square, or None once the line has ended.
+        :rtype: tuple
+        '''
+
+        move = len(ai_checked)
+        if self.book is None or move >= self.book.moves or sum(ships.values()) != self.remaining:
+            self.book = None
+            return None
+        #the line ends if the AI has attacked any square other than those of the variation,
+        #such as a square chosen by the endgame solver.
+        for index in range(self.followed, move):
+            if ai_checked[index] != self.book.square(self.variation, index):
+                self.book = None
+                return None
+        self.followed = move
+        square = self.book.square(self.variation, move)
+        if square in ai_checked:
+            self.book = None
+            return None
+        return square
+
+def load_book(size:int, ships:dict[str,int], polarity:int, directory:str=BOOK_DIR) -> OpeningBook:
+
+    '''Opens the book for a board size, fleet and polarity, reusing it if it is already open.
+
+    :return: the book, or None if there is no book for them.
+    :rtype: OpeningBook
+    '''
+
+    filename = book_filename(size, ships, polarity, directory)
+    with _books_lock:
+        if filename in _books:
+            return _books[filename]
+        try:
+            book = OpeningBook(filename)
+        except FileNotFoundError:
+            book = None
+        except (OSError, ValueError):
+            logging.error('opening book %s could not be read', filename)
+            book = None
+        _books[filename] = book
+        return book
+
+def create_opening(difficulty:str, ships:dict[str,int], size:int,
+                   directory:str=BOOK_DIR, rng:random.Random=None) -> OpeningLine:
+
+    '''Chooses the opening variation for a game.
+
+    :param difficulty: the difficulty of the game.
+    :type difficulty: str
+    :param ships: the ships of the player being attacked.
+    :type ships: dict
+    :param size: the size of the board.
+    :type size: int
+    :param directory: the directory books are stored in.
+    :type directory: str
+    :param rng: the random number generator of the game. Defaults to the random module.
+    :type rng: random.Random
+    :return: the variation to follow, or None for difficulties that do not use a book
+        or if there is no book for the board size and fleet.
+    :rtype: OpeningLine
+    '''
+
+    if difficulty not in ['very hard', 'extreme']:
+        return None
+    book = load_book(size, ships, advanced_polarity(difficulty, ships), directory)
+    if book is None:
+        return None
+    return OpeningLine(book, (rng or random).randrange(book.variations), ships)
+
+def generate_book(size:int, ships:dict[str,int], polarity:int, moves:int=MOVES,
+                  variations:int=VARIATIONS, directory:str=BOOK_DIR) -> str:
+
+    '''Plays the AI's opening moves against an empty board and writes them to a book.
+
+    :param size: the size of the board.
+    :type size: int
+    :param ships: the fleet.
+    :type ships: dict
+    :param polarity: the polarity the AI attacks with.
+    :type polarity: int
+    :param moves: the number of moves in each variation.
+    :type moves: int
+    :param variations: the number of variations.
+    :type variations: int
+    :param directory: the directory books are stored in.
+    :type directory: str
+    :return: the path of the book.
+    :rtype: str
+    '''
+
+    #a variation cannot be longer than the number of squares the AI would attack.
+    moves = min(moves, sum(1 for i in range(size) for j in range(size)
+                           if (i + j) % polarity == 1))
+    squares = []
+    for _ in range(variations):
+        density_map = DensityMap(size, ships, polarity)
+        for _ in range(moves):
+            row, col = density_map.choose()
+            density_map.mark((row, col))
+            squares.append(row * size + col)
+
+    os.makedirs(directory, exist_ok=True)
+    filename = book_filename(size, ships, polarity, directory)
+    with open(filename, 'wb') as file:
+        file.write(_HEADER.pack(_MAGIC, _VERSION, size, polarity, moves, variations))
+        file.write(struct.pack(f'<{len(squares)}I', *squares))
+    with _books_lock:
+        _books.pop(filename, None)
+    return filename
+
+if __name__ == '__main__':
+    import argparse
+
+    from components import get_json_data, create_battleships
+    from logging_setup import setup_logging
+    from mp_game_engine import validate_config_data
+
+    parser = argparse.ArgumentParser(description='Generates opening books for the AI.')
+    parser.add_argument('--moves', type=int, default=MOVES)
+    parser.add_argument('--variations', type=int, default=VARIATIONS)
+    args = parser.parse_args()
+    setup_logging()
+
+    config_data = get_json_data('config.json') or {'size': 10, 'difficulty': 'hard'}
+    _, board_size = validate_config_data(config_data['difficulty'], config_data['size'])
+    fleet = create_battleships()
+    for book_polarity in sorted({advanced_polarity(name, fleet) for name in ['very hard', 'extreme']}):
+        print(generate_book(board_size, fleet, book_polarity, args.moves, args.variations))
@@ -0,0 +1,219 @@
+#Copyright (C) 2023 megiddon
+#This program is licensed under the GNU GPL 3.0 or later.
+#This is contained in full in the file LICENSE.txt
+
+'''Opt-in profiling of the AI and the web-based game.
+
+Setting BATTLESHIPS_PROFILE_DIR profiles a sample of calls to the wrapped functions with
+cProfile. The samples of each function are added together and written to a single
+.prof file per process every so often and at exit. Setting BATTLESHIPS_SLOW_MS logs the
+stack and inputs of any call that takes longer than that many milliseconds.
+Nothing is wrapped unless one of them is set.
+'''
+
+import atexit
+import functools
+import inspect
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import traceback
+
+PROFILE_DIR_ENV = 'BATTLESHIPS_PROFILE_DIR'
+SAMPLE_RATE_ENV = 'BATTLESHIPS_PROFILE_RATE'
+SLOW_MS_ENV = 'BATTLESHIPS_SLOW_MS'
+#the fraction of calls that are profiled when no rate is given.
+DEFAULT_SAMPLE_RATE = 0.01
+#how often the combined profiles are written out, in seconds.
+FLUSH_INTERVAL = 60
+
+def describe_arguments(function, args:tuple, kwargs:dict) -> str:
+
+    '''Summarises the inputs of a call, giving the length of containers rather than their contents.
+
+    :param function: the function that was called.
+    :type function: function
+    :param args: the positional arguments.
+    :type args: tuple
+    :param kwargs: the keyword arguments.
+    :type kwargs: dict
+    :return: the name and summary of each argument.
+    :rtype: str
+    '''
+
+    try:
+        bound = inspect.signature(function).bind(*args, **kwargs)
+    except (TypeError, ValueError):
+        return f'{len(args)} positional and {len(kwargs)} keyword arguments'
+    summary = []
+    for name, value in bound.arguments.items():
+        if isinstance(value, (int, float, str)) or value is None:
+            summary.append(f'{name}={value!r}')
+        elif hasattr(value, '__len__'):
+            summary.append(f'{name}=<{type(value).__name__} of {len(value)}>')
+        else:
+            summary.append(f'{name}=<{type(value).__name__}>')
+    return ', '.join(summary)
+
+class Profiler:
+
+    '''Wraps functions so that a sample of calls are profiled and slow calls are logged.
+
+    Only one call is profiled at a time, as cProfile profiles cannot nest.
+    A call made while another is being profiled is only timed,
+    and if it was made by the profiled call its cost is included in that profile.
+    The profiles of each wrapped function are added together and written to
+    {name}.{pid}.prof, so the number of files does not grow with the number of calls.
+
+    :param directory: where .prof files are written. None turns off profiling.
+    :type directory: str
+    :param sample_rate: the fraction of calls that are profiled.
+    :type sample_rate: float
+    :param slow_ms: calls taking longer than this many milliseconds are logged.
+        None turns off slow call logging.
+    :type slow_ms: float
+    :param flush_interval: how often the combined profiles are written out, in seconds.
+        They are also written out at exit.
+    :type flush_interval: float
+    '''
+
+    def __init__(self, directory:str=None, sample_rate:float=DEFAULT_SAMPLE_RATE,
+                 slow_ms:float=None, flush_interval:float=FLUSH_INTERVAL) -> None:
+        self.directory:str = directory
+        self.sample_rate:float = sample_rate
+        self.slow_ms:float = slow_ms
+        self.flush_interval:float = flush_interval
+        #separate from the random module, so that sampling does not change seeded games.
+        self._random = random.Random()
+        #held while a call is being profiled.
+        self._profiling = threading.Lock()
+        self._lock = threading.Lock()
+        #the combined profile of each wrapped function, and those with samples not yet written.
+        self._stats:dict = {}
+        self._unwritten:set[str] = set()
+        self._last_flush:float = time.monotonic()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory) or self.slow_ms is not None
+
+    def wrap(self, function, name:str=None, describe=None):
+
+        '''Returns a version of a function that is sampled for profiling and checked for slow calls.
+
+        :param function: the function to wrap.
+        :type function: function
+        :param name: the name used for .prof files and log messages.
+            Defaults to the name of the function.
+        :type name: str
+        :param describe: returns a summary of the inputs of a slow call,
+            given the positional and keyword arguments. Defaults to describe_arguments.
+        :type describe: function
+        :return: the wrapped function.
+        :rtype: function
+        '''
+
+        name = name or function.__name__
+        if describe is None:
+            describe = functools.partial(describe_arguments, function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profile = None
+            if (self.directory and self._random.random() < self.sample_rate
+                    and self._profiling.acquire(blocking=False)):
+                import cProfile
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError:
+                    #another profiler, such as a debugger, is already running.
+                    self._profiling.release()
+                    profile = None
+
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                if profile is not None:
+                    profile.disable()
+                    self._profiling.release()
+                    self._add(profile, name)
+                if self.slow_ms is not None and elapsed_ms > self.slow_ms:
+                    logging.warning('slow call to %s took %.1f ms with %s\n%s', name, elapsed_ms,
+                                    describe(args, kwargs), ''.join(traceback.format_stack()[:-1]))
+        wrapper.profiled = True
+        return wrapper
+
+    def instrument(self, owner, name:str, describe=None) -> None:
+
+        '''Wraps a function wherever it has been imported by name.
+
+        :param owner: the module or class that defines the function.
+        :type owner: module
+        :param name: the name of the function.
+        :type name: str
+        :param describe: returns a summary of the inputs of a slow call.
+        :type describe: function
+        '''
+
+        original = getattr(owner, name)
+        if getattr(original, 'profiled', False):
+            return
+        wrapper = self.wrap(original, name, describe)
+        setattr(owner, name, wrapper)
+        for module in list(sys.modules.values()):
+            if getattr(module, name, None) is original:
+                setattr(module, name, wrapper)
+
+    def _add(self, profile, name:str) -> None:
+        import pstats
+        with self._lock:
+            if name in self._stats:
+                self._stats[name].add(profile)
+            else:
+                self._stats[name] = pstats.Stats(profile)
+            self._unwritten.add(name)
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+
+        '''Writes out the combined profile of every function sampled since the last flush.'''
+
+        with self._lock:
+            self._last_flush = time.monotonic()
+            for name in sorted(self._unwritten):
+                filename = os.path.join(self.directory, f'{name}.{os.getpid()}.prof')
+                try:
+                    self._stats[name].dump_stats(filename)
+                except OSError:
+                    logging.error('could not write profile %s', filename)
+            self._unwritten.clear()
+
+def from_environment() -> Profiler:
+
+    '''Creates a profiler from the BATTLESHIPS_PROFILE_DIR, BATTLESHIPS_PROFILE_RATE
+    and BATTLESHIPS_SLOW_MS environment variables.
+
+    :return: the profiler, or None if profiling and slow call logging are both off.
+    :rtype: Profiler
+    '''
+
+    directory = os.environ.get(PROFILE_DIR_ENV) or None
+    try:
+        sample_rate = float(os.environ.get(SAMPLE_RATE_ENV, DEFAULT_SAMPLE_RATE))
+        slow_ms = float(os.environ[SLOW_MS_ENV]) if os.environ.get(SLOW_MS_ENV) else None
+    except ValueError:
+        logging.error('invalid profiling settings, profiling is turned off')
+        return None
+    profiler = Profiler(directory, sample_rate, slow_ms)
+    return profiler if profiler.enabled else None
@@ -0,0 +1,262 @@
+#Copyright (C) 2023 megiddon
+#This program is licensed under the GNU GPL 3.0 or later.
+#This is contained in full in the file LICENSE.txt
+
+'''In-process storage for the sessions of the web-based game.
+The cookie only carries a session id, and the game itself stays in memory between requests.
+As the boards and AI state are changed in place, requests for the same session are
+handled one at a time.
+'''
+
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+class GameSession(CallbackDict, SessionMixin):
+
+    '''The session of a single client, as seen through flask.session.
+
+    :param initial: the stored contents of the session.
+    :type initial: dict
+    :param sid: the session id.
+    :type sid: str
+    :param new: whether the session has just been created.
+    :type new: bool
+    '''
+
+    def __init__(self, initial:dict=None, sid:str=None, new:bool=False) -> None:
+        def on_update(session):
+            session.modified = True
+        super().__init__(initial, on_update)
+        self.sid:str = sid
+        self.new:bool = new
+        self.modified:bool = False
+        #held from when the session is opened until it is saved.
+        self.lock:threading.Lock = None
+
+    def release(self) -> None:
+
+        '''Lets the next request for this session go ahead.
+        Does nothing if the session is not locked.
+        '''
+
+        lock, self.lock = self.lock, None
+        if lock is not None:
+            lock.release()
+
+class GameStore:
+
+    '''A thread-safe store of sessions, keyed by session id.
+
+    Sessions that have not been used for ttl seconds are removed, either when they are
+    next looked up or by a background thread that runs every reap_interval seconds.
+    When the store is full, the session that was used least recently is removed.
+    Each session also has a lock, so that requests for it can be handled one at a time.
+
+    :param max_games: the most sessions that are kept at once.
+    :type max_games: int
+    :param ttl: how long a session is kept after it was last used, in seconds.
+    :type ttl: float
+    :param reap_interval: how often the background thread removes idle sessions, in seconds.
+    :type reap_interval: float
+    :param clock: the function used to read the time.
+    :type clock: function
+    '''
+
+    def __init__(self, max_games:int=1000, ttl:float=1800, reap_interval:float=60,
+                 clock=time.monotonic) -> None:
+        self.max_games:int = max_games
+        self.ttl:float = ttl
+        self.reap_interval:float = reap_interval
+        self.clock = clock
+        #ordered from least to most recently used.
+        self._games:OrderedDict[str,tuple[dict,float]] = OrderedDict()
+        self._locks:dict[str,threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reaper:threading.Thread = None
+
+    def __len__(self) -> int:
+        return len(self._games)
+
+    def count(self, predicate) -> int:
+
+        '''Counts the stored sessions that a function returns True for.
+
+        :param predicate: takes the contents of a session and returns whether to count it.
+        :type predicate: function
+        :return: the number of sessions counted.
+        :rtype: int
+        '''
+
+        with self._lock:
+            sessions = [data for data, _ in self._games.values()]
+        return sum(1 for data in sessions if predicate(data))
+
+    def lock(self, sid:str) -> threading.Lock:
+
+        '''Gets the lock of a session, creating it if needed.
+
+        :param sid: the session id.
+        :type sid: str
+        :return: the lock.
+        :rtype: threading.Lock
+        '''
+
+        with self._lock:
+            return self._locks.setdefault(sid, threading.Lock())
+
+    def get(self, sid:str) -> dict:
+
+        '''Looks up a session.
+
+        :param sid: the session id.
+        :type sid: str
+        :return: the contents of the session, or None if it does not exist or has expired.
+        :rtype: dict
+        '''
+
+        with self._lock:
+            entry = self._games.get(sid)
+            if entry is None:
+                return None
+            data, last_used = entry
+            now = self.clock()
+            if now - last_used > self.ttl:
+                del self._games[sid]
+                self._locks.pop(sid, None)
+                return None
+            self._games[sid] = (data, now)
+            self._games.move_to_end(sid)
+            return data
+
+    def put(self, sid:str, data:dict) -> None:
+
+        '''Stores a session, removing the least recently used sessions if the store is full.
+
+        :param sid: the session id.
+        :type sid: str
+        :param data: the contents of the session.
+        :type data: dict
+        '''
+
+        with self._lock:
+            self._games[sid] = (data, self.clock())
+            self._games.move_to_end(sid)
+            while len(self._games) > self.max_games:
+                evicted, _ = self._games.popitem(last=False)
+                self._locks.pop(evicted, None)
+                logging.info('session store full, evicted session %s', evicted[:8])
+            if self._reaper is None:
+                self._start_reaper()
+
+    def delete(self, sid:str) -> None:
+
+        '''Removes a session.
+
+        :param sid: the session id.
+        :type sid: str
+        '''
+
+        with self._lock:
+            self._games.pop(sid, None)
+            self._locks.pop(sid, None)
+
+    def reap(self) -> int:
+
+        '''Removes every session that has been idle for longer than the ttl.
+
+        :return: the number of sessions removed.
+        :rtype: int
+        '''
+
+        removed = 0
+        with self._lock:
+            now = self.clock()
+            #the oldest sessions are at the front, so stop at the first one still in use.
+            while self._games:
+                sid, (_, last_used) = next(iter(self._games.items()))
+                if now - last_used <= self.ttl:
+                    break
+                del self._games[sid]
+                self._locks.pop(sid, None)
+                removed += 1
+        if removed:
+            logging.info('removed %s idle sessions', removed)
+        return removed
+
+    def _start_reaper(self) -> None:
+        def run():
+            while not self._stop.wait(self.reap_interval):
+                self.reap()
+        self._reaper = threading.Thread(target=run, name='session-reaper', daemon=True)
+        self._reaper.start()
+
+    def stop(self) -> None:
+
+        '''Stops the background thread.'''
+
+        self._stop.set()
+
+class MemorySessionInterface(SessionInterface):
+
+    '''Flask session interface that keeps sessions in a GameStore.
+
+    The boards, fleets and AI state are kept as python objects between requests,
+    so nothing is pickled or written to disk. A stored session is locked when it is
+    opened and unlocked when it is saved, so a second request for it waits until the
+    first has finished changing the game.
+
+    :param store: the store that holds the sessions.
+    :type store: GameStore
+    '''
+
+    def __init__(self, store:GameStore) -> None:
+        self.store:GameStore = store
+
+    def open_session(self, app, request) -> GameSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            lock = self.store.lock(sid)
+            lock.acquire()
+            data = self.store.get(sid)
+            if data is not None:
+                session = GameSession(data, sid=sid)
+                session.lock = lock
+                return session
+            lock.release()
+        return GameSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session:GameSession, response) -> None:
+        try:
+            self._save(app, session, response)
+        finally:
+            session.release()
+
+    def _save(self, app, session:GameSession, response) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        #the objects in the session are changed in place, so it is always stored again.
+        self.store.put(session.sid, dict(session))
+        if session.new or self.should_set_cookie(app, session):
+            response.set_cookie(name, session.sid,
+                                expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app),
+                                domain=domain,
+                                path=path,
+                                secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
@@ -0,0 +1,173 @@
+#Copyright (C) 2023 megiddon
+#This program is licensed under the GNU GPL 3.0 or later.
+#This is contained in full in the file LICENSE.txt
+
+'''Headless self-play simulator for measuring the strength and speed of the AI difficulties.
+Plays the AI against randomly placed fleets without any input or console output.
+'''
+
+import os
+import random
+import statistics
+import time
+from collections import Counter
+from itertools import repeat
+
+from components import initialise_board, create_battleships, place_battleships, AttackedSquares
+from events import emit, AI, GAME_OVER
+from game_engine import attack, wintest
+from mp_game_engine import generate_advanced_attack, advanced_ai_attack
+from mp_game_engine import create_density_map, create_shot_pool, Frontier
+from opening_book import create_opening
+from targeting import create_targeter
+from logging_setup import setup_logging
+
+DIFFICULTIES = ['easy', 'medium', 'hard', 'very hard', 'extreme', 'monte carlo']
+
+def play_game(difficulty:str, size:int, ships:dict[str,int], seed:int,
+              time_budget:float=None, events=None) -> tuple[int,float]:
+
+    '''Plays a single game of the AI against a randomly placed fleet.
+
+    :param difficulty: the difficulty of the AI.
+    :type difficulty: str
+    :param size: the size of the board.
+    :type size: int
+    :param ships: the ships to be placed.
+    :type ships: dict
+    :param seed: the seed for the game, so that it can be replayed.
+    :type seed: int
+    :param time_budget: the time allowed for each AI move in seconds, or None for no limit.
+    :type time_budget: float
+    :param events: the sink that the game's events are sent to, or None to send none.
+    :type events: events.EventBus
+
+    :return: the number of shots the AI took to win, and the total time spent choosing
+        and making those shots in seconds.
+    :rtype: tuple
+
+    '''
+    rng = random.Random(seed)
+    ships = dict(ships)
+    board = place_battleships(initialise_board(size, bitboard=True), ships, 'random', rng)
+
+    ai_checked = AttackedSquares(size)
+    hunt = Frontier(size, rng)
+    density_map = create_density_map(difficulty, ships, size, time_budget, rng)
+    shot_pool = create_shot_pool(difficulty, size, rng)
+    opening = create_opening(difficulty, ships, size, rng=rng)
+    targeter = create_targeter(difficulty, ships, size, rng=rng)
+
+    shots = 0
+    move_time = 0.0
+    while not wintest(ships):
+        start = time.perf_counter()
+        if difficulty == 'easy':
+            coords = shot_pool.draw(ai_checked)
+            ai_checked.append(coords)
+            attack(coords, board, ships, events, AI)
+        else:
+            coords, ai_checked = generate_advanced_attack(ai_checked, difficulty, hunt,
+                                                          ships, size, density_map,
+                                                          shot_pool, time_budget, opening,
+                                                          targeter, rng)
+            hunt = advanced_ai_attack(coords, board, ships, hunt, difficulty, density_map,
+                                      targeter, events, rng)
+        move_time += time.perf_counter() - start
+        shots += 1
+    emit(events, GAME_OVER, AI)
+    return shots, move_time
+
+def simulate(games:int, difficulty:str, size:int=10, ships_file:str='battleships.txt',
+             seed:int=0, workers:int=None, time_budget:float=None) -> dict:
+
+    '''Plays a number of games of the AI and summarises the results.
+
+    Game i is played with seed seed + i, so results do not depend on the number of workers.
+
+    :param games: the number of games to play.
+    :type games: int
+    :param difficulty: the difficulty of the AI.
+    :type difficulty: str
+    :param size: the size of the board.
+    :type size: int
+    :param ships_file: the file to read the ships from.
+    :type ships_file: str
+    :param seed: the seed of the first game.
+    :type seed: int
+    :param workers: the number of processes to use. Defaults to the number of cores,
+        and 1 plays every game in this process.
+    :type workers: int
+    :param time_budget: the time allowed for each AI move in seconds, or None for no limit.
+    :type time_budget: float
+
+    :return: the shots-to-win distribution, mean latency per move and games played per second.
+    :rtype: dict
+
+    '''
+    if difficulty not in DIFFICULTIES:
+        raise ValueError(f'unknown difficulty {difficulty}')
+    ships = create_battleships(ships_file)
+    seeds = range(seed, seed + games)
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = [play_game(difficulty, size, ships, game_seed, time_budget)
+                   for game_seed in seeds]
+    else:
+        #only imported when needed, as it is slower to import than the rest of the simulator.
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(play_game, repeat(difficulty), repeat(size),
+                                        repeat(ships), seeds, repeat(time_budget),
+                                        chunksize=max(1, games // (4 * (os.cpu_count() or 1)))))
+    elapsed = time.perf_counter() - start
+
+    shots = [result[0] for result in results]
+    return {'difficulty': difficulty,
+            'size': size,
+            'games': games,
+            'shots': dict(sorted(Counter(shots).items())),
+            'mean_shots': statistics.mean(shots),
+            'median_shots': statistics.median(shots),
+            'min_shots': min(shots),
+            'max_shots': max(shots),
+            'mean_move_ms': 1000 * sum(result[1] for result in results) / sum(shots),
+            'games_per_second': games / elapsed}
+
+def print_report(report:dict) -> None:
+
+    '''Prints a summary of a simulation to the console.
+
+    :param report: the results returned by simulate.
+    :type report: dict
+
+    '''
+    print(f"{report['games']} games, difficulty {report['difficulty']}, "
+          f"{report['size']}x{report['size']} board")
+    print(f"shots to win: mean {report['mean_shots']:.2f}, median {report['median_shots']}, "
+          f"min {report['min_shots']}, max {report['max_shots']}")
+    print(f"mean move latency: {report['mean_move_ms']:.3f} ms")
+    print(f"games per second: {report['games_per_second']:.1f}")
+    print('distribution:')
+    for shots, count in report['shots'].items():
+        print(f'{shots:>5} {count}')
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('difficulty', choices=DIFFICULTIES)
+    parser.add_argument('-n', '--games', type=int, default=100)
+    parser.add_argument('-s', '--size', type=int, default=10)
+    parser.add_argument('-b', '--battleships', default='battleships.txt')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-w', '--workers', type=int, default=None)
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help='the time allowed for each AI move in milliseconds')
+    args = parser.parse_args()
+    setup_logging()
+
+    budget = None if args.budget_ms is None else args.budget_ms / 1000
+    print_report(simulate(args.games, args.difficulty, args.size, args.battleships,
+                          args.seed, args.workers, budget))
@@ -0,0 +1,658 @@
+#Copyright (C) 2023 megiddon
+#This program is licensed under the GNU GPL 3.0 or later.
+#This is contained in full in the file LICENSE.txt
+
+'''Targeting from the results of every shot, for the monte carlo AI and the endgame.
+
+Before each move the monte carlo AI samples many layouts of the player's fleet that agree with every
+shot so far: no ship covers a miss, each ship covers every square it has been hit on,
+and sunk ships stay where they were found. It then attacks the unattacked square that is
+covered in the most layouts.
+
+Every legal placement of each ship is listed once as a bitmask of the board, using the
+same search as the random placement in components, and the lists are narrowed down as
+shots land. A layout is sampled by picking one placement per ship and checking the masks
+do not overlap.
+Layouts that overlap are thrown away, which keeps the samples uniform.
+
+Once only a few layouts are left, the endgame is solved exactly instead: every layout is
+listed, and the AI takes the shot that leaves the fewest shots needed on average to sink
+the rest of the fleet. The very hard and extreme AIs use this too.
+'''
+
+import atexit
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from components import line_placements
+
+#boards larger than this are not sampled, as listing every placement would be too slow.
+MAX_SIZE = 32
+#how many layouts are sampled between checks of the time limit.
+_BATCH = 256
+
+DEFAULT_SETTINGS = {
+    #the layouts sampled for each move, shared between the workers.
+    'samples': 2000,
+    #the longest a move may take, in seconds, when there is no move time budget.
+    'time_limit': 0.25,
+    #the number of processes sampling at once. 1 samples in the game's own process.
+    'workers': 1,
+    #the sampling rate the benchmarks expect on a 10x10 board with the default fleet.
+    'samples_per_second': 50000,
+}
+
+#config.json variable of each setting.
+_CONFIG_KEYS = {
+    'samples': 'monte_carlo_samples',
+    'time_limit': 'monte_carlo_time_limit_ms',
+    'workers': 'monte_carlo_workers',
+    'samples_per_second': 'monte_carlo_samples_per_second',
+}
+
+#the endgame is solved exactly once the ships afloat have at most this many layouts.
+ENDGAME_LAYOUTS = 64
+#the most positions the endgame search may evaluate for one move, which bounds its latency.
+ENDGAME_NODES = 2000
+#the most solved positions each game remembers.
+ENDGAME_MEMO = 20000
+
+_executors:dict = {}
+_executors_lock = threading.Lock()
+
+class SearchExhausted(Exception):
+
+    '''Raised when the endgame search runs out of positions or time.'''
+
+def load_settings(config_data:dict) -> dict:
+
+    '''Reads the Monte Carlo settings from config.json, using the defaults for any that are missing.
+
+    :param config_data: the contents of config.json.
+    :type config_data: dict
+    :return: the settings.
+    :rtype: dict
+    '''
+
+    settings = dict(DEFAULT_SETTINGS)
+    for setting, key in _CONFIG_KEYS.items():
+        if config_data.get(key) is None:
+            continue
+        value = config_data[key]
+        try:
+            if value <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            logging.error('%s variable in config.json invalid!', key)
+            continue
+        if setting == 'time_limit':
+            value = value / 1000
+        elif setting in ['samples', 'workers']:
+            value = int(value)
+        settings[setting] = value
+    return settings
+
+def placement_mask(row:int, col:int, horizontal:bool, length:int, size:int) -> int:
+
+    '''Returns the squares covered by a ship as a bitmask, with bit row * size + col for each square.
+
+    :param row: the row of the ship's first square.
+    :type row: int
+    :param col: the column of the ship's first square.
+    :type col: int
+    :param horizontal: whether the ship lies along a row.
+    :type horizontal: bool
+    :param length: the length of the ship.
+    :type length: int
+    :param size: the size of the board.
+    :type size: int
+    :return: the bitmask.
+    :rtype: int
+    '''
+
+    first = row * size + col
+    if horizontal:
+        return ((1 << length) - 1) << first
+    #the sum of 1 << (k * size) for the first length values of k.
+    return ((1 << (length * size)) - 1) // ((1 << size) - 1) << first
+
+def sample_layouts(placements:list[list[int]], samples:int,
+                   time_limit:float, seed:int) -> tuple[list[list[int]],int]:
+
+    '''Samples fleet layouts, counting how often each placement of each ship is used.
+
+    This runs in the worker processes, so it only takes and returns plain lists.
+
+    :param placements: the bitmask of every legal placement of each ship.
+    :type placements: list
+    :param samples: how many layouts to sample.
+    :type samples: int
+    :param time_limit: the longest to spend sampling, in seconds.
+    :type time_limit: float
+    :param seed: the seed for this batch of samples.
+    :type seed: int
+    :return: the count of each placement of each ship, and the number of layouts sampled.
+    :rtype: tuple
+    '''
+
+    deadline = time.perf_counter() + time_limit
+    rand = random.Random(seed).random
+    counts = [[0] * len(options) for options in placements]
+    ships = list(zip(placements, [len(options) for options in placements], counts))
+    chosen = [0] * len(ships)
+    accepted = 0
+
+    while accepted < samples:
+        for _ in range(_BATCH):
+            occupied = 0
+            for i, (options, number, _) in enumerate(ships):
+                index = int(rand() * number)
+                mask = options[index]
+                if occupied & mask:
+                    break
+                occupied |= mask
+                chosen[i] = index
+            else:
+                for (_, _, ship_counts), index in zip(ships, chosen):
+                    ship_counts[index] += 1
+                accepted += 1
+                if accepted == samples:
+                    break
+        if time.perf_counter() >= deadline:
+            break
+    return counts, accepted
+
+def _executor(workers:int):
+
+    '''Returns the process pool with a number of workers, starting it on first use.'''
+
+    with _executors_lock:
+        if workers not in _executors:
+            #only imported when needed, as it is slow to import.
+            from concurrent.futures import ProcessPoolExecutor
+            _executors[workers] = ProcessPoolExecutor(workers)
+        return _executors[workers]
+
+def shutdown_executors() -> None:
+
+    '''Stops the worker processes of every process pool started for sampling.
+    This is run when the program exits, and the pools are started again if they are needed.'''
+
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(cancel_futures=True)
+
+atexit.register(shutdown_executors)
+
+def _popcount(mask:int) -> int:
+    return bin(mask).count('1')
+
+def enumerate_layouts(masks:list[list[int]], hits:int, limit:int,
+                      deadline:float=None) -> list[tuple[int,...]]:
+
+    '''Lists every layout of the ships afloat in which no two ships overlap.
+
+    :param masks: the bitmask of every placement of each ship afloat.
+    :type masks: list
+    :param hits: the squares that have already been hit.
+    :type hits: int
+    :param limit: the most layouts to list.
+    :type limit: int
+    :param deadline: the time.perf_counter() value to give up by, or None for no limit.
+    :type deadline: float
+    :return: the squares of each ship still to be hit in each layout,
+        or None if there are more than limit layouts or the time ran out.
+    :rtype: list
+    '''
+
+    layouts = []
+    chosen = []
+    #the partial layouts left to try before the time is next checked.
+    until_check = [_BATCH]
+
+    def place(ship:int, occupied:int) -> None:
+        until_check[0] -= 1
+        if until_check[0] <= 0:
+            until_check[0] = _BATCH
+            if deadline is not None and time.perf_counter() > deadline:
+                raise SearchExhausted
+        if ship == len(masks):
+            layouts.append(tuple(mask & ~hits for mask in chosen))
+            if len(layouts) > limit:
+                raise SearchExhausted
+            return
+        for mask in masks[ship]:
+            if not occupied & mask:
+                chosen.append(mask)
+                place(ship + 1, occupied | mask)
+                chosen.pop()
+
+    try:
+        place(0, 0)
+    except SearchExhausted:
+        return None
+    return layouts
+
+def fewest_layouts(masks:list[list[int]]) -> int:
+
+    '''Returns a lower bound on the number of layouts of the ships afloat,
+    so the endgame can be skipped without listing them while there are clearly too many.
+
+    In the player's real layout, the other ships cover every square but those of one ship,
+    and each of those squares rules out at most twice that ship's length of its placements.
+    Moving one ship at a time therefore gives at least the product of what is left of each
+    ship's placements, as long as the placements agree with every shot.
+
+    :param masks: the bitmask of every placement of each ship afloat.
+    :type masks: list
+    :return: the lower bound.
+    :rtype: int
+    '''
+
+    lengths = [_popcount(options[0]) if options else 0 for options in masks]
+    total = sum(lengths)
+    bound = 1
+    for options, length in zip(masks, lengths):
+        bound *= max(1, len(options) - 2 * length * (total - length))
+    return bound
+
+def solve_endgame(layouts:frozenset, budget:list[int], solutions:OrderedDict=None,
+                  deadline:float=None) -> tuple[float,int]:
+
+    '''Finds the shot that minimises the expected number of shots left,
+    assuming every layout is equally likely.
+
+    Positions are remembered by their set of layouts, so a position reached by shooting
+    in a different order, or on a later move, is only solved once. Each game keeps its own
+    positions, so that a seeded game is played the same way whatever was played before it.
+
+    :param layouts: the squares of each ship still to be hit in each layout.
+    :type layouts: frozenset
+    :param budget: a one item list holding the number of positions the search may still evaluate.
+    :type budget: list
+    :param solutions: the positions already solved, which the new ones are added to.
+    :type solutions: OrderedDict
+    :param deadline: the time.perf_counter() value to give up by, or None for no limit.
+    :type deadline: float
+    :raises SearchExhausted: if the budget or the time runs out.
+    :return: the expected number of shots left, and the bit of the square to attack next.
+    :rtype: tuple
+    '''
+
+    budget[0] -= 1
+    if budget[0] < 0 or (deadline is not None and time.perf_counter() > deadline):
+        raise SearchExhausted
+    if solutions is None:
+        solutions = OrderedDict()
+    if layouts in solutions:
+        solutions.move_to_end(layouts)
+        return solutions[layouts]
+
+    #how many layouts each square is hit in, and how many squares are left in each layout.
+    counts = {}
+    left = {}
+    for layout in layouts:
+        left[layout] = 0
+        for mask in layout:
+            while mask:
+                bit = mask & -mask
+                mask ^= bit
+                counts[bit] = counts.get(bit, 0) + 1
+                left[layout] += 1
+    total = sum(left.values())
+
+    if len(layouts) == 1:
+        #the fleet has been found, so every square left is a hit.
+        result = (float(total), min(counts) if counts else None)
+    else:
+        result = (float('inf'), None)
+        #every layout needs at least its own squares to be hit, so a shot that hits in k of
+        #the n layouts leaves at least (total - k) / n shots. The likeliest hits are tried first,
+        #and the search stops once no shot left could beat the best found.
+        for bit, hits in sorted(counts.items(), key=lambda item: -item[1]):
+            bound = 1 + (total - hits) / len(layouts)
+            if bound >= result[0]:
+                break
+
+            #splits the layouts by what the AI would be told: which ship, if any, the shot
+            #would hit and whether that sinks it, counting the squares left in each group.
+            outcomes = {}
+            lower = {}
+            for layout in layouts:
+                for ship, mask in enumerate(layout):
+                    if mask & bit:
+                        outcome = (ship, mask == bit)
+                        outcomes.setdefault(outcome, []).append(
+                            layout[:ship] + (mask ^ bit,) + layout[ship + 1:])
+                        lower[outcome] = lower.get(outcome, 0) + left[layout] - 1
+                        break
+                else:
+                    outcomes.setdefault(None, []).append(layout)
+                    lower[None] = lower.get(None, 0) + left[layout]
+
+            #a square that hits the same ship in every layout has to be attacked at some point,
+            #and tells the AI nothing, so attacking it now is as good as any other shot.
+            if None not in outcomes and len(outcomes) == 1:
+                group = next(iter(outcomes.values()))
+                result = (1 + solve_endgame(frozenset(group), budget, solutions, deadline)[0], bit)
+                break
+
+            for outcome, group in outcomes.items():
+                value = solve_endgame(frozenset(group), budget, solutions, deadline)[0]
+                bound += (len(group) * value - lower[outcome]) / len(layouts)
+                if bound >= result[0]:
+                    break
+            else:
+                result = (bound, bit)
+
+    solutions[layouts] = result
+    while len(solutions) > ENDGAME_MEMO:
+        solutions.popitem(last=False)
+    return result
+
+class ShotTracker:
+
+    '''Keeps track of where each of the player's ships has been hit, and where the AI has missed.
+
+    :param size: the size of the board.
+    :type size: int
+    :param ships: the player's ships at the start of the game.
+    :type ships: dict
+    '''
+
+    def __init__(self, size:int, ships:dict[str,int]) -> None:
+        self.size:int = size
+        self.lengths:dict[str,int] = dict(ships)
+        #bitmasks of the squares that missed, and of the squares each ship was hit on.
+        self.misses:int = 0
+        self.hits:dict[str,int] = {name: 0 for name in ships}
+        #the bitmask of each placement of a ship that agrees with the shots so far.
+        #A ship's placements are listed the first time they are needed, and are then narrowed
+        #down by every shot rather than listed again.
+        self.options:dict[str,list[int]] = {}
+        #how long listing the last ship's placements took, in seconds.
+        self.listing_time:float = 0.0
+
+    def record(self, square:tuple[int,int], name:str) -> None:
+
+        '''Records the result of one of the AI's shots.
+
+        :param square: the square attacked.
+        :type square: tuple
+        :param name: the name of the ship hit, or None for a miss.
+        :type name: str
+        '''
+
+        bit = 1 << (square[0] * self.size + square[1])
+        if name:
+            self.hits[name] = self.hits.get(name, 0) | bit
+        else:
+            self.misses |= bit
+
+        #the ship hit must cover the square, and every other ship must avoid it.
+        for ship, masks in self.options.items():
+            if ship == name:
+                self.options[ship] = [mask for mask in masks if mask & bit]
+            else:
+                self.options[ship] = [mask for mask in masks if not mask & bit]
+
+    def squares(self, mask:int) -> tuple[tuple[int,int],...]:
+
+        '''Returns the squares covered by a placement.
+
+        :param mask: the bitmask of the placement.
+        :type mask: int
+        :return: the squares, in order.
+        :rtype: tuple
+        '''
+
+        squares = []
+        while mask:
+            bit = mask & -mask
+            squares.append(divmod(bit.bit_length() - 1, self.size))
+            mask ^= bit
+        return tuple(squares)
+
+    def placements(self, ships:dict[str,int], deadline:float=None) -> list[list[int]]:
+
+        '''Lists every placement of each ship still afloat that agrees with the shots so far.
+
+        :param ships: the player's ships.
+        :type ships: dict
+        :param deadline: the time.perf_counter() value to give up by, or None for no limit.
+            A ship is only listed if listing the last one would have finished in time,
+            and ships listed before giving up are kept, so later calls carry on from them.
+        :type deadline: float
+        :return: the bitmask of each placement of each ship afloat,
+            with the ships with fewest placements first, or None if the time ran out.
+        :rtype: list
+        '''
+
+        afloat = []
+        for name, length in self.lengths.items():
+            if ships.get(name, 0) == 0:
+                continue
+            if name not in self.options:
+                start = time.perf_counter()
+                if deadline is not None and start + self.listing_time > deadline:
+                    return None
+                self.options[name] = self._list_placements(name, length)
+                self.listing_time = time.perf_counter() - start
+            afloat.append(self.options[name])
+        afloat.sort(key=len)
+        return afloat
+
+    def _list_placements(self, name:str, length:int) -> list[int]:
+
+        '''Lists every placement of a ship that agrees with the shots so far.'''
+
+        size = self.size
+        hit = self.hits.get(name, 0)
+        blocked = self.misses
+        for other, other_hits in self.hits.items():
+            if other != name:
+                blocked |= other_hits
+        rows = [(blocked >> (i * size)) & ((1 << size) - 1) for i in range(size)]
+        cols = [0] * size
+        for i, row in enumerate(rows):
+            while row:
+                j = (row & -row).bit_length() - 1
+                cols[j] |= 1 << i
+                row &= row - 1
+
+        masks = [placement_mask(row, col, horizontal, length, size)
+                 for row, col, horizontal in line_placements(rows, cols, length, size)]
+        return [mask for mask in masks if mask & hit == hit] if hit else masks
+
+class EndgameSolver(ShotTracker):
+
+    '''Chooses the AI's squares exactly once only a few layouts of the player's fleet are left.
+
+    :param size: the size of the board.
+    :type size: int
+    :param ships: the player's ships at the start of the game.
+    :type ships: dict
+    :param max_layouts: the most layouts the endgame is solved for.
+    :type max_layouts: int
+    :param max_nodes: the most positions evaluated for each move.
+    :type max_nodes: int
+    '''
+
+    def __init__(self, size:int, ships:dict[str,int], max_layouts:int=ENDGAME_LAYOUTS,
+                 max_nodes:int=ENDGAME_NODES) -> None:
+        super().__init__(size, ships)
+        self.max_layouts:int = max_layouts
+        self.max_nodes:int = max_nodes
+        #the endgame positions solved so far this game.
+        self.solutions:OrderedDict[frozenset,tuple[float,int]] = OrderedDict()
+
+    def choose(self, ai_checked:list[tuple[int,int]], ships:dict[str,int],
+               deadline:float=None) -> tuple[int,int]:
+
+        '''Chooses the best square if the endgame can be solved.
+
+        :param ai_checked: the squares that the AI has already attacked.
+        :type ai_checked: list or AttackedSquares
+        :param ships: the player's ships.
+        :type ships: dict
+        :param deadline: the time.perf_counter() value to give up by, or None for no limit.
+        :type deadline: float
+        :return: the square chosen, or None if there are too many layouts left to solve
+            or the search ran out of positions or time.
+        :rtype: tuple
+        '''
+
+        masks = self.placements(ships, deadline)
+        if masks is None:
+            return None
+        return self.solve(masks, ai_checked, deadline)
+
+    def solve(self, masks:list[list[int]], ai_checked:list[tuple[int,int]],
+              deadline:float=None) -> tuple[int,int]:
+
+        '''Solves the endgame from the placements of the ships afloat, as listed by placements.'''
+
+        if not masks or fewest_layouts(masks) > self.max_layouts:
+            return None
+        hits = 0
+        for hit in self.hits.values():
+            hits |= hit
+        try:
+            layouts = enumerate_layouts(masks, hits, self.max_layouts, deadline)
+        except SearchExhausted:
+            return None
+        if not layouts:
+            return None
+        try:
+            _, bit = solve_endgame(frozenset(layouts), [self.max_nodes], self.solutions, deadline)
+        except SearchExhausted:
+            return None
+        if bit is None:
+            return None
+        square = divmod(bit.bit_length() - 1, self.size)
+        return None if square in ai_checked else square
+
+class MonteCarloTargeter(EndgameSolver):
+
+    '''Chooses the AI's squares from layouts of the player's fleet sampled before each move,
+    or by solving the endgame once there are few enough layouts.
+
+    :param size: the size of the board.
+    :type size: int
+    :param ships: the player's ships at the start of the game.
+    :type ships: dict
+    :param settings: the sampling settings, as returned by load_settings.
+    :type settings: dict
+    :param rng: the random number generator of the game, which seeds each batch of samples.
+        Defaults to the random module.
+    :type rng: random.Random
+    '''
+
+    def __init__(self, size:int, ships:dict[str,int], settings:dict=None,
+                 rng:random.Random=None) -> None:
+        super().__init__(size, ships)
+        self.settings:dict = dict(settings or DEFAULT_SETTINGS)
+        self.rng:random.Random = rng
+        #the number of layouts sampled for the last move.
+        self.sampled:int = 0
+
+    def choose(self, ai_checked:list[tuple[int,int]], ships:dict[str,int],
+               deadline:float=None) -> tuple[int,int]:
+
+        '''Samples layouts of the player's fleet and chooses the unattacked square covered most often.
+
+        :param ai_checked: the squares that the AI has already attacked.
+        :type ai_checked: list or AttackedSquares
+        :param ships: the player's ships.
+        :type ships: dict
+        :param deadline: the time.perf_counter() value to stop sampling by.
+            Defaults to the time limit in the settings.
+        :type deadline: float
+        :return: the square chosen, or None if no layout could be sampled in time.
+        :rtype: tuple
+        '''
+
+        start = time.perf_counter()
+        limit = start + self.settings['time_limit']
+        deadline = limit if deadline is None else min(deadline, limit)
+        self.sampled = 0
+        masks = self.placements(ships, deadline)
+        if masks is None:
+            return None
+        square = self.solve(masks, ai_checked, deadline)
+        if square:
+            return square
+
+        if not masks or not all(masks):
+            return None
+
+        rng = self.rng or random
+        samples = self.settings['samples']
+        workers = min(self.settings['workers'], samples)
+        if workers > 1:
+            shares = [samples // workers + (k < samples % workers) for k in range(workers)]
+            executor = _executor(workers)
+            futures = [executor.submit(sample_layouts, masks, share,
+                                       max(0.0, deadline - time.perf_counter()),
+                                       rng.getrandbits(64)) for share in shares]
+            results = [future.result() for future in futures]
+        else:
+            results = [sample_layouts(masks, samples, max(0.0, deadline - start),
+                                      rng.getrandbits(64))]
+
+        self.sampled = sum(accepted for _, accepted in results)
+        if not self.sampled:
+            return None
+        frequency = {}
+        for counts, _ in results:
+            for ship_counts, ship_masks in zip(counts, masks):
+                for count, mask in zip(ship_counts, ship_masks):
+                    if count:
+                        for square in self.squares(mask):
+                            frequency[square] = frequency.get(square, 0) + count
+
+        best, choices = 0, []
+        for square, count in frequency.items():
+            if count < best or square in ai_checked:
+                continue
+            if count > best:
+                best, choices = count, []
+            choices.append(square)
+        return rng.choice(choices) if choices else None
+
+def create_targeter(difficulty:str, ships:dict[str,int], size:int,
+                    settings:dict=None, rng:random.Random=None) -> ShotTracker:
+
+    '''Creates the targeter for the difficulties that use one.
+
+    The monte carlo AI chooses every square with its targeter,
+    and the very hard and extreme AIs use one to solve the endgame.
+
+    :param difficulty: the difficulty of the game.
+    :type difficulty: str
+    :param ships: the ships of the player being attacked.
+    :type ships: dict
+    :param size: the size of the board.
+    :type size: int
+    :param settings: the sampling settings, as returned by load_settings.
+    :type settings: dict
+    :param rng: the random number generator of the game. Defaults to the random module.
+    :type rng: random.Random
+    :return: the targeter, or None for other difficulties or boards too large to search.
+    :rtype: ShotTracker
+    '''
+
+    if difficulty not in ['very hard', 'extreme', 'monte carlo']:
+        return None
+    if size > MAX_SIZE:
+        if difficulty == 'monte carlo':
+            logging.warning('board too large for the monte carlo AI, it will play as very hard')
+        return None
+    if difficulty == 'monte carlo':
+        return MonteCarloTargeter(size, ships, settings, rng)
+    return EndgameSolver(size, ships)
@@ -7,6 +7,7 @@ from mp_game_engine import *
 import tests.test_helper_functions as thf
 import pdb
 import os
+import random
 
 testReport = thf.TestReport("test_report.txt")
 
@@ -141,3 +142,675 @@ def test_coord_input_validation():
     assert validate_coords_input("a,1") == False, "validate_coords_input not function not behaving as expected"
 
     assert validate_coords_input("1 , 1") == False, "validate_coords_input not function not behaving as expected"
+
+def test_bitboard_matches_list_board():
+    """Checks that a BitBoard behaves the same as a list of lists when placing and attacking."""
+
+    ships = {"A": 3, "B": 2}
+    board = place_battleships(initialise_board(10), dict(ships), "simple")
+    bitboard = place_battleships(initialise_board(10, bitboard=True), dict(ships), "simple")
+    assert bitboard == board, "BitBoard placement does not match list board placement"
+
+    bit_ships = dict(ships)
+    assert attack((0, 0), bitboard, bit_ships) == True, "attack does not register a hit on a BitBoard"
+    assert attack((0, 0), bitboard, bit_ships) == False, "attack hits the same BitBoard square twice"
+    assert attack((5, 5), bitboard, bit_ships) == False, "attack does not register a miss on a BitBoard"
+    assert bitboard[0][0] is None, "hit square is not cleared on a BitBoard"
+
+    for square in [(0, 1), (0, 2), (1, 0), (1, 1)]:
+        attack(square, bitboard, bit_ships)
+    assert bitboard.is_sunk("A") and bitboard.is_sunk("B"), "BitBoard does not report sunk ships"
+    assert wintest(bitboard) == wintest(bit_ships) == True, "wintest does not accept a BitBoard"
+
+def test_bitboard_overwrite_and_copy():
+    """Checks that a BitBoard keeps track of sunk ships when squares are overwritten or cleared."""
+
+    from components import BitBoard
+
+    board = BitBoard(500)
+    board[499][498] = "A"
+    board[499][499] = "A"
+    board[499][499] = "B"
+    assert board.get((499, 499)) == "B" and board.ships["A"] == board.bit((499, 498)), \
+        "overwritten square still belongs to the old ship"
+
+    copy = board.copy()
+    board[499][499] = None
+    assert board.is_sunk("B") and not copy.is_sunk("B"), "copy shares its shots with the original"
+    assert board.fire((499, 499)) is None, "cleared square is hit again"
+    assert board.fire((499, 498)) == "A" and board.all_sunk(), "BitBoard does not report sunk ships"
+    assert copy[499][499] == "B" and not copy.all_sunk(), "copy shares its ships with the original"
+
+def test_vectorised_scores_match():
+    """Checks that the numpy density scores match the pure python scores."""
+
+    pytest.importorskip("numpy")
+    random.seed(1400)
+    for size in [5, 10, 13]:
+        squares = [(i, j) for i in range(size) for j in range(size)]
+        for _ in range(10):
+            ai_checked = random.sample(squares, random.randint(0, len(squares) // 2))
+            ships = {"A": random.randint(1, 5), "B": random.randint(0, 3)}
+            polarity = random.choice([2, 3])
+            assert score_squares_vectorised(ai_checked, ships, polarity, size).tolist() == \
+                score_squares(ai_checked, ships, polarity, size), "vectorised scores do not match"
+
+def test_score_cache_shares_symmetric_boards():
+    """Checks that cached scores match fresh scores, including for rotated and reflected boards."""
+
+    pytest.importorskip("numpy")
+    random.seed(1400)
+    size = 9
+    ships = {"A": 4, "B": 2}
+    cache = ScoreCache()
+    ai_checked = random.sample([(i, j) for i in range(size) for j in range(size)], 30)
+    for board in [ai_checked,
+                  [(j, i) for i, j in ai_checked],
+                  [(size - 1 - j, i) for i, j in ai_checked],
+                  [(size - 1 - i, size - 1 - j) for i, j in ai_checked]]:
+        assert cache.scores(board, ships, 2, size).tolist() == score_squares(board, ships, 2, size), \
+            "cached scores do not match"
+    assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 3, "symmetric boards were not shared"
+    rotated = [(size - 1 - j, i) for i, j in ai_checked]
+    assert cache.scores(rotated, ships, 2, size).tolist() == score_squares(rotated, ships, 2, size), \
+        "scores of a board seen before in the same orientation do not match"
+    assert cache.stats()["orientations"] == 4 and cache.stats()["hits"] == 4, \
+        "orientations seen before were not looked up directly"
+
+    cache = ScoreCache(max_bytes=1)
+    cache.scores(ai_checked, ships, 2, size)
+    cache.scores([], ships, 2, size)
+    assert len(cache) == 1 and cache.stats()["orientations"] <= 1, \
+        "score cache did not evict the least recently used board"
+
+def test_weighted_sampler():
+    """Checks that the Fenwick tree sampler picks the same item as a scan of the running total."""
+
+    random.seed(1400)
+    weights = [random.choice([0, 0, 1, 5, 12]) for _ in range(37)]
+    sampler = WeightedSampler(weights)
+    for _ in range(20):
+        index = random.randrange(len(weights))
+        weights[index] = random.randint(0, 9)
+        sampler.set(index, weights[index])
+    assert sampler.total == sum(weights), "sampler total is not kept up to date"
+
+    for target in range(sum(weights)):
+        running = 0
+        for expected, weight in enumerate(weights):
+            running += weight
+            if running > target:
+                break
+        assert sampler.find(target) == expected, "sampler does not find the right item"
+    assert WeightedSampler([0, 0]).sample() is None, "sampler chose an item with no weight"
+
+def test_density_map_matches_full_rescore():
+    """Checks that the incremental density map agrees with scoring the board from scratch."""
+
+    random.seed(1400)
+    size = 12
+    ships = {"A": 5, "B": 3}
+    density_map = DensityMap(size, ships, 2)
+    squares = [(i, j) for i in range(size) for j in range(size)]
+    ai_checked = random.sample(squares, 60)
+    for square in ai_checked:
+        density_map.mark(square)
+
+    def check_weights(polarity):
+        scores = score_squares(ai_checked, ships, polarity, size)
+        for i, j in squares:
+            weight = density_map.weight((i, j))
+            if (i, j) in ai_checked or (i + j) % polarity != 1:
+                assert weight == 0, "density map gives weight to a square it should not"
+            else:
+                assert weight - scores[i][j] in [5, 6, 7], "density map weight does not match the score"
+
+    check_weights(2)
+    ships["A"] = 0
+    density_map.update(ships, 3)
+    check_weights(3)
+
+    assert density_map.choose() not in ai_checked, "density map chooses a checked square"
+
+def test_move_time_budget():
+    """Checks that the AI still chooses an unchecked square when its time budget runs out."""
+
+    import time
+
+    random.seed(1400)
+    size = 12
+    ships = {"A": 5, "B": 3}
+    ai_checked = AttackedSquares(size, random.sample([(i, j) for i in range(size) for j in range(size)], 60))
+
+    assert choose_advanced_square(ai_checked, ships, 2, size, time.perf_counter() - 1) is None, \
+        "anytime search did not stop at its deadline"
+    square = choose_advanced_square(ai_checked, ships, 2, size, time.perf_counter() + 10)
+    assert square not in ai_checked and sum(square) % 2 == 1, "anytime search chose an invalid square"
+
+    #with no time at all, the AI falls back to a parity square.
+    square, ai_checked = generate_advanced_attack(ai_checked, "extreme", [], ships, size,
+                                                  shot_pool=create_shot_pool("extreme", size),
+                                                  time_budget=0)
+    assert ai_checked[-1] == square and sum(square) % 2 == 1, "fallback did not pick a parity square"
+
+    #a lazy density map rescores the board after a sink once it has time to.
+    density_map = create_density_map("very hard", ships, size, time_budget=0)
+    density_map.update({"A": 0, "B": 3})
+    assert density_map.stale, "lazy density map rescored the board straight away"
+    density_map.choose()
+    assert not density_map.stale and density_map.cap == 2
+
+def test_opening_book(tmp_path):
+    """Checks that the AI plays its opening from the book until its first hit."""
+
+    import opening_book
+    from opening_book import generate_book, create_opening, OpeningLine
+
+    random.seed(1400)
+    size = 8
+    ships = {"A": 3, "B": 2}
+    generate_book(size, ships, 2, moves=6, variations=4, directory=str(tmp_path))
+    opening = create_opening("very hard", ships, size, directory=str(tmp_path))
+    assert opening is not None, "opening book was not found"
+    assert create_opening("very hard", {"A": 4}, size, directory=str(tmp_path)) is None
+
+    ai_checked = AttackedSquares(size)
+    density_map = create_density_map("very hard", ships, size)
+    for move in range(3):
+        square, ai_checked = generate_advanced_attack(ai_checked, "very hard", [], ships, size,
+                                                      density_map, opening=opening)
+        assert square == opening.book.square(opening.variation, move), "AI did not follow the book"
+        assert square in density_map.checked, "book move was not marked on the density map"
+
+    #a hit ends the book line.
+    ships["A"] -= 1
+    assert opening.next(ai_checked, ships) is None, "book line continued after a hit"
+
+    #a line whose squares were attacked out of order, such as by the endgame solver, is dropped.
+    ships["A"] += 1
+    line = OpeningLine(opening_book.load_book(size, ships, 2, str(tmp_path)), 0, ships)
+    ai_checked = AttackedSquares(size, [line.book.square(0, 1)])
+    square, ai_checked = generate_advanced_attack(ai_checked, "very hard", Frontier(size), ships,
+                                                  size, create_density_map("very hard", ships, size),
+                                                  opening=line)
+    assert len(ai_checked) == 2 and line.book is None, "book line was followed after a different move"
+    assert line.next(ai_checked, ships) is None
+
+def test_monte_carlo_targeting():
+    """Checks that the monte carlo AI only samples layouts that agree with its shots."""
+
+    import targeting
+    from targeting import create_targeter, load_settings
+
+    random.seed(1400)
+    size = 6
+    ships = {"A": 3, "B": 2}
+    board = initialise_board(size)
+    board[2][1:4] = ["A", "A", "A"]
+    board[5][4:6] = ["B", "B"]
+    targeter = create_targeter("monte carlo", ships, size, load_settings({"monte_carlo_samples": 500}))
+    assert create_targeter("hard", ships, size) is None
+
+    #once "A" has been hit on (2, 2) and missed above and below, it must lie along the row.
+    for square in [(2, 2), (1, 2), (3, 2)]:
+        advanced_ai_attack(square, board, ships, Frontier(size), "monte carlo", targeter=targeter)
+    squares = [[targeter.squares(mask) for mask in masks] for masks in targeter.placements(ships)]
+    assert sorted(squares[0]) == [((2, 0), (2, 1), (2, 2)), ((2, 1), (2, 2), (2, 3)),
+                                  ((2, 2), (2, 3), (2, 4))], "placements do not agree with the hits"
+    assert not any({(1, 2), (2, 2), (3, 2)} & set(covered) for covered in squares[1]), \
+        "placements cover squares already attacked"
+
+    ai_checked = AttackedSquares(size, [(2, 2), (1, 2), (3, 2)])
+    square, ai_checked = generate_advanced_attack(ai_checked, "monte carlo", [], ships, size,
+                                                  targeter=targeter)
+    assert square in [(2, 1), (2, 3)] and targeter.sampled == 500, "AI did not attack next to its hit"
+
+    #sampling in worker processes gives a square too, and the workers are stopped afterwards.
+    pooled = create_targeter("monte carlo", ships, size,
+                             load_settings({"monte_carlo_samples": 200, "monte_carlo_workers": 2}))
+    for square in [(2, 2), (1, 2), (3, 2)]:
+        pooled.record(square, "A" if square == (2, 2) else None)
+    assert pooled.choose(ai_checked, ships) not in ai_checked and pooled.sampled == 200
+    pool = targeting._executors[2]
+    targeting.shutdown_executors()
+    assert not targeting._executors, "process pool was not forgotten"
+    with pytest.raises(RuntimeError):
+        pool.submit(int)
+
+def test_endgame_solver():
+    """Checks that the endgame is solved exactly once few layouts are left, and gives up past its cap."""
+
+    from targeting import create_targeter, EndgameSolver, solve_endgame, enumerate_layouts, fewest_layouts
+
+    size = 5
+    ships = {"A": 2, "B": 1}
+    solver = create_targeter("extreme", ships, size)
+    assert isinstance(solver, EndgameSolver) and create_targeter("hard", ships, size) is None
+
+    #"B" is sunk, and "A" has been hit on (2, 2) with misses on three sides, so only (2, 3) is left.
+    for square, name in [((0, 0), "B"), ((2, 2), "A"), ((1, 2), None), ((3, 2), None), ((2, 1), None)]:
+        solver.record(square, name)
+    ships = {"A": 1, "B": 0}
+    ai_checked = AttackedSquares(size, [(0, 0), (2, 2), (1, 2), (3, 2), (2, 1)])
+    square, ai_checked = generate_advanced_attack(ai_checked, "extreme", [], ships, size, targeter=solver)
+    assert square == (2, 3), "endgame solver did not find the last square"
+
+    #with two squares left that are equally likely, one shot is needed half the time and two otherwise.
+    layouts = frozenset([(0b01,), (0b10,)])
+    assert solve_endgame(layouts, [100])[0] == 1.5, "endgame solver expected value is wrong"
+
+    #being told a ship has sunk splits these layouts further. Without it, the bits 8 and 32
+    #would look best at 4.4 shots, but knowing when a ship sinks makes bit 4 best at 4.2.
+    layouts = frozenset([(0b100000, 0b100), (0b100000, 0b11000), (0b110, 0b101000),
+                         (0b110010, 0b1101), (0b111, 0b11000)])
+    value, bit = solve_endgame(layouts, [10 ** 6])
+    assert bit == 0b100 and abs(value - 4.2) < 1e-9, "endgame solver ignores sunk ships"
+    assert EndgameSolver(size, {"A": 2}, max_nodes=0).choose([], {"A": 2}) is None, \
+        "endgame solver did not stop at its cap"
+
+    #placements are narrowed down as shots land, and agree with listing them again.
+    ships = {"A": 3, "B": 2, "C": 2}
+    solver = EndgameSolver(8, ships)
+    solver.placements(ships)
+    for square, name in [((3, 3), "A"), ((3, 4), None), ((0, 0), "B"), ((6, 6), None)]:
+        solver.record(square, name)
+    fresh = EndgameSolver(8, ships)
+    fresh.hits, fresh.misses = solver.hits, solver.misses
+    assert solver.placements(ships) == fresh.placements(ships), "placements were not kept up to date"
+
+    #the skip only happens with more layouts than the cap, and a deadline stops the listing.
+    masks = solver.placements(ships)
+    assert fewest_layouts(masks) <= len(enumerate_layouts(masks, 0, 10 ** 6)), \
+        "fewest_layouts is not a lower bound"
+    assert enumerate_layouts(masks, 0, 10 ** 6, deadline=0) is None, "listing layouts ignores the deadline"
+    assert EndgameSolver(32, ships).choose([], ships, deadline=0) is None, \
+        "endgame solver ignores the deadline"
+
+def test_frontier_replaces_empty_hunt_list():
+    """Checks that advanced_ai_attack still accepts the empty hunt list older callers pass."""
+
+    board = initialise_board(8)
+    board[0][0] = "Destroyer"
+    ships = {"Destroyer": 2}
+    hunt = advanced_ai_attack((0, 0), board, ships, [], "hard")
+    assert isinstance(hunt, Frontier) and len(hunt), "the hit was not added to a new frontier"
+    assert hunt.next() in [(0, 1), (1, 0)], "the frontier does not target the damaged ship"
+
+    rng = random.Random(2)
+    board[0][0] = "Destroyer"
+    assert advanced_ai_attack((0, 0), board, {"Destroyer": 2}, [], "hard", rng=rng).rng is rng, \
+        "the new frontier does not use the game's generator"
+
+def test_frontier_targets_damaged_ships():
+    """Checks that the frontier orders and prunes the squares next to each damaged ship, and pickles compactly."""
+
+    import pickle
+
+    random.seed(1400)
+    size = 6
+    ships = {"A": 3, "B": 2}
+    board = initialise_board(size)
+    board[2][1:4] = ["A", "A", "A"]
+    board[4][4] = board[5][4] = "B"
+
+    frontier = Frontier(size)
+    for square in [(2, 2), (1, 2), (2, 3), (4, 4)]:
+        frontier = advanced_ai_attack(square, board, ships, frontier, "hard")
+    assert len(frontier) == 2, "frontier is not sinking both damaged ships"
+    #"A" is known to lie along its row, and is targeted first as it was hit first.
+    assert frontier.next() in [(2, 1), (2, 4)], "frontier did not extend the line of hits"
+
+    restored = pickle.loads(pickle.dumps(frontier))
+    assert restored.next() == frontier.next() and len(restored) == 2, "frontier does not survive pickling"
+    assert len(pickle.dumps(frontier)) < 400, "frontier does not pickle compactly"
+
+    frontier = advanced_ai_attack((2, 1), board, ships, frontier, "hard")
+    assert len(frontier) == 1 and frontier.next() in [(3, 4), (5, 4), (4, 3), (4, 5)], \
+        "frontier did not move on to the next ship once one was sunk"
+    square, _ = generate_advanced_attack(AttackedSquares(size, [(2, 2), (1, 2), (2, 3), (4, 4), (2, 1)]),
+                                         "hard", frontier, ships, size)
+    assert square == frontier.next(), "AI did not attack the front of the frontier"
+
+def test_attacked_squares_index():
+    """Checks that AttackedSquares keeps the order of a list and survives pickling."""
+
+    import pickle
+
+    squares = [(0, 0), (9, 9), (3, 7), (7, 3)]
+    ai_checked = AttackedSquares(10, squares)
+    assert ai_checked == squares, "AttackedSquares does not keep the order of the squares"
+    assert ai_checked[-1] == (7, 3), "AttackedSquares does not return the last square attacked"
+    assert (3, 7) in ai_checked and (3, 3) not in ai_checked, "AttackedSquares membership is incorrect"
+    assert (-1, 0) not in ai_checked and (10, 0) not in ai_checked, "AttackedSquares accepts squares off the board"
+
+    restored = pickle.loads(pickle.dumps(ai_checked))
+    assert restored == squares and (9, 9) in restored, "AttackedSquares does not survive pickling"
+    assert score_squares(ai_checked, {"A": 4}, 2, 10) == score_squares(squares, {"A": 4}, 2, 10), \
+        "score_squares gives different scores for AttackedSquares and lists"
+
+def test_shot_pool_falls_back_to_other_parity():
+    """Checks that the shot pool draws every square once and does not stall when a parity class runs out."""
+
+    size = 6
+    ai_checked = AttackedSquares(size)
+    shot_pool = ShotPool(size, 2)
+    for _ in range(size * size):
+        square = choose_square(ai_checked, 2, size, shot_pool)
+        assert square is not None and square not in ai_checked, "shot pool returned an attacked square"
+        if len(ai_checked) < size * size // 2:
+            assert sum(square) % 2 == 1, "shot pool did not use the requested parity first"
+        ai_checked.append(square)
+    assert shot_pool.draw(ai_checked) is None, "shot pool did not run out of squares"
+
+def test_custom_placement_from_data():
+    """Checks that custom placement data can be passed in directly instead of through placement.json."""
+
+    ships = create_battleships()
+    data = get_json_data("placement.json")
+    assert place_custom_battleships(initialise_board(), dict(ships), data) == \
+        place_battleships(initialise_board(), dict(ships), "custom"), \
+        "placement data gives a different board to placement.json"
+
+    #Invalid data falls back to random placement.
+    board = place_custom_battleships(initialise_board(), dict(ships), {"Cruiser": ["9", "9", "h"]})
+    for name, length in ships.items():
+        assert sum(row.count(name) for row in board) == length, "invalid placement data is not handled"
+
+    #the fallback draws from the game's generator, so a seeded game can be replayed.
+    boards = [place_custom_battleships(initialise_board(), dict(ships), {}, random.Random(4))
+              for _ in range(2)]
+    random.random()
+    assert boards[0] == place_custom_battleships(initialise_board(), dict(ships), None,
+                                                 random.Random(4)), \
+        "random fallback does not use the generator"
+    assert boards[0] == boards[1]
+
+def test_file_cache_reloads_changed_files(tmp_path):
+    """Checks that cached config files are re-read when they change and are safe to modify."""
+
+    filename = tmp_path / "ships.txt"
+    filename.write_text("A:2\nB:3\n")
+    ships = create_battleships(str(filename))
+    assert ships == {"A": 2, "B": 3}
+    ships["A"] = 5
+    assert create_battleships(str(filename)) == {"A": 2, "B": 3}, "cached ships were changed by the caller"
+
+    filename.write_text("A:2\nB:3\nC:4\n")
+    assert create_battleships(str(filename)) == {"A": 2, "B": 3, "C": 4}, "changed file was not re-read"
+    assert create_battleships(str(tmp_path / "missing.txt")) == get_default_ships()
+
+def test_logging_goes_through_queue(tmp_path):
+    """Checks that log records reach the log file through the queue listener."""
+
+    import logging
+    import logging_setup
+
+    filename = tmp_path / "game.log"
+    #logging may already have been set up by importing main.
+    logging_setup.stop_logging()
+    logging_setup.setup_logging(str(filename), debug=True, console=False)
+    try:
+        logging.debug("debug message")
+        logging.info("info message")
+    finally:
+        logging_setup.stop_logging()
+    text = filename.read_text()
+    assert "debug message" in text and "info message" in text, "log records were not written"
+    logging.getLogger().setLevel(logging.WARNING)
+
+def test_main_sets_up_logging():
+    """Checks that importing the web-based game sets up logging, as a WSGI server does."""
+
+    import logging
+    from logging.handlers import QueueHandler
+    import main
+
+    assert main.app is not None
+    assert any(isinstance(handler, QueueHandler) for handler in logging.getLogger().handlers), \
+        "importing main does not set up logging"
+
+def test_random_placement_bounded():
+    """Checks that random placement fills crowded boards and reports fleets that cannot fit."""
+
+    ships = {"A": 3, "B": 3, "C": 3, "D": 3}
+    board = place_battleships(initialise_board(4), ships, "random")
+    for name, length in ships.items():
+        assert sum(row.count(name) for row in board) == length, "random placement did not place every ship"
+
+    with pytest.raises(ValueError):
+        place_randomly(initialise_board(4), {"A": 3, "B": 3, "C": 3, "D": 3, "E": 3, "F": 3})
+
+def test_packed_placement():
+    """Checks that packed placement finds layouts for full boards and rejects impossible ones."""
+
+    ships = {str(i): 3 for i in range(33)}
+    board = place_battleships(initialise_board(10), ships, "packed")
+    for name, length in ships.items():
+        assert sum(row.count(name) for row in board) == length, "packed placement did not place every ship"
+
+    #25 ships of length 4 cannot tile a 10x10 board.
+    with pytest.raises(ValueError):
+        place_packed(initialise_board(10), {str(i): 4 for i in range(25)}, time_budget=5)
+
+def test_simulation_is_reproducible():
+    """Checks that the self-play simulator gives the same results for the same seed."""
+
+    from simulation import simulate
+
+    report = simulate(4, "extreme", 8, seed=10, workers=1)
+    assert report["games"] == 4 and sum(report["shots"].values()) == 4, "simulate did not play every game"
+    assert 17 <= report["min_shots"] <= report["max_shots"] <= 64, "simulate reports impossible shot counts"
+    assert simulate(4, "extreme", 8, seed=10, workers=2)["shots"] == report["shots"], \
+        "simulate results depend on the number of workers"
+
+def test_seeded_games_are_independent():
+    """Checks that a game played from a seed does not depend on the random module or on other games."""
+
+    from simulation import play_game
+
+    ships = create_battleships()
+    expected = play_game("extreme", 10, ships, 7)[0]
+    random.seed(0)
+    random.random()
+    assert play_game("extreme", 10, ships, 7)[0] == expected, "seeded game uses the random module"
+
+    #two games with the same seed make the same moves, even when their moves are interleaved.
+    games = [(DensityMap(10, ships, rng=random.Random(3)), ShotPool(10, rng=random.Random(3)))
+             for _ in range(2)]
+    for _ in range(20):
+        moves = []
+        for density_map, shot_pool in games:
+            moves.append((density_map.choose(), shot_pool.draw([], 1)))
+            random.random()
+            density_map.mark(moves[-1][0])
+        assert moves[0] == moves[1], "games with the same seed share a generator"
+
+    rng, seed = create_rng(5)
+    assert seed == 5 and rng.random() == random.Random(5).random(), "create_rng does not use the seed"
+    assert create_rng("five")[1] != "five", "create_rng accepts an invalid seed"
+
+def test_engine_events(capsys):
+    """Checks that the engines send their events to the sinks they are given and print nothing themselves."""
+
+    from events import EventBus, BufferedSink, PrintSink, AI, SHOT, HIT, MISS, SUNK, GAME_OVER
+    from simulation import play_game
+
+    ships = create_battleships()
+    collector = BufferedSink()
+    shots, _ = play_game("extreme", 10, ships, 3, events=EventBus(collector))
+    assert capsys.readouterr().out == "", "the engine prints during a headless game"
+    events = collector.drain()
+    kinds = [event.kind for event in events]
+    assert kinds.count(SHOT) == shots and kinds.count(HIT) + kinds.count(MISS) == shots, \
+        "a shot is not followed by a hit or a miss"
+    assert kinds.count(HIT) == sum(ships.values()), "not every hit was sent"
+    assert sorted(event.ship for event in events if event.kind == SUNK) == sorted(ships), \
+        "not every sunk ship was sent"
+    assert events[-1].kind == GAME_OVER and events[-1].player == AI, "game over was not sent"
+    assert len(collector) == 0, "drain does not empty the collector"
+
+    board = initialise_board()
+    board[0][0] = "Destroyer"
+    bus = EventBus(PrintSink())
+    attack((0, 0), board, {"Destroyer": 1}, bus, AI)
+    bus.unsubscribe(bus.sinks[0])
+    attack((0, 1), board, {"Destroyer": 0}, bus)
+    assert capsys.readouterr().out == "AI hit battleship at (0,0)!\nDestroyer sunk!\n", \
+        "the print sink does not print the shots it is sent"
+
+def test_benchmark_regression_check():
+    """Checks that the benchmark suite flags hot paths that have slowed down past the threshold."""
+
+    from benchmarks.bench_engine import compare, calibrate, relative
+
+    baseline = {"attack": 1.0, "wintest": 2.0}
+    results = {"attack": 3.0, "wintest": 2.5, "new_benchmark": 1.0}
+    assert compare(results, baseline, 1.5) == [("attack", 3.0)], "compare does not flag regressions correctly"
+
+    calibration = calibrate()
+    assert calibration > 0, "calibration loop was not timed"
+    assert relative({"attack": 2 * calibration}, calibration) == {"attack": 2.0}, \
+        "times are not converted into calibration loops"
+
+def test_cli_startup_skips_unused_imports():
+    """Checks that the command line engine does not import dependencies it has not used yet."""
+
+    from benchmarks.bench_startup import import_times, UNWANTED
+
+    times = import_times("mp_game_engine")
+    assert "mp_game_engine" in times, "import time was not reported"
+    assert [name for name in UNWANTED if name in times] == [], "mp_game_engine imports unused dependencies"
+
+def test_game_store_eviction():
+    """Checks that the in-memory game store removes idle games and keeps to its size cap."""
+
+    pytest.importorskip("flask")
+    from session_store import GameStore
+
+    now = [0.0]
+    store = GameStore(max_games=2, ttl=10, clock=lambda: now[0])
+    store.put("a", {"size": 10})
+    store.put("b", {"size": 10})
+    assert store.get("a") == {"size": 10}, "game store does not return a stored game"
+
+    #"b" is now the least recently used game, so it is evicted first.
+    store.put("c", {"size": 10})
+    assert store.get("b") is None and len(store) == 2, "game store does not keep to its size cap"
+
+    now[0] = 5.0
+    store.get("c")
+    now[0] = 12.0
+    assert store.reap() == 1, "game store does not remove idle games"
+    assert store.get("a") is None and store.get("c") is not None, "game store removed the wrong game"
+    store.stop()
+
+def test_session_requests_one_at_a_time():
+    """Checks that a second request for a session waits until the first has saved it."""
+
+    pytest.importorskip("flask")
+    import threading
+    from types import SimpleNamespace
+    from flask import Flask, Response
+    from session_store import GameStore, MemorySessionInterface
+
+    app = Flask("test")
+    store = GameStore()
+    store.put("game", {"size": 10})
+    interface = MemorySessionInterface(store)
+    request = SimpleNamespace(cookies={app.config["SESSION_COOKIE_NAME"]: "game"})
+
+    first = interface.open_session(app, request)
+    opened = []
+    second = threading.Thread(target=lambda: opened.append(interface.open_session(app, request)))
+    second.start()
+    second.join(0.2)
+    assert second.is_alive() and opened == [], "second request did not wait for the first"
+
+    first["size"] = 20
+    interface.save_session(app, first, Response())
+    second.join(5)
+    assert opened and opened[0]["size"] == 20, "second request did not see the first one's changes"
+    opened[0].release()
+    assert store.lock("game").acquire(blocking=False), "session was left locked"
+    store.stop()
+
+def test_web_game_keeps_state_in_memory():
+    """Plays the start of a web game to check that the game is kept between requests."""
+
+    pytest.importorskip("flask")
+    import main
+
+    client = main.app.test_client()
+    assert client.get("/placement").status_code == 200
+    placement = get_json_data("placement.json")
+    client.post("/placement", json=placement)
+    cookie = client.get_cookie("session")
+    assert cookie is not None and len(cookie.value) < 64, "session cookie does not only carry an id"
+
+    response = client.get("/attack?x=0&y=0").get_json()
+    assert "AI_Turn" in response, "attack response is missing the AI's turn"
+    assert client.get("/attack?x=0&y=0").get_json()["AI_Turn"] == response["AI_Turn"], \
+        "repeated click does not return the AI's last turn"
+    assert len(main.game_store) >= 1, "game is not kept in the game store"
+
+def test_metrics_histogram_and_endpoint():
+    """Checks the latency histograms and that the web app exports them at /metrics."""
+
+    from metrics import Histogram
+
+    histogram = Histogram((0.1, 1.0))
+    for value in [0.05, 0.5, 0.5, 5.0]:
+        histogram.observe(value)
+    assert histogram.cumulative() == [("0.1", 1), ("1.0", 3), ("+Inf", 4)], "histogram buckets are wrong"
+    assert histogram.count == 4 and histogram.sum == 6.05
+
+    pytest.importorskip("flask")
+    import main
+
+    client = main.app.test_client()
+    client.get("/placement")
+    client.post("/placement", json=get_json_data("placement.json"))
+    client.get("/attack?x=0&y=0")
+    text = client.get("/metrics").get_data(as_text=True)
+    for sample in ['battleships_request_seconds_count{difficulty=',
+                   'battleships_function_seconds_count{function="attack"}',
+                   'battleships_function_seconds_count{function="generate_advanced_attack"}',
+                   'battleships_function_seconds_count{function="session_load"}',
+                   'battleships_function_seconds_count{function="session_save"}',
+                   'battleships_moves_total{difficulty=',
+                   'battleships_active_games ',
+                   'battleships_stored_sessions ']:
+        assert sample in text, f"{sample} is missing from /metrics"
+    import game_engine
+    assert not hasattr(game_engine.attack, "metrics_timed"), "timing main's calls changed the engine"
+
+    #only games with placed ships that are not over count as active.
+    active = main.game_store.count(main.game_in_progress)
+    client = main.app.test_client()
+    client.get("/placement")
+    assert main.game_store.count(main.game_in_progress) == active, "an unplaced game counts as active"
+    client.post("/placement", json=get_json_data("placement.json"))
+    assert main.game_store.count(main.game_in_progress) == active + 1, "a placed game is not active"
+
+def test_profiler_samples_and_logs_slow_calls(tmp_path, caplog):
+    """Checks that sampled calls are profiled without nesting and slow calls are logged with their inputs."""
+
+    import os
+    import pstats
+    import time
+    from profiling import Profiler
+
+    profiler = Profiler(str(tmp_path), sample_rate=1.0, slow_ms=5)
+    inner = profiler.wrap(lambda ai_checked, size: time.sleep(0.01), "inner")
+    outer = profiler.wrap(lambda size: inner([(0, 0)], size), "outer")
+    outer(10)
+    outer(10)
+    profiler.flush()
+
+    dumps = sorted(path.name for path in tmp_path.iterdir())
+    assert dumps == [f"outer.{os.getpid()}.prof"], "sampled calls were not written to one file per function"
+    sleeps = [stat[1] for key, stat in pstats.Stats(str(tmp_path / dumps[0])).stats.items()
+              if "sleep" in key[2]]
+    assert sleeps == [2], "profiles of sampled calls were not added together"
+    assert "slow call to inner" in caplog.text and "ai_checked=<list of 1>, size=10" in caplog.text, \
+        "slow call was not logged with its inputs"